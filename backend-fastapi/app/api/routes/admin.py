@@ -4,12 +4,25 @@ from sqlalchemy import select, func, and_, desc
 from typing import List, Dict, Any
 from datetime import datetime, timedelta
 import json
+import logging
 
-from app.core.database import get_db, User, Plan, Session, AiMessage, UsageTracking, ApiKey, UserRole, PlanType
-from app.auth.dependencies import get_current_admin_user, get_current_superadmin_user
+from app.core.database import get_db, User, Plan, Session, AiMessage, UsageTracking, UsageMonthly, ApiKey, UserRole, PlanType
+from app.auth.dependencies import (
+    get_current_admin_user, get_current_superadmin_user, invalidate_user_cache,
+    verify_flight, user_flight, user_cache
+)
 from app.models.responses import UserResponse, PlanResponse, ApiResponse
 from app.models.requests import PlanCreateRequest, PlanUpdateRequest, UserRoleUpdateRequest, ApiKeyUpdateRequest
 from app.services.encryption_service import encryption_service
+from app.auth.neon_auth import neon_auth_service
+from app.services.response_cache import response_cache
+from app.services.ai_service import ai_service
+from app.services.context_service import context_service
+from app.services.image_service import image_service
+from app.services.job_service import job_service
+from app.services.usage_service import usage_service
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -68,6 +81,7 @@ async def update_user_role(
         # Update role
         user.role = role_enum
         await db.commit()
+        invalidate_user_cache(user.neon_user_id)
         
         return ApiResponse(
             success=True,
@@ -101,6 +115,10 @@ async def delete_user(
         user.is_active = False
         await db.commit()
         
+        # Revoke cached sessions so the deactivation applies immediately
+        neon_auth_service.invalidate_user(user.neon_user_id)
+        invalidate_user_cache(user.neon_user_id)
+        
         return ApiResponse(
             success=True,
             message="User deleted successfully"
@@ -148,6 +166,7 @@ async def create_plan(
         db.add(plan)
         await db.commit()
         await db.refresh(plan)
+        usage_service.invalidate_plan_limits()
         
         return PlanResponse.model_validate(plan)
         
@@ -193,6 +212,7 @@ async def update_plan(
         
         await db.commit()
         await db.refresh(plan)
+        usage_service.invalidate_plan_limits()
         
         return PlanResponse.model_validate(plan)
         
@@ -223,6 +243,7 @@ async def update_api_key(
         if key_record:
             # Update existing key
             key_record.encrypted_key = encrypted_key
+            key_record.version = (key_record.version or 0) + 1
             key_record.is_active = True
         else:
             # Create new key
@@ -236,6 +257,12 @@ async def update_api_key(
         
         await db.commit()
         
+        # Apply here immediately; other workers pick it up on their next version check
+        try:
+            await ai_service.refresh_credentials()
+        except Exception as e:
+            logger.error(f"Error reloading AI credentials: {str(e)}")
+        
         return ApiResponse(
             success=True,
             message=f"API key updated for {request.provider}"
@@ -261,6 +288,7 @@ async def get_api_keys(
         for key in keys:
             providers_status[key.provider] = {
                 "has_key": True,
+                "version": key.version,
                 "created_at": key.created_at.isoformat(),
                 "last_updated": key.updated_at.isoformat() if key.updated_at else None
             }
@@ -307,13 +335,14 @@ async def get_system_stats(
         )
         active_users_count = active_users.scalar()
         
-        # Total AI messages this month
+        # Total AI messages (tracked asks) this month, from the monthly rollup
         monthly_messages = await db.execute(
-            select(func.count(AiMessage.id))
+            select(func.coalesce(func.sum(UsageMonthly.count), 0))
             .where(
                 and_(
-                    func.extract('month', AiMessage.created_at) == current_month,
-                    func.extract('year', AiMessage.created_at) == current_year
+                    UsageMonthly.action_type == "ask",
+                    UsageMonthly.month == current_month,
+                    UsageMonthly.year == current_year
                 )
             )
         )
@@ -339,4 +368,38 @@ async def get_system_stats(
         )
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching statistics: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error fetching statistics: {str(e)}")
+
+@router.get("/metrics", response_model=ApiResponse)
+async def get_metrics(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Get in-process cache counters (admin only)"""
+    return ApiResponse(
+        success=True,
+        message="Metrics",
+        data={
+            "auth_token_cache": neon_auth_service.token_cache.stats(),
+            "auth_verify_singleflight": verify_flight.stats(),
+            "auth_user_singleflight": user_flight.stats(),
+            "user_cache": user_cache.stats(),
+            "ai_response_cache": response_cache.stats() if response_cache else None,
+            "ai_routing": ai_service.routing_stats(),
+            "ai_context_cache": context_service.stats(),
+            "image_preprocessing": image_service.stats(),
+            "ask_jobs": job_service.stats(),
+            "quota_counters": usage_service.counters.stats(),
+            "usage_writer": usage_service.writer.stats()
+        }
+    )
+
+@router.get("/ai-providers", response_model=ApiResponse)
+async def get_ai_provider_health(
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Get circuit breaker and concurrency limit state per AI provider (admin only)"""
+    return ApiResponse(
+        success=True,
+        message="AI provider health",
+        data=ai_service.provider_health()
+    )
\ No newline at end of file
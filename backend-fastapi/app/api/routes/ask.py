@@ -1,84 +1,312 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse, Response
+from starlette.background import BackgroundTask
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_
 from datetime import datetime, timedelta
-from typing import List
-import uuid
+from typing import List, Dict, Any, Optional, Awaitable
+import anyio
+import asyncio
+import json
+import logging
+import time
+import weakref
 
-from app.core.database import get_db, User, Session, AiMessage, UsageTracking, SessionType
+from app.core.database import get_db, async_session_factory, User, Session, AiMessage, UsageTracking, SessionType
+from app.core.config import settings
+from app.core.exceptions import ExternalServiceError, DeadlineExceededError, ClientDisconnectedError
 from app.auth.dependencies import get_current_user
 from app.services.ai_service import ai_service
-from app.models.responses import AskResponse, AiMessageResponse, ApiResponse
-from app.models.requests import AskRequest
-from app.services.usage_service import usage_service
+from app.models.responses import (
+    AskResponse, AskBatchResponse, AskBatchItemResult, AskJobResponse, AiMessageResponse, ApiResponse
+)
+from app.models.requests import AskRequest, AskBatchRequest, AskJobRequest
+from app.services.usage_service import usage_service, QuotaReservation
+from app.services.context_service import context_service
+from app.services.blob_store import blob_store, decode_capture, sniff_content_type
+from app.services.image_service import image_service
+from app.services.job_service import job_service, validate_callback_url
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Session types whose clients re-send near-identical screenshots every few seconds
+DEDUPE_SESSION_TYPES = {SessionType.LISTEN, SessionType.MEETING}
+
+# Per-user cap on concurrently running batch items, shared by all of a user's batches
+_batch_semaphores: "weakref.WeakValueDictionary[str, asyncio.Semaphore]" = weakref.WeakValueDictionary()
+
+async def _check_ask_limit(current_user: User, db: AsyncSession, quantity: int = 1):
+    """Raise 429 if the user cannot make `quantity` more asks this month"""
+    can_ask, limit_info = await usage_service.can_user_ask(current_user, db, quantity)
+    
+    if not can_ask:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Monthly ask limit exceeded. Used: {limit_info['used']}, Limit: {limit_info['limit']}"
+        )
+
+async def _reserve_asks(current_user: User, db: AsyncSession, quantity: int = 1) -> QuotaReservation:
+    """Hold `quantity` asks of the user's monthly limit, or raise 429"""
+    reservation, limit_info = await usage_service.reserve(
+        current_user.id, current_user.current_plan, db, quantity
+    )
+    
+    if reservation is None:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Monthly ask limit exceeded. Used: {limit_info['used']}, Limit: {limit_info['limit']}"
+        )
+    return reservation
+
+async def _release(reservation: Optional[QuotaReservation]):
+    """Release a reservation unless it was committed; safe while unwinding a cancel"""
+    if reservation is None:
+        return
+    with anyio.CancelScope(shield=True):
+        try:
+            await usage_service.release_reservation(reservation)
+        except Exception as e:
+            logger.error(f"Error releasing quota reservation: {str(e)}")
+
+async def _get_or_create_session(request: AskRequest, current_user: User, db: AsyncSession) -> Session:
+    """Validate the requested session, or start a new ask session"""
+    if request.session_id:
+        # Validate session belongs to user
+        session_result = await db.execute(
+            select(Session).where(
+                and_(Session.id == request.session_id, Session.user_id == current_user.id)
+            )
+        )
+        session = session_result.scalar_one_or_none()
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return session
+    
+    # Create new session
+    session = Session(
+        user_id=current_user.id,
+        session_type=SessionType.ASK,
+        title=request.prompt[:50] + "..." if len(request.prompt) > 50 else request.prompt
+    )
+    db.add(session)
+    await db.commit()
+    await db.refresh(session)
+    context_service.start_session(str(session.id))
+    return session
+
+def _user_profile(current_user: User) -> Dict[str, Any]:
+    """User profile passed to the AI as context"""
+    return {
+        "display_name": current_user.display_name,
+        "email": current_user.email,
+        "plan": current_user.current_plan.value
+    }
+
+class PreparedCapture:
+    """A request's screen capture, ready for the provider but not yet stored.
+    
+    ref is the blob key of the original bytes, known before they are
+    written; store() writes them once the ask has succeeded, so failed
+    asks leave nothing behind. A near-duplicate of the session's previous
+    capture has no image: it reuses that capture's ref and is described
+    to the provider by its earlier answer.
+    """
+    
+    def __init__(
+        self,
+        ref: str,
+        session_id: str,
+        original: Optional[bytes] = None,
+        image: Optional[Dict[str, Any]] = None,
+        phash: Optional[int] = None,
+        description: Optional[str] = None
+    ):
+        self.ref = ref
+        self.session_id = session_id
+        self.original = original  # None when an earlier capture is reused
+        self.image = image  # Attached to the provider call
+        self.phash = phash  # Set in dedupe sessions
+        self.description = description  # Sent instead of an image for a reused capture
+    
+    async def store(self):
+        """Write the original capture; call before committing rows that reference it"""
+        if self.original is not None:
+            await blob_store.put(self.original)
+    
+    def remember(self, description: Optional[str] = None):
+        """Make this the session's capture to compare the next one against"""
+        if self.phash is not None and self.original is not None:
+            image_service.remember_capture(self.session_id, self.phash, self.ref, description)
+
+async def _prepare_capture(screen_context: Optional[str], provider: str, session: Session) -> Optional[PreparedCapture]:
+    """Decode a screen capture and downscale it for the provider.
+    
+    In listen/meeting sessions a capture that is perceptually the same as
+    the session's previous one reuses the earlier reference and description.
+    """
+    if not screen_context:
+        return None
+    
+    try:
+        original = await asyncio.to_thread(decode_capture, screen_context)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid screen capture encoding")
+    
+    session_id = str(session.id)
+    dedupe = session.session_type in DEDUPE_SESSION_TYPES
+    previous = image_service.last_capture(session_id) if dedupe else None
+    if previous and previous["description"] is None:
+        # Its ask hasn't finished yet (a queued job), so there is nothing to reuse
+        previous = None
+    capture = await image_service.preprocess(original, provider, previous["phash"] if previous else None)
+    if capture and capture["duplicate"]:
+        return PreparedCapture(previous["ref"], session_id, description=previous["description"])
+    
+    if capture:
+        image = {"data": capture["data"], "content_type": capture["content_type"]}
+    else:
+        # No Pillow, or not an image it can read: send the capture as is
+        image = {"data": original, "content_type": sniff_content_type(original)}
+    return PreparedCapture(
+        blob_store.key_for(original),
+        session_id,
+        original=original,
+        image=image,
+        phash=capture["phash"] if capture and dedupe else None
+    )
+
+def _request_deadline(http_request: Request, current_user: User) -> float:
+    """Monotonic deadline from X-Request-Timeout, capped by the plan's default"""
+    deadlines = settings.AI_REQUEST_DEADLINE_SECONDS
+    seconds = deadlines.get(current_user.current_plan.value, settings.AI_PROVIDER_TIMEOUT_SECONDS)
+    
+    header = http_request.headers.get("X-Request-Timeout")
+    if header:
+        try:
+            requested = float(header)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid X-Request-Timeout header")
+        if requested <= 0:
+            raise HTTPException(status_code=400, detail="Invalid X-Request-Timeout header")
+        seconds = min(seconds, requested)
+    
+    return time.monotonic() + seconds
+
+def _time_left(deadline: float) -> float:
+    return max(0.0, deadline - time.monotonic())
+
+async def _cancel_on_disconnect(http_request: Request, awaitable: Awaitable[Any]) -> Any:
+    """Await `awaitable`, cancelling it if the client disconnects first"""
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=settings.AI_DISCONNECT_POLL_SECONDS)
+            if done:
+                return task.result()
+            if await http_request.is_disconnected():
+                raise ClientDisconnectedError()
+    finally:
+        if not task.done():
+            task.cancel()
+
+async def _record_cancellation(user_id: str, reason: str, tokens: int = 0, count: int = 1):
+    """Track asks abandoned on disconnect or deadline.
+    
+    Recorded as "ask_cancelled" (not "ask", so they don't count against
+    the monthly limit) with the reason as the resource and any tokens the
+    provider already produced as the quantity. Uses its own DB session,
+    shielded, because the request handler may be unwinding.
+    """
+    with anyio.CancelScope(shield=True):
+        try:
+            async with async_session_factory() as cancel_db:
+                for _ in range(count):
+                    await usage_service.track_usage(
+                        user_id=user_id,
+                        action_type="ask_cancelled",
+                        resource_used=reason,
+                        quantity=tokens,
+                        db=cancel_db
+                    )
+                await cancel_db.commit()
+        except Exception as e:
+            logger.error(f"Error recording cancelled ask: {str(e)}")
+
+def _batch_semaphore(user_id: str) -> asyncio.Semaphore:
+    semaphore = _batch_semaphores.get(user_id)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(settings.ASK_BATCH_USER_CONCURRENCY)
+        _batch_semaphores[user_id] = semaphore
+    return semaphore
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @router.post("/", response_model=AskResponse)
 async def ask_ai(
     request: AskRequest,
+    http_request: Request,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    """Ask AI with context from screen, audio, and user profile"""
+    """Ask AI with context from screen, audio, and user profile.
+    
+    The provider call is cancelled, and nothing is saved, if the deadline
+    (X-Request-Timeout or the plan default) passes or the client
+    disconnects first.
+    """
+    deadline = _request_deadline(http_request, current_user)
+    reservation = None
     try:
-        # Check user's usage limits
-        can_ask, limit_info = await usage_service.can_user_ask(current_user.id, db)
-        
-        if not can_ask:
-            raise HTTPException(
-                status_code=429,
-                detail=f"Monthly ask limit exceeded. Used: {limit_info['used']}, Limit: {limit_info['limit']}"
-            )
+        # Hold one ask of the user's limit until the answer is saved
+        reservation = await _reserve_asks(current_user, db)
         
         # Get or create session
-        session_id = request.session_id
-        if session_id:
-            # Validate session belongs to user
-            session_result = await db.execute(
-                select(Session).where(
-                    and_(Session.id == session_id, Session.user_id == current_user.id)
-                )
-            )
-            session = session_result.scalar_one_or_none()
-            if not session:
-                raise HTTPException(status_code=404, detail="Session not found")
-        else:
-            # Create new session
-            session = Session(
-                user_id=current_user.id,
-                session_type=SessionType.ASK,
-                title=request.prompt[:50] + "..." if len(request.prompt) > 50 else request.prompt
-            )
-            db.add(session)
-            await db.commit()
-            await db.refresh(session)
-            session_id = str(session.id)
+        session = await _get_or_create_session(request, current_user, db)
+        session_id = str(session.id)
+        
+        # The capture is stored by content hash, instead of inline in the row, once the ask succeeds
+        capture = await _prepare_capture(request.screen_context, request.provider, session)
         
-        # Prepare user profile for context
-        user_profile = {
-            "display_name": current_user.display_name,
-            "email": current_user.email,
-            "plan": current_user.current_plan.value
-        }
+        # Prepare user profile and earlier turns for context
+        user_profile = _user_profile(current_user)
+        history = await context_service.get_history(session_id, request.provider, request.model, db)
         
         # Get AI response
-        ai_response = await ai_service.ask_ai(
-            prompt=request.prompt,
-            screen_context=request.screen_context,
-            audio_transcript=request.audio_transcript,
-            user_profile=user_profile,
-            provider=request.provider,
-            model=request.model
-        )
+        try:
+            ai_response = await _cancel_on_disconnect(http_request, ai_service.ask_ai(
+                prompt=request.prompt,
+                audio_transcript=request.audio_transcript,
+                user_profile=user_profile,
+                provider=request.provider,
+                model=request.model,
+                use_cache=request.use_cache,
+                plan=current_user.current_plan.value,
+                history=history,
+                screen_context_ref=capture.ref if capture else None,
+                timeout=_time_left(deadline),
+                image=capture.image if capture else None,
+                screen_description=capture.description if capture else None
+            ))
+        except DeadlineExceededError:
+            await _record_cancellation(current_user.id, "deadline")
+            raise
+        except (ClientDisconnectedError, asyncio.CancelledError):
+            await _record_cancellation(current_user.id, "disconnect")
+            raise
         
         # Save AI message to database
+        if capture:
+            await capture.store()
         ai_message = AiMessage(
             session_id=session.id,
             user_id=current_user.id,
             prompt=request.prompt,
             response=ai_response["response"],
-            screen_context=request.screen_context,
+            screen_context_ref=capture.ref if capture else None,
             audio_transcript=request.audio_transcript,
             ai_provider=ai_response["provider"],
             model_used=ai_response["model"],
@@ -92,11 +320,16 @@ async def ask_ai(
             action_type="ask",
             resource_used="tokens",
             quantity=ai_response["tokens_used"],
-            db=db
+            db=db,
+            sync=True
         )
         
         await db.commit()
+        await usage_service.commit_reservation(reservation)
+        if capture:
+            capture.remember(ai_response["response"])
         await db.refresh(ai_message)
+        context_service.append(session_id, request.prompt, ai_response["response"], str(ai_message.id))
         
         return AskResponse(
             response=ai_response["response"],
@@ -104,7 +337,8 @@ async def ask_ai(
             model=ai_response["model"],
             tokens_used=ai_response["tokens_used"],
             session_id=session_id,
-            message_id=str(ai_message.id)
+            message_id=str(ai_message.id),
+            cached=ai_response["cached"]
         )
         
     except HTTPException:
@@ -112,6 +346,385 @@ async def ask_ai(
     except Exception as e:
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error processing AI request: {str(e)}")
+    finally:
+        await _release(reservation)
+
+@router.post("/batch", response_model=AskBatchResponse)
+async def ask_ai_batch(
+    request: AskBatchRequest,
+    http_request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Run independent asks concurrently with one quota reservation and one commit.
+    
+    Items without a session_id share one new ask session. Each item
+    succeeds or fails on its own; only successful items are persisted and
+    counted as asks, and the units held for failed items are released.
+    All items share the request's deadline, and the whole batch is
+    cancelled if the client disconnects.
+    """
+    deadline = _request_deadline(http_request, current_user)
+    items = request.items
+    if len(items) > settings.ASK_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: at most {settings.ASK_BATCH_MAX_ITEMS} items"
+        )
+    
+    reservation = await _reserve_asks(current_user, db, quantity=len(items))
+    try:
+        return await _run_batch(items, http_request, current_user, deadline, reservation, db)
+    finally:
+        await _release(reservation)
+
+async def _run_batch(
+    items: List[AskRequest],
+    http_request: Request,
+    current_user: User,
+    deadline: float,
+    reservation: QuotaReservation,
+    db: AsyncSession
+) -> AskBatchResponse:
+    """Body of ask_ai_batch, run while the batch's reservation is held"""
+    # Resolve every session up front with one query
+    sessions: Dict[str, Session] = {}
+    requested_ids = {item.session_id for item in items if item.session_id}
+    if requested_ids:
+        session_result = await db.execute(
+            select(Session).where(
+                and_(Session.id.in_(requested_ids), Session.user_id == current_user.id)
+            )
+        )
+        sessions = {session.id: session for session in session_result.scalars()}
+        if requested_ids - sessions.keys():
+            raise HTTPException(status_code=404, detail="Session not found")
+    
+    batch_session = None
+    unsessioned = [item for item in items if not item.session_id]
+    if unsessioned:
+        batch_session = await _get_or_create_session(unsessioned[0], current_user, db)
+    
+    def session_for(item: AskRequest) -> Session:
+        return sessions[item.session_id] if item.session_id else batch_session
+    
+    # History reads share the request's DB session, so do them before fanning out
+    histories: Dict[tuple, List[Dict[str, str]]] = {}
+    for item in items:
+        history_key = (str(session_for(item).id), item.provider, item.model)
+        if history_key not in histories:
+            histories[history_key] = await context_service.get_history(*history_key, db)
+    
+    user_profile = _user_profile(current_user)
+    plan = current_user.current_plan.value
+    semaphore = _batch_semaphore(str(current_user.id))
+    
+    async def run(item: AskRequest):
+        session = session_for(item)
+        async with semaphore:
+            capture = await _prepare_capture(item.screen_context, item.provider, session)
+            ai_response = await ai_service.ask_ai(
+                prompt=item.prompt,
+                audio_transcript=item.audio_transcript,
+                user_profile=user_profile,
+                provider=item.provider,
+                model=item.model,
+                use_cache=item.use_cache,
+                plan=plan,
+                history=histories[(str(session.id), item.provider, item.model)],
+                screen_context_ref=capture.ref if capture else None,
+                timeout=_time_left(deadline),
+                image=capture.image if capture else None,
+                screen_description=capture.description if capture else None
+            )
+        return session, capture, ai_response
+    
+    try:
+        outcomes = await _cancel_on_disconnect(
+            http_request,
+            asyncio.gather(*(run(item) for item in items), return_exceptions=True)
+        )
+    except (ClientDisconnectedError, asyncio.CancelledError):
+        await _record_cancellation(current_user.id, "disconnect", count=len(items))
+        raise
+    
+    results: List[AskBatchItemResult] = []
+    completed = []
+    for index, (item, outcome) in enumerate(zip(items, outcomes)):
+        if isinstance(outcome, DeadlineExceededError):
+            await usage_service.track_usage(
+                user_id=current_user.id,
+                action_type="ask_cancelled",
+                resource_used="deadline",
+                quantity=0,
+                db=db,
+                sync=True
+            )
+        if isinstance(outcome, HTTPException):
+            results.append(AskBatchItemResult(
+                index=index, success=False, error=outcome.detail, status_code=outcome.status_code
+            ))
+            continue
+        if isinstance(outcome, Exception):
+            logger.error(f"Error processing batch item {index}: {str(outcome)}")
+            results.append(AskBatchItemResult(
+                index=index, success=False, error=f"Error processing AI request: {str(outcome)}", status_code=500
+            ))
+            continue
+        if isinstance(outcome, BaseException):
+            raise outcome
+        
+        session, capture, ai_response = outcome
+        if capture:
+            await capture.store()
+        ai_message = AiMessage(
+            session_id=session.id,
+            user_id=current_user.id,
+            prompt=item.prompt,
+            response=ai_response["response"],
+            screen_context_ref=capture.ref if capture else None,
+            audio_transcript=item.audio_transcript,
+            ai_provider=ai_response["provider"],
+            model_used=ai_response["model"],
+            tokens_used=ai_response["tokens_used"]
+        )
+        db.add(ai_message)
+        await usage_service.track_usage(
+            user_id=current_user.id,
+            action_type="ask",
+            resource_used="tokens",
+            quantity=ai_response["tokens_used"],
+            db=db,
+            sync=True
+        )
+        completed.append((index, item, str(session.id), capture, ai_message, ai_response))
+    
+    # Persist every successful item (and deadline cancellations) in one transaction
+    try:
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error saving batch results: {str(e)}")
+    await usage_service.commit_reservation(reservation)
+    
+    for index, item, session_id, capture, ai_message, ai_response in completed:
+        if capture:
+            capture.remember(ai_response["response"])
+        context_service.append(session_id, item.prompt, ai_response["response"], str(ai_message.id))
+        results.append(AskBatchItemResult(
+            index=index,
+            success=True,
+            result=AskResponse(
+                response=ai_response["response"],
+                provider=ai_response["provider"],
+                model=ai_response["model"],
+                tokens_used=ai_response["tokens_used"],
+                session_id=session_id,
+                message_id=str(ai_message.id),
+                cached=ai_response["cached"]
+            )
+        ))
+    
+    results.sort(key=lambda result: result.index)
+    return AskBatchResponse(
+        results=results,
+        succeeded=len(completed),
+        failed=len(items) - len(completed)
+    )
+
+@router.post("/jobs", response_model=AskJobResponse, status_code=202)
+async def submit_ask_job(
+    request: AskJobRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Queue an ask and return its job immediately.
+    
+    Poll GET /jobs/{job_id} for the result, or pass callback_url to have
+    the finished job POSTed there (https, public addresses only). Jobs run
+    highest plan tier first. A user's pending jobs are capped per plan and
+    count against what is left of the monthly ask limit.
+    """
+    callback_url = str(request.callback_url) if request.callback_url else None
+    if callback_url:
+        try:
+            await validate_callback_url(callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    pending = await job_service.pending_count(current_user.id, db)
+    max_pending = settings.ASK_JOB_MAX_PENDING.get(current_user.current_plan.value, 0)
+    if pending >= max_pending:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many pending ask jobs: at most {max_pending} at a time"
+        )
+    # Each queued job will take an ask when it runs
+    await _check_ask_limit(current_user, db, quantity=pending + 1)
+    session = await _get_or_create_session(request, current_user, db)
+    # The worker reads the capture back from the blob store, so store it now
+    capture = await _prepare_capture(request.screen_context, request.provider, session)
+    if capture:
+        await capture.store()
+    
+    job = await job_service.submit(
+        user_id=current_user.id,
+        plan=current_user.current_plan.value,
+        session_id=str(session.id),
+        request={
+            "prompt": request.prompt,
+            "audio_transcript": request.audio_transcript,
+            "provider": request.provider,
+            "model": request.model,
+            "use_cache": request.use_cache,
+            "plan": current_user.current_plan.value,
+            "user_profile": _user_profile(current_user),
+            "screen_description": capture.description if capture else None
+        },
+        screen_context_ref=capture.ref if capture else None,
+        callback_url=callback_url,
+        db=db
+    )
+    if capture:
+        capture.remember()
+    return AskJobResponse(**job_service.job_payload(job))
+
+@router.get("/jobs/{job_id}", response_model=AskJobResponse)
+async def get_ask_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get the status and, once finished, the result of an ask job"""
+    job = await job_service.get_job(job_id, current_user.id, db)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return AskJobResponse(**job_service.job_payload(job))
+
+@router.post("/stream")
+async def ask_ai_stream(
+    request: AskRequest,
+    http_request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Ask AI and stream the response as server-sent events.
+    
+    Emits "delta" events with text chunks, then a "done" event carrying
+    session_id, message_id and tokens_used (or an "error" event). The
+    message and usage are persisted only once the stream completes; if the
+    deadline passes or the client disconnects mid-stream, the provider
+    stream is cancelled, the reserved ask is released and only an
+    "ask_cancelled" usage event is kept.
+    """
+    deadline = _request_deadline(http_request, current_user)
+    reservation = await _reserve_asks(current_user, db)
+    try:
+        session = await _get_or_create_session(request, current_user, db)
+        session_id = str(session.id)
+        user_id = current_user.id
+        capture = await _prepare_capture(request.screen_context, request.provider, session)
+        user_profile = _user_profile(current_user)
+        history = await context_service.get_history(session_id, request.provider, request.model, db)
+    except BaseException:
+        await _release(reservation)
+        raise
+    
+    async def persist(result: Dict[str, Any]) -> str:
+        if capture:
+            await capture.store()
+        async with async_session_factory() as persist_db:
+            ai_message = AiMessage(
+                session_id=session_id,
+                user_id=user_id,
+                prompt=request.prompt,
+                response=result["response"],
+                screen_context_ref=capture.ref if capture else None,
+                audio_transcript=request.audio_transcript,
+                ai_provider=result["provider"],
+                model_used=result["model"],
+                tokens_used=result["tokens_used"]
+            )
+            persist_db.add(ai_message)
+            await usage_service.track_usage(
+                user_id=user_id,
+                action_type="ask",
+                resource_used="tokens",
+                quantity=result["tokens_used"],
+                db=persist_db,
+                sync=True
+            )
+            await persist_db.commit()
+            await usage_service.commit_reservation(reservation)
+            if capture:
+                capture.remember(result["response"])
+            context_service.append(session_id, request.prompt, result["response"], str(ai_message.id))
+            return str(ai_message.id)
+    
+    async def event_stream():
+        started: Dict[str, Any] = {}
+        parts: List[str] = []
+        finished = False
+        
+        def tokens_so_far() -> int:
+            # Tokens the provider already produced (and billed) before we stopped it
+            if not started:
+                return 0
+            return ai_service.estimate_tokens(request.prompt) + ai_service.estimate_tokens("".join(parts))
+        
+        events = ai_service.stream_ai(
+            prompt=request.prompt,
+            audio_transcript=request.audio_transcript,
+            user_profile=user_profile,
+            provider=request.provider,
+            model=request.model,
+            history=history,
+            timeout=_time_left(deadline),
+            image=capture.image if capture else None,
+            screen_description=capture.description if capture else None
+        )
+        try:
+            async for event in events:
+                if event["type"] == "start":
+                    started = event
+                elif event["type"] == "delta":
+                    parts.append(event["text"])
+                    yield _sse("delta", {"text": event["text"]})
+                elif event["type"] == "done":
+                    with anyio.CancelScope(shield=True):
+                        message_id = await persist(event)
+                    finished = True
+                    yield _sse("done", {
+                        "session_id": session_id,
+                        "message_id": message_id,
+                        "provider": event["provider"],
+                        "model": event["model"],
+                        "tokens_used": event["tokens_used"]
+                    })
+        except DeadlineExceededError as e:
+            finished = True
+            await _record_cancellation(user_id, "deadline", tokens_so_far())
+            yield _sse("error", {"message": e.detail})
+        except ExternalServiceError as e:
+            finished = True
+            yield _sse("error", {"message": e.detail})
+        finally:
+            try:
+                # Close the provider stream now rather than whenever it is garbage collected
+                with anyio.CancelScope(shield=True):
+                    await events.aclose()
+            finally:
+                await _release(reservation)
+                if not finished:
+                    # Client went away mid-stream
+                    await _record_cancellation(user_id, "disconnect", tokens_so_far())
+    
+    # The body may never start (the client left first), so also release after the response
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(_release, reservation)
+    )
 
 @router.get("/messages", response_model=List[AiMessageResponse])
 async def get_ai_messages(
@@ -150,6 +763,47 @@ async def get_ai_messages(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching messages: {str(e)}")
 
+@router.get("/messages/{message_id}/screen")
+async def get_message_screen_capture(
+    message_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Stream the screen capture attached to an AI message"""
+    message_result = await db.execute(
+        select(AiMessage.screen_context_ref, AiMessage.screen_context).where(
+            and_(AiMessage.id == message_id, AiMessage.user_id == current_user.id)
+        )
+    )
+    row = message_result.one_or_none()
+    if not row or not (row.screen_context_ref or row.screen_context):
+        raise HTTPException(status_code=404, detail="Screen capture not found")
+    
+    if not row.screen_context_ref:
+        # Legacy row not yet moved by the backfill job
+        try:
+            data = decode_capture(row.screen_context)
+        except ValueError:
+            raise HTTPException(status_code=404, detail="Screen capture not found")
+        return Response(content=data, media_type=sniff_content_type(data))
+    
+    chunks = blob_store.stream(row.screen_context_ref)
+    try:
+        first_chunk = await chunks.__anext__()
+    except (FileNotFoundError, StopAsyncIteration):
+        raise HTTPException(status_code=404, detail="Screen capture not found")
+    
+    async def body():
+        yield first_chunk
+        async for chunk in chunks:
+            yield chunk
+    
+    return StreamingResponse(
+        body(),
+        media_type=sniff_content_type(first_chunk),
+        headers={"Cache-Control": "private, max-age=31536000, immutable"}
+    )
+
 @router.get("/providers", response_model=ApiResponse)
 async def get_available_providers():
     """Get list of available AI providers"""
@@ -4,7 +4,7 @@ from sqlalchemy import select
 import json
 
 from app.core.database import get_db, User, Plan, PlanType
-from app.auth.dependencies import get_current_user
+from app.auth.dependencies import get_current_user, invalidate_user_cache
 from app.services.stripe_service import stripe_service
 from app.models.responses import CheckoutResponse, ApiResponse
 from app.models.requests import CheckoutRequest
@@ -44,6 +44,7 @@ async def create_checkout_session(
             # Update user with customer ID
             current_user.stripe_customer_id = customer_id
             await db.commit()
+            invalidate_user_cache(current_user.neon_user_id)
         else:
             customer_id = current_user.stripe_customer_id
         
@@ -127,6 +128,7 @@ async def handle_successful_payment(session: dict, db: AsyncSession):
                 plan_type_enum = PlanType(plan_type)
                 user.current_plan = plan_type_enum
                 await db.commit()
+                invalidate_user_cache(user.neon_user_id)
             except ValueError:
                 pass  # Invalid plan type, skip
                 
@@ -152,6 +154,7 @@ async def handle_subscription_cancelled(subscription: dict, db: AsyncSession):
             # Downgrade to free plan
             user.current_plan = PlanType.FREE
             await db.commit()
+            invalidate_user_cache(user.neon_user_id)
             
     except Exception as e:
         await db.rollback()
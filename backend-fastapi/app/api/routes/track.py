@@ -1,14 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from typing import List, Dict, Any
 
+from app.core.config import settings
 from app.core.database import get_db, User, Session, UsageTracking
 from app.auth.dependencies import get_current_user
 from app.services.usage_service import usage_service
 from app.models.responses import ApiResponse, SessionResponse
-from app.models.requests import TrackingRequest, SessionCreateRequest
+from app.models.requests import TrackingRequest, TrackingBatchRequest, SessionCreateRequest
 
 router = APIRouter()
 
@@ -39,6 +40,68 @@ async def track_usage(
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Error tracking usage: {str(e)}")
 
+@router.post("/batch", response_model=ApiResponse)
+async def track_usage_batch(
+    request: TrackingBatchRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Track a bundle of client events in one statement.
+    
+    Each item carries a client_event_id; items already recorded (a retried
+    batch) are skipped. occurred_at defaults to now and is clamped to now
+    if the client clock runs ahead.
+    """
+    items = request.items
+    if len(items) > settings.TRACK_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: at most {settings.TRACK_BATCH_MAX_ITEMS} items"
+        )
+    
+    now = datetime.now(timezone.utc)
+    oldest = now - timedelta(days=settings.TRACK_CLIENT_MAX_AGE_DAYS)
+    events: Dict[str, Dict[str, Any]] = {}
+    stale = []
+    for index, item in enumerate(items):
+        occurred_at = item.occurred_at or now
+        if occurred_at.tzinfo is None:
+            occurred_at = occurred_at.replace(tzinfo=timezone.utc)
+        if occurred_at < oldest:
+            stale.append(index)
+            continue
+        # First occurrence of a repeated id within the batch wins
+        events.setdefault(item.client_event_id, {
+            "client_event_id": item.client_event_id,
+            "action_type": item.action_type,
+            "resource_used": item.resource_used,
+            "quantity": item.quantity,
+            "created_at": min(occurred_at, now)
+        })
+    
+    if stale:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Events older than {settings.TRACK_CLIENT_MAX_AGE_DAYS} days at indexes {stale}"
+        )
+    
+    try:
+        inserted = await usage_service.track_usage_batch(current_user.id, list(events.values()), db)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error tracking usage: {str(e)}")
+    
+    return ApiResponse(
+        success=True,
+        message="Usage batch tracked successfully",
+        data={
+            "received": len(items),
+            "inserted": inserted,
+            "duplicates": len(items) - inserted
+        }
+    )
+
 @router.post("/session", response_model=SessionResponse)
 async def create_session(
     request: SessionCreateRequest,
@@ -63,7 +126,8 @@ async def create_session(
             action_type="session_start",
             resource_used="session",
             quantity=1,
-            db=db
+            db=db,
+            sync=True
         )
         
         await db.commit()
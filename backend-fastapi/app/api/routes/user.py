@@ -3,7 +3,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from app.core.database import get_db, User
-from app.auth.dependencies import get_current_user
+from app.auth.dependencies import get_current_user, invalidate_user_cache
+from app.auth.neon_auth import neon_auth_service
 from app.models.responses import UserResponse, ApiResponse
 from app.models.requests import UserUpdateRequest
 
@@ -39,6 +40,7 @@ async def update_user_profile(
             current_user.email = user_update.email
         
         await db.commit()
+        invalidate_user_cache(current_user.neon_user_id)
         await db.refresh(current_user)
         
         return UserResponse.model_validate(current_user)
@@ -60,6 +62,10 @@ async def delete_user_account(
         current_user.is_active = False
         await db.commit()
         
+        # Revoke cached sessions so the token stops working immediately
+        neon_auth_service.invalidate_user(current_user.neon_user_id)
+        invalidate_user_cache(current_user.neon_user_id)
+        
         # TODO: In production, you might want to:
         # 1. Cancel Stripe subscriptions
         # 2. Delete related data after a grace period
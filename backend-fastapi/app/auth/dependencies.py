@@ -2,18 +2,156 @@ from fastapi import Depends, HTTPException, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
 from typing import Optional, Dict, Any
 import logging
 
-from app.core.database import get_db, User, UserRole
+from app.core.database import get_db, async_session_factory, User, UserRole
 from app.auth.neon_auth import neon_auth_service
-from app.core.exceptions import AuthenticationError, AuthorizationError
+from app.core.exceptions import AuthenticationError, AuthorizationError, ConflictError
+from app.core.singleflight import SingleFlight
+from app.core.cache import TTLCache
+from app.core.invalidation import invalidation_bus
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
 # Security scheme
 security = HTTPBearer()
 
+# Concurrent requests for the same token share one verification and one
+# user lookup (the client fires several requests at once after login)
+verify_flight = SingleFlight()
+user_flight = SingleFlight()
+
+# Detached User snapshots keyed by neon_user_id, so warm requests resolve
+# the current user without a query
+user_cache = TTLCache(
+    max_size=settings.USER_CACHE_MAX_SIZE,
+    default_ttl=settings.USER_CACHE_TTL_SECONDS
+)
+_user_cache_generation = 0
+
+def _drop_cached_user(neon_user_id: str):
+    global _user_cache_generation
+    _user_cache_generation += 1
+    user_cache.delete(neon_user_id)
+
+def _drop_cached_users():
+    global _user_cache_generation
+    _user_cache_generation += 1
+    user_cache.clear()
+
+invalidation_bus.subscribe("user", _drop_cached_user, _drop_cached_users)
+
+def invalidate_user_cache(neon_user_id: str):
+    """Drop a user's cached snapshot, in every worker, after any change to the row"""
+    _drop_cached_user(neon_user_id)
+    invalidation_bus.publish("user", neon_user_id)
+
+async def _verify_token(token: str) -> Optional[Dict[str, Any]]:
+    """Verify a token, joining any verification already in flight for it"""
+    return await verify_flight.do(
+        neon_auth_service.token_key(token),
+        lambda: neon_auth_service.verify_token(token)
+    )
+
+async def _provision_user(session: AsyncSession, user_data: Dict[str, Any]) -> User:
+    """Insert the user or return the existing row in a single statement.
+    
+    INSERT ... ON CONFLICT (neon_user_id) DO UPDATE ... RETURNING makes
+    concurrent first logins of the same user converge on one row instead
+    of failing on the unique constraints.
+    """
+    dialect = session.bind.dialect.name
+    if dialect == "postgresql":
+        insert = postgresql.insert
+    elif dialect == "sqlite":
+        insert = sqlite.insert
+    else:
+        raise RuntimeError(f"User provisioning not supported on {dialect}")
+    
+    stmt = insert(User).values(
+        neon_user_id=user_data["id"],
+        email=user_data.get("email", ""),
+        display_name=user_data.get("display_name", ""),
+        photo_url=user_data.get("photo_url"),
+        role=UserRole.USER
+    )
+    # No-op update so RETURNING yields the existing row on conflict
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[User.neon_user_id],
+        set_={"neon_user_id": stmt.excluded.neon_user_id}
+    ).returning(User)
+    
+    result = await session.execute(
+        select(User).from_statement(stmt).execution_options(populate_existing=True)
+    )
+    user = result.scalar_one()
+    await session.commit()
+    return user
+
+async def _select_user(session: AsyncSession, neon_user_id: str) -> Optional[User]:
+    result = await session.execute(
+        select(User).where(User.neon_user_id == neon_user_id)
+    )
+    return result.scalar_one_or_none()
+
+async def _fetch_user(user_data: Dict[str, Any], create: bool) -> Optional[User]:
+    """Load (and optionally provision) a user in a dedicated session.
+    
+    Existing users are a plain SELECT; the upsert and its commit only run
+    when the row is missing. The returned instance is detached; callers
+    merge it into their own session so no ORM identity is shared between
+    requests.
+    """
+    neon_user_id = user_data["id"]
+    async with async_session_factory() as session:
+        user = await _select_user(session, neon_user_id)
+        if user is not None or not create:
+            return user
+        
+        try:
+            return await _provision_user(session, user_data)
+        except IntegrityError:
+            # Lost a race on another unique column (e.g. email); if the
+            # winning insert was this user, read it back
+            await session.rollback()
+        
+        user = await _select_user(session, neon_user_id)
+        if user is None:
+            # The email belongs to a different account
+            raise ConflictError("A different account already uses this email")
+        return user
+
+async def _load_user(
+    user_data: Dict[str, Any],
+    db: AsyncSession,
+    create: bool = False
+) -> Optional[User]:
+    """Resolve the user for verified token data into the caller's session.
+    
+    The cached snapshot itself is never attached to a session; merging with
+    load=False copies its state into a request-local instance without a query.
+    """
+    neon_user_id = user_data["id"]
+    user = user_cache.get(neon_user_id)
+    
+    if user is None:
+        generation = _user_cache_generation
+        user = await user_flight.do(
+            (neon_user_id, create),
+            lambda: _fetch_user(user_data, create)
+        )
+        if user is None:
+            return None
+        # Skip caching if the user was invalidated while we were loading
+        if generation == _user_cache_generation:
+            user_cache.set(neon_user_id, user, invalidation_bus.ttl(settings.USER_CACHE_TTL_SECONDS))
+    
+    return await db.merge(user, load=False)
+
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     db: AsyncSession = Depends(get_db)
@@ -26,7 +164,7 @@ async def get_current_user(
     token = credentials.credentials
     
     # Verify token with Neon Auth
-    user_data = await neon_auth_service.verify_token(token)
+    user_data = await _verify_token(token)
     
     if not user_data:
         raise AuthenticationError("Invalid or expired token")
@@ -36,25 +174,11 @@ async def get_current_user(
     if not neon_user_id:
         raise AuthenticationError("Invalid user data from Neon Auth")
     
-    # Find user in database
-    result = await db.execute(
-        select(User).where(User.neon_user_id == neon_user_id)
-    )
-    user = result.scalar_one_or_none()
-    
-    if not user:
-        # Create new user if doesn't exist
-        user = User(
-            neon_user_id=neon_user_id,
-            email=user_data.get("email", ""),
-            display_name=user_data.get("display_name", ""),
-            photo_url=user_data.get("photo_url"),
-            role=UserRole.USER
-        )
-        db.add(user)
-        await db.commit()
-        await db.refresh(user)
-        logger.info(f"Created new user: {user.email}")
+    # Find user in database, creating it on first login
+    user = await _load_user(user_data, db, create=True)
+    
+    if user is None:
+        raise AuthenticationError("User could not be provisioned")
     
     if not user.is_active:
         raise AuthenticationError("User account is disabled")
@@ -96,7 +220,7 @@ async def get_optional_current_user(
         token = auth_header.split(" ")[1]
         
         # Verify token with Neon Auth
-        user_data = await neon_auth_service.verify_token(token)
+        user_data = await _verify_token(token)
         
         if not user_data:
             return None
@@ -106,10 +230,7 @@ async def get_optional_current_user(
         if not neon_user_id:
             return None
         
-        result = await db.execute(
-            select(User).where(User.neon_user_id == neon_user_id)
-        )
-        user = result.scalar_one_or_none()
+        user = await _load_user(user_data, db)
         
         if user and user.is_active:
             return user
@@ -0,0 +1,80 @@
+import asyncio
+import time
+from typing import Callable, Dict, Any, Optional
+import httpx
+import logging
+
+logger = logging.getLogger(__name__)
+
+class JWKSCache:
+    """JSON Web Key Set cache with periodic background refresh"""
+
+    def __init__(
+        self,
+        url: str,
+        client_factory: Callable[[], httpx.AsyncClient],
+        refresh_interval: float,
+        min_refresh_interval: float
+    ):
+        self.url = url
+        self.client_factory = client_factory
+        self.refresh_interval = refresh_interval
+        self.min_refresh_interval = min_refresh_interval
+        self.keys: Dict[str, Dict[str, Any]] = {}
+        self._last_fetch = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def get_key(self, kid: str) -> Optional[Dict[str, Any]]:
+        """Look up a signing key, refreshing at once if the kid is unknown"""
+        key = self.keys.get(kid)
+        if key is None and time.monotonic() - self._last_fetch >= self.min_refresh_interval:
+            await self.refresh()
+            key = self.keys.get(kid)
+        return key
+
+    async def refresh(self) -> bool:
+        """Fetch the key set; concurrent callers share a single fetch"""
+        started = time.monotonic()
+        async with self._lock:
+            if self._last_fetch >= started:
+                # Another caller refreshed while we were waiting
+                return True
+            try:
+                response = await self.client_factory().get(self.url)
+                response.raise_for_status()
+                keys = {
+                    key["kid"]: key
+                    for key in response.json().get("keys", [])
+                    if key.get("kid")
+                }
+            except Exception as e:
+                logger.error(f"Error fetching JWKS: {str(e)}")
+                # Back off before the next unknown-kid refresh
+                self._last_fetch = time.monotonic()
+                return False
+
+            self.keys = keys
+            self._last_fetch = time.monotonic()
+            logger.info(f"Loaded {len(keys)} signing keys from JWKS")
+            return True
+
+    def start(self):
+        """Start the background refresh loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        """Stop the background refresh loop"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.refresh_interval)
@@ -1,8 +1,14 @@
 import httpx
 import json
-from typing import Optional, Dict, Any
+import hashlib
+import time
+from typing import Optional, Dict, Any, List, Set, Tuple
 from fastapi import HTTPException
+from jose import jwt, JOSEError, JWTError
 from app.core.config import settings
+from app.core.cache import TTLCache
+from app.core.invalidation import invalidation_bus
+from app.auth.jwks import JWKSCache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,53 +20,239 @@ class NeonAuthService:
         self.project_id = settings.NEXT_PUBLIC_STACK_PROJECT_ID
         self.publishable_key = settings.NEXT_PUBLIC_STACK_PUBLISHABLE_CLIENT_KEY
         self.secret_key = settings.STACK_SECRET_SERVER_KEY
-        self.base_url = "https://api.stack-auth.com"
+        self.base_url = settings.STACK_AUTH_BASE_URL
+        self._client: Optional[httpx.AsyncClient] = None
+        
+        # Verified sessions keyed by token hash; False marks a rejected token
+        self.token_cache = TTLCache(
+            max_size=settings.AUTH_TOKEN_CACHE_MAX_SIZE,
+            default_ttl=settings.AUTH_TOKEN_CACHE_TTL_SECONDS,
+            on_remove=self._on_token_removed
+        )
+        self._user_tokens: Dict[str, Set[str]] = {}
+        
+        self.verification_mode = settings.AUTH_VERIFICATION_MODE
+        self.jwks = JWKSCache(
+            url=settings.STACK_AUTH_JWKS_URL
+            or f"{self.base_url}/api/v1/projects/{self.project_id}/.well-known/jwks.json",
+            client_factory=lambda: self.client,
+            refresh_interval=settings.AUTH_JWKS_REFRESH_SECONDS,
+            min_refresh_interval=settings.AUTH_JWKS_MIN_REFRESH_SECONDS
+        )
+    
+    def _build_client(self) -> httpx.AsyncClient:
+        """Build the pooled keep-alive client shared by all auth calls"""
+        http2 = settings.AUTH_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("AUTH_HTTP2 is enabled but 'h2' is not installed, falling back to HTTP/1.1")
+                http2 = False
+        
+        return httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={
+                "Authorization": f"Bearer {self.secret_key}",
+                "Content-Type": "application/json"
+            },
+            limits=httpx.Limits(
+                max_connections=settings.AUTH_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.AUTH_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.AUTH_HTTP_KEEPALIVE_EXPIRY_SECONDS
+            ),
+            timeout=httpx.Timeout(
+                settings.AUTH_HTTP_TIMEOUT_SECONDS,
+                connect=settings.AUTH_HTTP_CONNECT_TIMEOUT_SECONDS
+            ),
+            http2=http2
+        )
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared HTTP client, created on first use if startup() was not called"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+    
+    async def startup(self):
+        """Open the shared HTTP client (called from the app lifespan)"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        if self.verification_mode == "local":
+            self.jwks.start()
+        invalidation_bus.subscribe("auth-token", self.token_cache.delete, self.token_cache.clear)
+        invalidation_bus.subscribe("auth-user", self._drop_user_tokens, self.token_cache.clear)
+    
+    async def shutdown(self):
+        """Close the shared HTTP client and its pooled connections"""
+        invalidation_bus.unsubscribe("auth-token")
+        invalidation_bus.unsubscribe("auth-user")
+        await self.jwks.stop()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    @staticmethod
+    def token_key(token: str) -> str:
+        """Hash a bearer token so raw tokens are never held as cache keys"""
+        return hashlib.sha256(token.encode()).hexdigest()
+    
+    def _token_ttl(self, token: str) -> float:
+        """Cache TTL for a verified token, capped at the token's own expiry"""
+        ttl = invalidation_bus.ttl(float(settings.AUTH_TOKEN_CACHE_TTL_SECONDS))
+        try:
+            exp = jwt.get_unverified_claims(token).get("exp")
+        except Exception:
+            exp = None
+        if exp is not None:
+            ttl = min(ttl, float(exp) - time.time())
+        return ttl
+    
+    def _on_token_removed(self, key: str, value: Any):
+        """Keep the user -> token index in step with the cache"""
+        if not value:
+            return
+        keys = self._user_tokens.get(value.get("id"))
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                self._user_tokens.pop(value.get("id"), None)
+    
+    def invalidate_token(self, token: str):
+        """Drop a single token from the verification cache, in every worker"""
+        key = self.token_key(token)
+        self.token_cache.delete(key)
+        invalidation_bus.publish("auth-token", key)
+    
+    def invalidate_user(self, neon_user_id: str):
+        """Drop every cached session for a user in every worker, e.g. after deactivation"""
+        self._drop_user_tokens(neon_user_id)
+        invalidation_bus.publish("auth-user", neon_user_id)
+    
+    def _drop_user_tokens(self, neon_user_id: str):
+        for key in list(self._user_tokens.get(neon_user_id, ())):
+            self.token_cache.delete(key)
+        self._user_tokens.pop(neon_user_id, None)
     
     async def verify_token(self, token: str) -> Optional[Dict[str, Any]]:
         """Verify a Neon Auth token and return user data"""
+        key = self.token_key(token)
+        cached = self.token_cache.get(key)
+        if cached is not None:
+            return cached or None
+        
+        user, definitive = None, False
+        if self.verification_mode == "local":
+            user, definitive = await self._verify_token_local(token)
+        if not definitive:
+            user, definitive = await self._verify_token_remote(token)
+        
+        if user and user.get("id"):
+            self.token_cache.set(key, user, self._token_ttl(token))
+            if key in self.token_cache:
+                self._user_tokens.setdefault(user["id"], set()).add(key)
+        elif definitive:
+            self.token_cache.set(key, False, settings.AUTH_TOKEN_NEGATIVE_CACHE_TTL_SECONDS)
+        
+        return user
+    
+    @staticmethod
+    def _key_algorithms(key: Dict[str, Any]) -> List[str]:
+        """Algorithms a JWK may verify: its own alg, or those its key type allows"""
+        if key.get("alg"):
+            candidates = [key["alg"]]
+        elif key.get("kty") == "EC":
+            candidates = [{"P-256": "ES256", "P-384": "ES384", "P-521": "ES512"}.get(key.get("crv"), "")]
+        elif key.get("kty") == "RSA":
+            candidates = ["RS256", "RS384", "RS512"]
+        else:
+            candidates = []
+        return [algorithm for algorithm in candidates if algorithm in settings.AUTH_JWT_ALGORITHMS]
+    
+    async def _verify_token_local(self, token: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Verify a token's signature, audience and expiry against the cached JWKS.
+        
+        Returns (None, False) when the token cannot be checked locally (not a
+        JWT, unknown key, JWKS unavailable) so the caller falls back to the
+        remote verification endpoint.
+        """
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/api/v1/auth/sessions/verify",
-                    headers={
-                        "Authorization": f"Bearer {self.secret_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "session_token": token,
-                        "project_id": self.project_id
-                    }
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    return data.get("user")
-                else:
-                    logger.error(f"Token verification failed: {response.status_code} - {response.text}")
-                    return None
+            header = jwt.get_unverified_header(token)
+        except JWTError:
+            return None, False
+        
+        kid = header.get("kid")
+        if not kid or header.get("alg") not in settings.AUTH_JWT_ALGORITHMS:
+            return None, False
+        
+        key = await self.jwks.get_key(kid)
+        if key is None:
+            return None, False
+        
+        try:
+            # The key decides the algorithm; a header naming another one is rejected
+            claims = jwt.decode(
+                token,
+                key,
+                algorithms=self._key_algorithms(key),
+                audience=self.project_id,
+                options={"require_aud": True, "require_exp": True}
+            )
+        except JOSEError as e:
+            logger.error(f"Local token verification failed: {str(e)}")
+            return None, True
+        
+        if not claims.get("sub"):
+            return None, False
+        
+        return {
+            "id": claims["sub"],
+            "email": claims.get("email", ""),
+            "display_name": claims.get("name"),
+            "photo_url": claims.get("picture")
+        }, True
+    
+    async def _verify_token_remote(self, token: str) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Verify a token against Stack Auth.
+        
+        Returns the user data and whether the answer is definitive, so that
+        transient upstream failures are never negatively cached.
+        """
+        try:
+            response = await self.client.post(
+                "/api/v1/auth/sessions/verify",
+                json={
+                    "session_token": token,
+                    "project_id": self.project_id
+                },
+                timeout=settings.AUTH_VERIFY_TIMEOUT_SECONDS
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                return data.get("user"), True
+            else:
+                logger.error(f"Token verification failed: {response.status_code} - {response.text}")
+                return None, response.status_code in (400, 401, 403, 404)
                     
         except Exception as e:
             logger.error(f"Error verifying token: {str(e)}")
-            return None
+            return None, False
     
     async def get_user_info(self, user_id: str) -> Optional[Dict[str, Any]]:
         """Get user information from Neon Auth"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(
-                    f"{self.base_url}/api/v1/users/{user_id}",
-                    headers={
-                        "Authorization": f"Bearer {self.secret_key}",
-                        "Content-Type": "application/json"
-                    },
-                    params={"project_id": self.project_id}
-                )
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"Failed to get user info: {response.status_code} - {response.text}")
-                    return None
+            response = await self.client.get(
+                f"/api/v1/users/{user_id}",
+                params={"project_id": self.project_id}
+            )
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                logger.error(f"Failed to get user info: {response.status_code} - {response.text}")
+                return None
                     
         except Exception as e:
             logger.error(f"Error getting user info: {str(e)}")
@@ -69,24 +261,19 @@ class NeonAuthService:
     async def refresh_token(self, refresh_token: str) -> Optional[Dict[str, Any]]:
         """Refresh a Neon Auth token"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.base_url}/api/v1/auth/tokens/refresh",
-                    headers={
-                        "Authorization": f"Bearer {self.secret_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "refresh_token": refresh_token,
-                        "project_id": self.project_id
-                    }
-                )
-                
-                if response.status_code == 200:
-                    return response.json()
-                else:
-                    logger.error(f"Token refresh failed: {response.status_code} - {response.text}")
-                    return None
+            response = await self.client.post(
+                "/api/v1/auth/tokens/refresh",
+                json={
+                    "refresh_token": refresh_token,
+                    "project_id": self.project_id
+                }
+            )
+            
+            if response.status_code == 200:
+                return response.json()
+            else:
+                logger.error(f"Token refresh failed: {response.status_code} - {response.text}")
+                return None
                     
         except Exception as e:
             logger.error(f"Error refreshing token: {str(e)}")
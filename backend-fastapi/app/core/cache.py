@@ -0,0 +1,111 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+import time
+
+
+class TTLCache:
+    """Bounded LRU cache with per-entry expiry and hit/miss/eviction counters"""
+
+    def __init__(
+        self,
+        max_size: int,
+        default_ttl: float,
+        on_remove: Optional[Callable[[Hashable, Any], None]] = None,
+        max_bytes: Optional[int] = None,
+        size_of: Optional[Callable[[Any], int]] = None
+    ):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.on_remove = on_remove
+        # Optional memory budget, measured per entry by size_of
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.bytes_used = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None if missing or expired"""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, expires_at, _ = entry
+        if expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store a value, evicting the least recently used entries when full"""
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+
+        size = self.size_of(value) if self.size_of else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = (value, time.monotonic() + ttl, size)
+        self.bytes_used += size
+
+        while len(self._entries) > self.max_size or (
+            self.max_bytes is not None and self.bytes_used > self.max_bytes
+        ):
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> bool:
+        """Remove a key; returns whether it was present"""
+        if key not in self._entries:
+            return False
+        self._remove(key)
+        return True
+
+    def clear(self):
+        """Remove all entries"""
+        for key in list(self._entries.keys()):
+            self._remove(key)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for sizing the cache"""
+        lookups = self.hits + self.misses
+        stats = {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+        if self.max_bytes is not None:
+            stats["bytes_used"] = self.bytes_used
+            stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] > time.monotonic()
+
+    def _remove(self, key: Hashable):
+        value, _, size = self._entries.pop(key)
+        self.bytes_used -= size
+        if self.on_remove:
+            self.on_remove(key, value)
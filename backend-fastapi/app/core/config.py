@@ -11,6 +11,39 @@ class Settings(BaseSettings):
     NEXT_PUBLIC_STACK_PUBLISHABLE_CLIENT_KEY: str
     STACK_SECRET_SERVER_KEY: str
     
+    STACK_AUTH_BASE_URL: str = "https://api.stack-auth.com"
+    
+    # Auth HTTP client pool
+    AUTH_HTTP_MAX_CONNECTIONS: int = 100
+    AUTH_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    AUTH_HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    AUTH_HTTP2: bool = False
+    AUTH_HTTP_CONNECT_TIMEOUT_SECONDS: float = 3.0
+    AUTH_HTTP_TIMEOUT_SECONDS: float = 10.0
+    AUTH_VERIFY_TIMEOUT_SECONDS: float = 5.0
+    
+    # Token verification mode: "remote" (Stack Auth API) or "local" (JWT + JWKS)
+    AUTH_VERIFICATION_MODE: str = "remote"
+    STACK_AUTH_JWKS_URL: Optional[str] = None
+    AUTH_JWT_ALGORITHMS: list = ["ES256", "RS256"]
+    AUTH_JWKS_REFRESH_SECONDS: int = 3600
+    AUTH_JWKS_MIN_REFRESH_SECONDS: int = 30
+    
+    # Auth token verification cache
+    AUTH_TOKEN_CACHE_MAX_SIZE: int = 10000
+    AUTH_TOKEN_CACHE_TTL_SECONDS: int = 300
+    AUTH_TOKEN_NEGATIVE_CACHE_TTL_SECONDS: int = 30
+    
+    # User snapshot cache for get_current_user
+    USER_CACHE_MAX_SIZE: int = 10000
+    USER_CACHE_TTL_SECONDS: int = 60
+    
+    # User and token cache invalidations reach the other workers over Redis
+    # pub/sub when REDIS_URL is set. Without Redis (or while the subscription
+    # is down) those caches keep entries at most this long, which bounds how
+    # long another worker can act on a deactivated user or changed plan
+    AUTH_CACHE_UNSHARED_TTL_SECONDS: int = 15
+    
     # Stripe
     STRIPE_TEST_SECRET_KEY: str
     STRIPE_WEBHOOK_SECRET: Optional[str] = None
@@ -19,6 +52,118 @@ class Settings(BaseSettings):
     GEMINI_API_KEY: Optional[str] = None
     OPENAI_API_KEY: Optional[str] = None
     CLAUDE_API_KEY: Optional[str] = None
+    # Override provider endpoints, e.g. to point at run_stub_llm.py for offline load tests
+    OPENAI_BASE_URL: Optional[str] = None
+    GEMINI_BASE_URL: Optional[str] = None
+    CLAUDE_BASE_URL: Optional[str] = None
+    # How often each worker checks api_keys versions for rotated keys
+    AI_CREDENTIALS_REFRESH_SECONDS: int = 30
+    
+    # AI provider client pool
+    AI_HTTP_MAX_CONNECTIONS: int = 200
+    AI_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 50
+    AI_HTTP_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    AI_PROVIDER_TIMEOUT_SECONDS: float = 60.0
+    # End-to-end ask deadline per plan; clients may ask for less via X-Request-Timeout
+    AI_REQUEST_DEADLINE_SECONDS: dict = {
+        "free": 30.0,
+        "basic": 45.0,
+        "pro": 90.0,
+        "enterprise": 120.0
+    }
+    AI_DISCONNECT_POLL_SECONDS: float = 0.5
+    AI_PROVIDER_MAX_CONCURRENCY: int = 50
+    
+    # Per-provider circuit breaker and AIMD concurrency limit
+    AI_BREAKER_WINDOW_SIZE: int = 20
+    AI_BREAKER_MIN_CALLS: int = 10
+    AI_BREAKER_FAILURE_RATE: float = 0.5
+    AI_BREAKER_SLOW_CALL_SECONDS: float = 30.0
+    AI_BREAKER_OPEN_SECONDS: float = 30.0
+    AI_LIMITER_INITIAL_LIMIT: Optional[float] = None  # Defaults to AI_PROVIDER_MAX_CONCURRENCY
+    AI_LIMITER_QUEUE_TIMEOUT_SECONDS: float = 10.0
+    AI_LIMITER_MIN_LIMIT: float = 1.0
+    AI_LIMITER_LATENCY_TARGET_SECONDS: float = 15.0
+    AI_LIMITER_BACKOFF_RATIO: float = 0.7
+    
+    # Models used for asks with a screen capture when the client names none;
+    # the text defaults (gpt-3.5-turbo, gemini-pro) do not accept images
+    AI_VISION_MODELS: dict = {
+        "openai": "gpt-4o",
+        "gemini": "gemini-pro-vision",
+        "claude": "claude-3-sonnet-20240229"
+    }
+    
+    # Provider routing: fallback order per plan, and optional hedging of
+    # slow requests onto the next provider after the first one's recent p95
+    AI_PROVIDER_FALLBACK_CHAINS: dict = {
+        "free": ["gemini", "openai", "claude"],
+        "basic": ["gemini", "openai", "claude"],
+        "pro": ["openai", "claude", "gemini"],
+        "enterprise": ["openai", "claude", "gemini"]
+    }
+    AI_HEDGING_ENABLED: bool = False
+    AI_HEDGING_MIN_SAMPLES: int = 20
+    
+    # Batch asks
+    ASK_BATCH_MAX_ITEMS: int = 50
+    ASK_BATCH_USER_CONCURRENCY: int = 8
+    
+    # Ask job queue (DB-backed, processed by in-process workers)
+    ASK_JOB_WORKERS: int = 4
+    ASK_JOB_POLL_SECONDS: float = 1.0
+    ASK_JOB_VISIBILITY_TIMEOUT_SECONDS: int = 180
+    ASK_JOB_TIMEOUT_SECONDS: float = 150.0
+    ASK_JOB_MAX_ATTEMPTS: int = 3
+    ASK_JOB_RETRY_BACKOFF_SECONDS: int = 10
+    ASK_JOB_PRIORITIES: dict = {"enterprise": 30, "pro": 20, "basic": 10, "free": 0}
+    # Queued or running jobs a user may have at once
+    ASK_JOB_MAX_PENDING: dict = {"enterprise": 200, "pro": 100, "basic": 20, "free": 5}
+    ASK_JOB_CALLBACK_ATTEMPTS: int = 3
+    ASK_JOB_CALLBACK_TIMEOUT_SECONDS: float = 10.0
+    ASK_JOB_CALLBACK_CONCURRENCY: int = 20
+    # Callback hosts (and their subdomains) allowed to resolve to non-public
+    # addresses; every other callback must be https to a public address
+    ASK_JOB_CALLBACK_ALLOWED_HOSTS: list = []
+    
+    # Session conversation history sent with session-aware asks
+    AI_CONTEXT_TOKEN_BUDGETS: dict = {
+        "default": 2000,
+        "openai": 2000,
+        "gemini": 8000,
+        "claude": 8000,
+        "gpt-4": 4000,
+        "gpt-4-turbo-preview": 16000
+    }
+    AI_CONTEXT_MAX_TOKENS: int = 16000
+    AI_CONTEXT_MAX_TURNS: int = 50
+    AI_CONTEXT_CACHE_MAX_SESSIONS: int = 5000
+    AI_CONTEXT_CACHE_TTL_SECONDS: int = 3600
+    # How far back cached context windows re-check for turns from other workers
+    AI_CONTEXT_SYNC_LOOKBACK_SECONDS: int = 300
+    
+    # AI response cache: "memory", "redis" or "none"
+    AI_RESPONSE_CACHE_BACKEND: str = "memory"
+    AI_RESPONSE_CACHE_TTL_SECONDS: int = 3600
+    AI_RESPONSE_CACHE_MAX_ENTRIES: int = 5000
+    AI_RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    REDIS_URL: Optional[str] = None
+    
+    # Monthly quota counters: "memory" (single process) or "redis" (shared)
+    QUOTA_COUNTER_BACKEND: str = "memory"
+    QUOTA_COUNTER_MAX_KEYS: int = 100000
+    QUOTA_COUNTER_TTL_SECONDS: int = 86400
+    QUOTA_RECONCILE_SECONDS: int = 300
+    # Asks hold a unit of quota while in flight; unsettled holds lapse after this
+    QUOTA_RESERVATION_TTL_SECONDS: int = 300
+    PLAN_LIMITS_CACHE_TTL_SECONDS: int = 300
+    
+    # Write-behind buffer for usage events
+    USAGE_FLUSH_INTERVAL_MS: int = 200
+    USAGE_FLUSH_ROWS: int = 500
+    USAGE_BUFFER_MAX_ROWS: int = 10000
+    TRACK_BATCH_MAX_ITEMS: int = 500
+    TRACK_CLIENT_MAX_AGE_DAYS: int = 7  # Oldest client timestamp accepted by /api/track/batch
     
     # App Settings
     SECRET_KEY: str = "your-secret-key-here-please-change-in-production"
@@ -26,6 +171,29 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     ENVIRONMENT: str = "development"
     
+    # Blob storage for screen captures: "filesystem" or "s3"
+    BLOB_STORE_BACKEND: str = "filesystem"
+    BLOB_STORE_PATH: str = "./blob_store"
+    S3_BUCKET: Optional[str] = None
+    S3_ENDPOINT_URL: Optional[str] = None
+    S3_REGION: Optional[str] = None
+    
+    # Screen capture preprocessing (needs Pillow; captures pass through unchanged without it)
+    IMAGE_PROCESS_WORKERS: int = 2
+    IMAGE_PROCESS_MAX_PENDING: int = 16
+    IMAGE_PROVIDER_PROFILES: dict = {
+        "default": {"max_dimension": 1568, "format": "JPEG", "quality": 80},
+        "openai": {"max_dimension": 2048, "format": "JPEG", "quality": 80},
+        "gemini": {"max_dimension": 3072, "format": "WEBP", "quality": 80},
+        "claude": {"max_dimension": 1568, "format": "JPEG", "quality": 80}
+    }
+    # Listen/meeting captures within this Hamming distance of the previous one are reused
+    IMAGE_DEDUPE_MAX_DISTANCE: int = 4
+    IMAGE_DEDUPE_MAX_SESSIONS: int = 5000
+    IMAGE_DEDUPE_TTL_SECONDS: int = 3600
+    # A reused capture is sent as the provider's earlier answer about it, cut to this length
+    IMAGE_DEDUPE_DESCRIPTION_MAX_CHARS: int = 2000
+    
     # CORS
     ALLOWED_ORIGINS: list = ["http://localhost:3000", "http://127.0.0.1:3000"]
     
@@ -1,6 +1,6 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
-from sqlalchemy import Column, String, DateTime, Boolean, Text, Integer, Enum, ForeignKey
+from sqlalchemy import Column, String, DateTime, Boolean, Text, Integer, BigInteger, Enum, ForeignKey, Index
 from sqlalchemy.sql import func
 from typing import AsyncGenerator
 import uuid
@@ -46,6 +46,12 @@ class SessionType(str, enum.Enum):
     LISTEN = "listen"
     MEETING = "meeting"
 
+class AskJobStatus(str, enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
 class UserRole(str, enum.Enum):
     USER = "user"
     ADMIN = "admin"
@@ -99,13 +105,18 @@ class Session(Base):
 
 class AiMessage(Base):
     __tablename__ = "ai_messages"
+    __table_args__ = (
+        # Session history, newest first
+        Index("ix_ai_messages_session_created", "session_id", "created_at"),
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     session_id = Column(String, ForeignKey("sessions.id"), nullable=False)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
     prompt = Column(Text, nullable=False)
     response = Column(Text, nullable=False)
-    screen_context = Column(Text, nullable=True)  # Base64 encoded screen capture
+    screen_context = Column(Text, nullable=True)  # Legacy inline base64 capture (see screen_context_ref)
+    screen_context_ref = Column(String(64), nullable=True, index=True)  # SHA-256 key in the blob store
     audio_transcript = Column(Text, nullable=True)
     ai_provider = Column(String, nullable=False)  # gemini, openai, claude
     model_used = Column(String, nullable=False)
@@ -114,6 +125,10 @@ class AiMessage(Base):
 
 class UsageTracking(Base):
     __tablename__ = "usage_tracking"
+    __table_args__ = (
+        # Client batches are retried; a repeated event id is ignored
+        Index("ux_usage_tracking_client_event", "user_id", "client_event_id", unique=True),
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
@@ -122,15 +137,55 @@ class UsageTracking(Base):
     quantity = Column(Integer, default=1)
     month = Column(Integer, nullable=False)  # 1-12
     year = Column(Integer, nullable=False)
+    client_event_id = Column(String(64), nullable=True)  # Set for events sent via /api/track/batch
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+class UsageMonthly(Base):
+    __tablename__ = "usage_monthly"
+    __table_args__ = (
+        Index("ix_usage_monthly_period", "year", "month", "action_type"),
+    )
+    
+    # Monthly totals of usage_tracking, upserted in the same transaction as each event
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    action_type = Column(String, primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+    quantity_sum = Column(BigInteger, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
 class ApiKey(Base):
     __tablename__ = "api_keys"
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     provider = Column(String, nullable=False)  # openai, gemini, claude
     encrypted_key = Column(String, nullable=False)
+    version = Column(Integer, default=1)  # Bumped on every rotation; AIService reloads on change
     is_active = Column(Boolean, default=True)
     created_by = Column(String, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class AskJob(Base):
+    __tablename__ = "ask_jobs"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    session_id = Column(String, ForeignKey("sessions.id"), nullable=False)
+    status = Column(Enum(AskJobStatus), default=AskJobStatus.QUEUED, nullable=False)
+    priority = Column(Integer, default=0, nullable=False)  # Higher runs first
+    request = Column(Text, nullable=False)  # JSON of the ask, without the capture
+    screen_context_ref = Column(String(64), nullable=True)
+    callback_url = Column(String, nullable=True)
+    attempts = Column(Integer, default=0, nullable=False)
+    available_at = Column(DateTime, nullable=False, index=True)  # Retry time, or lease expiry while running
+    lease_id = Column(String, nullable=True)
+    result = Column(Text, nullable=True)  # JSON AskResponse
+    error = Column(Text, nullable=True)
+    callback_delivered_at = Column(DateTime, nullable=True)
+    # Callback outbox: next delivery time (or claim expiry while sending), NULL once done
+    callback_next_at = Column(DateTime, nullable=True, index=True)
+    callback_attempts = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    completed_at = Column(DateTime, nullable=True)
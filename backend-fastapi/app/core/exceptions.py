@@ -3,7 +3,7 @@ from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from starlette.exceptions import HTTPException as StarletteHTTPException
 import logging
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -27,6 +27,11 @@ class NotFoundError(CustomHTTPException):
     def __init__(self, detail: str = "Resource not found"):
         super().__init__(status_code=404, detail=detail)
 
+class ConflictError(CustomHTTPException):
+    """Conflicts with existing resources"""
+    def __init__(self, detail: str = "Resource already exists"):
+        super().__init__(status_code=409, detail=detail)
+
 class ValidationError(CustomHTTPException):
     """Validation errors"""
     def __init__(self, detail: str = "Validation failed"):
@@ -39,8 +44,20 @@ class RateLimitError(CustomHTTPException):
 
 class ExternalServiceError(CustomHTTPException):
     """External service errors"""
-    def __init__(self, detail: str = "External service error"):
-        super().__init__(status_code=503, detail=detail)
+    def __init__(self, detail: str = "External service error", retry_after: Optional[int] = None):
+        headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+        super().__init__(status_code=503, detail=detail, headers=headers)
+        self.retry_after = retry_after
+
+class DeadlineExceededError(CustomHTTPException):
+    """Request deadline expired before the work finished"""
+    def __init__(self, detail: str = "Request deadline exceeded"):
+        super().__init__(status_code=504, detail=detail)
+
+class ClientDisconnectedError(CustomHTTPException):
+    """Client went away before the response was ready (nginx's 499)"""
+    def __init__(self, detail: str = "Client closed request"):
+        super().__init__(status_code=499, detail=detail)
 
 def setup_exception_handlers(app: FastAPI):
     """Setup exception handlers for the FastAPI app"""
@@ -54,7 +71,8 @@ def setup_exception_handlers(app: FastAPI):
                 "error": True,
                 "message": exc.detail,
                 "status_code": exc.status_code
-            }
+            },
+            headers=exc.headers
         )
     
     @app.exception_handler(StarletteHTTPException)
@@ -66,7 +84,8 @@ def setup_exception_handlers(app: FastAPI):
                 "error": True,
                 "message": exc.detail,
                 "status_code": exc.status_code
-            }
+            },
+            headers=getattr(exc, "headers", None)
         )
     
     @app.exception_handler(RequestValidationError)
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class InvalidationBus:
+    """Carries cache invalidations to the other workers over Redis pub/sub.
+
+    Callers drop their own entries and publish the key; every other
+    subscribed worker runs the topic's handler for it. Messages published
+    while a worker isn't subscribed are lost, so a worker clears its
+    caches whenever it (re)subscribes, and caches that depend on the bus
+    cap their entries at AUTH_CACHE_UNSHARED_TTL_SECONDS (via ttl()) when
+    it is not connected.
+    """
+
+    def __init__(self, channel: str = "cache-invalidation"):
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self.shared = False
+        self._redis = None
+        self._handlers: Dict[str, Tuple[Callable[[str], None], Callable[[], None]]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._sends: Set[asyncio.Task] = set()
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    def subscribe(self, topic: str, on_key: Callable[[str], None], on_reset: Callable[[], None]):
+        """Handle a topic: on_key drops one entry, on_reset drops everything"""
+        self._handlers[topic] = (on_key, on_reset)
+
+    def unsubscribe(self, topic: str):
+        self._handlers.pop(topic, None)
+
+    def ttl(self, ttl: float) -> float:
+        """Cache TTL for an entry other workers may need to invalidate"""
+        if self.shared:
+            return ttl
+        return min(ttl, settings.AUTH_CACHE_UNSHARED_TTL_SECONDS)
+
+    def publish(self, topic: str, key: str):
+        """Tell the other workers to drop `key`; the caller drops its own copy"""
+        if self._redis is None:
+            return
+        message = json.dumps({"origin": self.origin, "topic": topic, "key": key})
+        task = asyncio.get_running_loop().create_task(self._send(message))
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+
+    async def _send(self, message: str):
+        try:
+            await self._redis.publish(self.channel, message)
+            self.published += 1
+        except Exception as e:
+            logger.error(f"Cache invalidation publish failed: {str(e)}")
+            self.errors += 1
+
+    def _reset(self):
+        for _, on_reset in list(self._handlers.values()):
+            on_reset()
+
+    def _dispatch(self, data: bytes):
+        message = json.loads(data)
+        if message["origin"] == self.origin:
+            return
+        self.received += 1
+        handlers = self._handlers.get(message["topic"])
+        if handlers:
+            handlers[0](message["key"])
+
+    async def _listen(self):
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                # Anything published while we weren't listening was missed
+                self._reset()
+                self.shared = True
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self._dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cache invalidation subscription failed: {str(e)}")
+                self.errors += 1
+            finally:
+                self.shared = False
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+            await asyncio.sleep(1)
+
+    def start(self):
+        """Subscribe to invalidations from other workers (called from the app lifespan)"""
+        if self._listener is not None:
+            return
+        if not settings.REDIS_URL:
+            return
+        if aioredis is None:
+            logger.warning("REDIS_URL is set but redis is not installed; cache invalidations stay local")
+            return
+        self._redis = aioredis.from_url(settings.REDIS_URL)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        """Stop listening and wait for queued publishes"""
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._sends:
+            await asyncio.gather(*self._sends, return_exceptions=True)
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "shared": self.shared,
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors
+        }
+
+# Global instance
+invalidation_bus = InvalidationBus()
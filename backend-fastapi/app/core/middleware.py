@@ -1,10 +1,10 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 import time
 import logging
-from typing import Callable
 
 from app.core.config import settings
 
@@ -28,33 +28,61 @@ def setup_middleware(app: FastAPI):
         allowed_hosts=["localhost", "127.0.0.1", "*.neon.tech"]
     )
     
-    # Request logging middleware
-    @app.middleware("http")
-    async def log_requests(request: Request, call_next: Callable):
-        start_time = time.time()
+    # Plain ASGI middleware rather than @app.middleware("http"): the
+    # BaseHTTPMiddleware wrapper hides http.disconnect from the routes,
+    # which rely on it to cancel provider calls for departed clients
+    app.add_middleware(RequestLoggingMiddleware)
+    app.add_middleware(SecurityHeadersMiddleware)
+
+class RequestLoggingMiddleware:
+    """Log method, path, status and time for every HTTP request"""
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # Process request
-        response = await call_next(request)
+        start_time = time.time()
+        status_code = 500
         
-        # Log request details
-        process_time = time.time() - start_time
-        logger.info(
-            f"{request.method} {request.url.path} - "
-            f"Status: {response.status_code} - "
-            f"Time: {process_time:.4f}s"
-        )
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
         
-        return response
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # Log request details
+            process_time = time.time() - start_time
+            logger.info(
+                f"{scope['method']} {scope['path']} - "
+                f"Status: {status_code} - "
+                f"Time: {process_time:.4f}s"
+            )
+
+class SecurityHeadersMiddleware:
+    """Add security headers to every HTTP response"""
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
     
-    # Security headers middleware
-    @app.middleware("http")
-    async def add_security_headers(request: Request, call_next: Callable):
-        response = await call_next(request)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
         
-        # Add security headers
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-Content-Type-Options"] = "nosniff"
+                headers["X-Frame-Options"] = "DENY"
+                headers["X-XSS-Protection"] = "1; mode=block"
+                headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+            await send(message)
         
-        return response
\ No newline at end of file
+        await self.app(scope, receive, send_with_headers)
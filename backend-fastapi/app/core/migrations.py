@@ -0,0 +1,146 @@
+import asyncio
+from sqlalchemy import inspect, select, and_, func
+from sqlalchemy.engine import Connection
+from sqlalchemy.schema import CreateIndex
+import logging
+
+from app.core.database import async_session_factory, engine, Base, AiMessage, UsageTracking, UsageMonthly
+from app.services.blob_store import blob_store
+from app.services.usage_service import rollup_upsert
+
+logger = logging.getLogger(__name__)
+
+def add_missing_columns(conn: Connection):
+    """Add columns and indexes that exist on the models but not yet in the database.
+    
+    create_all only creates missing tables; this covers nullable columns
+    and named indexes added to existing tables. Run inside engine.begin()
+    via run_sync.
+    """
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+            logger.info(f"Added column {table.name}.{column.name}")
+        
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                conn.execute(CreateIndex(index))
+                logger.info(f"Added index {index.name}")
+
+async def backfill_screen_captures(batch_size: int = 100) -> int:
+    """Move inline base64 captures from ai_messages into the blob store.
+    
+    Each batch stores the captures, sets screen_context_ref and clears
+    screen_context, then commits, so the job can be stopped and resumed.
+    Undecodable captures are logged and left as they are (with no ref).
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(add_missing_columns)
+    
+    migrated = 0
+    last_id = ""
+    while True:
+        async with async_session_factory() as session:
+            # Walk by id so skipped rows are not selected again
+            result = await session.execute(
+                select(AiMessage)
+                .where(and_(
+                    AiMessage.id > last_id,
+                    AiMessage.screen_context.isnot(None),
+                    AiMessage.screen_context_ref.is_(None)
+                ))
+                .order_by(AiMessage.id)
+                .limit(batch_size)
+            )
+            messages = result.scalars().all()
+            if not messages:
+                break
+            
+            for message in messages:
+                try:
+                    message.screen_context_ref = await blob_store.put_base64(message.screen_context)
+                except ValueError:
+                    logger.error(f"Skipping undecodable capture on message {message.id}")
+                    message.screen_context_ref = None
+                    continue
+                message.screen_context = None
+                migrated += 1
+            
+            await session.commit()
+            last_id = messages[-1].id
+            logger.info(f"Migrated {migrated} screen captures")
+    
+    return migrated
+
+async def backfill_usage_rollup(batch_size: int = 1000) -> int:
+    """Rebuild usage_monthly from usage_tracking.
+    
+    Totals are recomputed with one grouped scan and written with replace
+    semantics, so the job is idempotent. Events tracked while it runs may
+    be overwritten by the scan's snapshot; run it before taking traffic,
+    or re-run it once traffic is quiet.
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(add_missing_columns)
+    
+    async with async_session_factory() as session:
+        result = await session.execute(
+            select(
+                UsageTracking.user_id,
+                UsageTracking.year,
+                UsageTracking.month,
+                UsageTracking.action_type,
+                func.count(UsageTracking.id),
+                func.coalesce(func.sum(UsageTracking.quantity), 0)
+            )
+            .group_by(UsageTracking.user_id, UsageTracking.year, UsageTracking.month, UsageTracking.action_type)
+        )
+        rows = [
+            {
+                "user_id": user_id,
+                "year": year,
+                "month": month,
+                "action_type": action_type,
+                "count": count,
+                "quantity_sum": quantity_sum
+            }
+            for user_id, year, month, action_type, count, quantity_sum in result.all()
+        ]
+        
+        for start in range(0, len(rows), batch_size):
+            await session.execute(rollup_upsert(session, rows[start:start + batch_size], replace=True))
+            await session.commit()
+            logger.info(f"Wrote {min(start + batch_size, len(rows))} of {len(rows)} usage rollup rows")
+    
+    return len(rows)
+
+async def ensure_usage_rollup() -> int:
+    """Backfill usage_monthly at startup if it is empty but usage_tracking is not.
+    
+    Quota checks read only the rollup, so a fresh rollup table would
+    otherwise let every user start the month at zero. Returns the number
+    of rollup rows written (0 when nothing was needed).
+    """
+    async with async_session_factory() as session:
+        has_rollup = (await session.execute(select(UsageMonthly.user_id).limit(1))).first()
+        has_usage = (await session.execute(select(UsageTracking.id).limit(1))).first()
+    if has_rollup or not has_usage:
+        return 0
+    
+    logger.info("usage_monthly is empty; backfilling it from usage_tracking")
+    return await backfill_usage_rollup()
+
+if __name__ == "__main__":
+    asyncio.run(backfill_screen_captures())
@@ -0,0 +1 @@
+# Development tools module
\ No newline at end of file
@@ -0,0 +1,283 @@
+import asyncio
+import base64
+import json
+import math
+import random
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+WORDS = (
+    "the screen shows a code editor with a failing test and the terminal output suggests "
+    "that the function returns early before the value is assigned so check the branch "
+    "above and consider adding a guard clause then rerun the suite to confirm"
+).split()
+
+class StubConfig(BaseModel):
+    latency_ms: float = Field(default=300.0, description="Median time to first token")
+    latency_sigma: float = Field(default=0.5, description="Log-normal spread of the latency (0 = fixed)")
+    tokens_per_second: float = Field(default=50.0, description="Generation speed after the first token")
+    response_tokens: int = Field(default=120, description="Mean response length in tokens")
+    error_rate: float = Field(default=0.0, description="Fraction of requests that fail")
+    error_statuses: List[int] = Field(default=[429, 500, 503], description="Statuses failed requests pick from")
+    stall_rate: float = Field(default=0.0, description="Fraction of requests that stall")
+    stall_seconds: float = Field(default=30.0, description="How long a stalled request hangs")
+    seed: Optional[int] = Field(default=None, description="Random seed for reproducible runs")
+
+class ResponsePlan:
+    """What the stub will do for one request, drawn up front from the seeded RNG"""
+
+    def __init__(self, config: StubConfig, rng: random.Random):
+        self.latency = config.latency_ms / 1000 * math.exp(rng.gauss(0, config.latency_sigma))
+        self.tokens = max(1, int(rng.expovariate(1 / config.response_tokens)))
+        self.error_status = rng.choice(config.error_statuses) if rng.random() < config.error_rate else None
+        self.stall_at = rng.randrange(self.tokens) if rng.random() < config.stall_rate else None
+        self.token_delay = 1 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+        self.words = [rng.choice(WORDS) for _ in range(self.tokens)]
+
+def _prompt_tokens(payload: Any) -> int:
+    return (len(json.dumps(payload)) + 3) // 4
+
+def _images(payload: Any) -> List[bytes]:
+    """Decoded images in a request: OpenAI data URLs, Anthropic base64 sources, Gemini inlineData"""
+    found = []
+    if isinstance(payload, dict):
+        image_url = payload.get("image_url")
+        if isinstance(image_url, dict) and image_url.get("url", "").startswith("data:"):
+            found.append(base64.b64decode(image_url["url"].split(",", 1)[1]))
+        if payload.get("type") == "base64" and "data" in payload:
+            found.append(base64.b64decode(payload["data"]))
+        if "inlineData" in payload:
+            found.append(base64.b64decode(payload["inlineData"]["data"]))
+        for value in payload.values():
+            found.extend(_images(value))
+    elif isinstance(payload, list):
+        for value in payload:
+            found.extend(_images(value))
+    return found
+
+def _sse(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+def create_app(config: StubConfig) -> FastAPI:
+    """Local stand-in for the OpenAI, Anthropic and Gemini APIs.
+    
+    Speaks enough of each wire protocol (plain and streaming) for AIService
+    to run against it unchanged. Point OPENAI_BASE_URL, CLAUDE_BASE_URL and
+    GEMINI_BASE_URL at it (any API key works) to benchmark or load-test
+    /api/ask offline.
+    """
+    app = FastAPI(title="Stub LLM Server")
+    rng = random.Random(config.seed)
+    stats = {"requests": 0, "errors": 0, "stalls": 0, "streams": 0, "tokens": 0, "images": 0, "image_bytes": 0}
+    # Last API key each provider endpoint was called with
+    api_keys: Dict[str, str] = {}
+
+    def record_key(provider: str, request: Request):
+        authorization = request.headers.get("authorization", "")
+        api_keys[provider] = (
+            authorization.removeprefix("Bearer ")
+            or request.headers.get("x-api-key")
+            or request.query_params.get("key", "")
+        )
+
+    def plan(stream: bool, payload: Any = None) -> ResponsePlan:
+        stats["requests"] += 1
+        stats["streams"] += stream
+        images = _images(payload)
+        stats["images"] += len(images)
+        stats["image_bytes"] += sum(len(image) for image in images)
+        drawn = ResponsePlan(config, rng)
+        stats["errors"] += drawn.error_status is not None
+        stats["stalls"] += drawn.stall_at is not None
+        stats["tokens"] += drawn.tokens if drawn.error_status is None else 0
+        return drawn
+
+    async def generate(drawn: ResponsePlan) -> AsyncIterator[str]:
+        """Yield words at the configured rate, stalling if the plan says so"""
+        await asyncio.sleep(drawn.latency)
+        for index, word in enumerate(drawn.words):
+            if index == drawn.stall_at:
+                await asyncio.sleep(config.stall_seconds)
+            if index:
+                await asyncio.sleep(drawn.token_delay)
+            yield word if index == 0 else " " + word
+
+    async def complete(drawn: ResponsePlan) -> str:
+        return "".join([word async for word in generate(drawn)])
+
+    def error_response(status: int, body: Dict[str, Any]) -> JSONResponse:
+        headers = {"Retry-After": "1"} if status == 429 else None
+        return JSONResponse(status_code=status, content=body, headers=headers)
+
+    def streaming(body: AsyncIterator[str]) -> StreamingResponse:
+        return StreamingResponse(body, media_type="text/event-stream")
+
+    @app.get("/__stub/stats")
+    async def get_stats():
+        return {**stats, "api_keys": api_keys, "config": config.model_dump()}
+
+    # OpenAI: POST /v1/chat/completions
+    @app.post("/v1/chat/completions")
+    async def openai_chat(request: Request):
+        record_key("openai", request)
+        payload = await request.json()
+        model = payload.get("model", "gpt-3.5-turbo")
+        stream = bool(payload.get("stream"))
+        drawn = plan(stream, payload)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if drawn.error_status:
+            await asyncio.sleep(drawn.latency)
+            return error_response(drawn.error_status, {
+                "error": {"message": "Injected stub failure", "type": "server_error", "code": None}
+            })
+
+        if not stream:
+            text = await complete(drawn)
+            prompt_tokens = _prompt_tokens(payload.get("messages"))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": drawn.tokens,
+                    "total_tokens": prompt_tokens + drawn.tokens
+                }
+            }
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> str:
+            return _sse({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            })
+
+        async def body():
+            yield chunk({"role": "assistant", "content": ""})
+            async for word in generate(drawn):
+                yield chunk({"content": word})
+            yield chunk({}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return streaming(body())
+
+    # Anthropic: POST /v1/messages
+    @app.post("/v1/messages")
+    async def anthropic_messages(request: Request):
+        record_key("claude", request)
+        payload = await request.json()
+        model = payload.get("model", "claude-3-sonnet-20240229")
+        stream = bool(payload.get("stream"))
+        drawn = plan(stream, payload)
+        message_id = f"msg_{uuid.uuid4().hex}"
+        input_tokens = _prompt_tokens(payload.get("messages"))
+
+        if drawn.error_status:
+            await asyncio.sleep(drawn.latency)
+            error_type = "rate_limit_error" if drawn.error_status == 429 else "api_error"
+            return error_response(drawn.error_status, {
+                "type": "error", "error": {"type": error_type, "message": "Injected stub failure"}
+            })
+
+        if not stream:
+            text = await complete(drawn)
+            return {
+                "id": message_id,
+                "type": "message",
+                "role": "assistant",
+                "model": model,
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn",
+                "stop_sequence": None,
+                "usage": {"input_tokens": input_tokens, "output_tokens": drawn.tokens}
+            }
+
+        async def body():
+            yield _sse({
+                "type": "message_start",
+                "message": {
+                    "id": message_id,
+                    "type": "message",
+                    "role": "assistant",
+                    "model": model,
+                    "content": [],
+                    "stop_reason": None,
+                    "stop_sequence": None,
+                    "usage": {"input_tokens": input_tokens, "output_tokens": 1}
+                }
+            }, "message_start")
+            yield _sse({
+                "type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}
+            }, "content_block_start")
+            yield _sse({"type": "ping"}, "ping")
+            async for word in generate(drawn):
+                yield _sse({
+                    "type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": word}
+                }, "content_block_delta")
+            yield _sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+            yield _sse({
+                "type": "message_delta",
+                "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                "usage": {"output_tokens": drawn.tokens}
+            }, "message_delta")
+            yield _sse({"type": "message_stop"}, "message_stop")
+
+        return streaming(body())
+
+    # Gemini: POST /v1beta/models/{model}:generateContent and :streamGenerateContent
+    @app.post("/v1beta/models/{model_method}")
+    async def gemini_generate(model_method: str, request: Request):
+        record_key("gemini", request)
+        payload = await request.json()
+        _, _, method = model_method.partition(":")
+        stream = method == "streamGenerateContent"
+        drawn = plan(stream, payload)
+        prompt_tokens = _prompt_tokens(payload.get("contents"))
+
+        if drawn.error_status:
+            await asyncio.sleep(drawn.latency)
+            status_names = {429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE"}
+            return error_response(drawn.error_status, {
+                "error": {
+                    "code": drawn.error_status,
+                    "message": "Injected stub failure",
+                    "status": status_names.get(drawn.error_status, "UNKNOWN")
+                }
+            })
+
+        def candidate(text: str, finish_reason: Optional[str] = None) -> Dict[str, Any]:
+            result = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+            if finish_reason:
+                result["finishReason"] = finish_reason
+            return result
+
+        usage = {
+            "promptTokenCount": prompt_tokens,
+            "candidatesTokenCount": drawn.tokens,
+            "totalTokenCount": prompt_tokens + drawn.tokens
+        }
+
+        if not stream:
+            text = await complete(drawn)
+            return {"candidates": [candidate(text, "STOP")], "usageMetadata": usage}
+
+        async def body():
+            async for word in generate(drawn):
+                yield _sse({"candidates": [candidate(word)]})
+            yield _sse({"candidates": [candidate("", "STOP")], "usageMetadata": usage})
+
+        return streaming(body())
+
+    return app
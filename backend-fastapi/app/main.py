@@ -13,6 +13,13 @@ from app.core.database import engine, Base
 from app.api.routes import auth, user, ask, plan, track, checkout, admin
 from app.core.exceptions import setup_exception_handlers
 from app.core.middleware import setup_middleware
+from app.core.migrations import add_missing_columns, ensure_usage_rollup
+from app.core.invalidation import invalidation_bus
+from app.auth.neon_auth import neon_auth_service
+from app.services.ai_service import ai_service
+from app.services.image_service import image_service
+from app.services.job_service import job_service
+from app.services.usage_service import usage_service
 
 # Load environment variables
 load_dotenv()
@@ -23,8 +30,21 @@ async def lifespan(app: FastAPI):
     # Startup
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(add_missing_columns)
+    await ensure_usage_rollup()
+    invalidation_bus.start()
+    await neon_auth_service.startup()
+    await ai_service.startup()
+    usage_service.start()
+    job_service.start()
     yield
     # Shutdown
+    await job_service.stop()
+    await usage_service.stop()
+    await neon_auth_service.shutdown()
+    await invalidation_bus.stop()
+    await ai_service.shutdown()
+    image_service.shutdown()
     await engine.dispose()
 
 # Initialize FastAPI app
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, HttpUrl
 from typing import Optional, Dict, Any, List
 from datetime import datetime
 from enum import Enum
@@ -10,6 +10,13 @@ class AskRequest(BaseModel):
     session_id: Optional[str] = Field(None, description="Session ID for conversation context")
     provider: str = Field(default="gemini", description="AI provider to use")
     model: Optional[str] = Field(None, description="Specific model to use")
+    use_cache: bool = Field(default=True, description="Allow serving an identical earlier ask from the response cache")
+
+class AskJobRequest(AskRequest):
+    callback_url: Optional[HttpUrl] = Field(None, description="URL the finished job is POSTed to")
+
+class AskBatchRequest(BaseModel):
+    items: List[AskRequest] = Field(..., min_length=1, description="Independent asks to run concurrently")
 
 class UserUpdateRequest(BaseModel):
     display_name: Optional[str] = Field(None, description="User's display name")
@@ -25,6 +32,13 @@ class TrackingRequest(BaseModel):
     quantity: int = Field(default=1, description="Quantity of resource used")
     metadata: Optional[Dict[str, Any]] = Field(None, description="Additional metadata")
 
+class TrackingBatchItem(TrackingRequest):
+    client_event_id: str = Field(..., min_length=1, max_length=64, description="Client-generated idempotency id")
+    occurred_at: Optional[datetime] = Field(None, description="When the event happened on the client")
+
+class TrackingBatchRequest(BaseModel):
+    items: List[TrackingBatchItem] = Field(..., min_length=1, description="Events buffered by the client")
+
 class CheckoutRequest(BaseModel):
     plan_type: str = Field(..., description="Plan type to purchase")
     billing_period: str = Field(default="monthly", description="Billing period (monthly, yearly)")
@@ -98,6 +98,7 @@ class AiMessageResponse(BaseModel):
     prompt: str
     response: str
     screen_context: Optional[str] = None
+    screen_context_ref: Optional[str] = None
     audio_transcript: Optional[str] = None
     ai_provider: str
     model_used: str
@@ -128,6 +129,28 @@ class AskResponse(BaseModel):
     tokens_used: int = Field(..., description="Tokens consumed")
     session_id: str = Field(..., description="Session ID")
     message_id: str = Field(..., description="Message ID")
+    cached: bool = Field(default=False, description="Whether the response was served from cache")
+
+class AskJobResponse(BaseModel):
+    job_id: str = Field(..., description="Job ID")
+    status: str = Field(..., description="queued, running, succeeded or failed")
+    attempts: int = Field(..., description="Attempts made so far")
+    result: Optional[AskResponse] = Field(None, description="AI response, once succeeded")
+    error: Optional[str] = Field(None, description="Last error, if any")
+    created_at: Optional[datetime] = Field(None, description="When the job was submitted")
+    completed_at: Optional[datetime] = Field(None, description="When the job finished")
+
+class AskBatchItemResult(BaseModel):
+    index: int = Field(..., description="Position of the item in the request")
+    success: bool = Field(..., description="Whether the ask succeeded")
+    result: Optional[AskResponse] = Field(None, description="AI response, if successful")
+    error: Optional[str] = Field(None, description="Error message, if failed")
+    status_code: Optional[int] = Field(None, description="HTTP status the ask would have failed with")
+
+class AskBatchResponse(BaseModel):
+    results: List[AskBatchItemResult] = Field(..., description="Per-item results, in request order")
+    succeeded: int = Field(..., description="Number of successful asks")
+    failed: int = Field(..., description="Number of failed asks")
 
 class UsageResponse(BaseModel):
     asks_used: int = Field(..., description="Number of asks used this month")
@@ -1,14 +1,21 @@
+import asyncio
 import json
-from typing import Optional, Dict, Any, List
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import Optional, Dict, Any, List, Callable, Awaitable, AsyncIterator
 from datetime import datetime
 import logging
 import base64
 import os
+import anyio
+import httpx
+from sqlalchemy import select, and_
 
 # AI Provider imports
 try:
     import openai
-    from openai import OpenAI
+    from openai import AsyncOpenAI
 except ImportError:
     openai = None
 
@@ -18,12 +25,17 @@ except ImportError:
     genai = None
 
 try:
-    from anthropic import Anthropic
+    from anthropic import AsyncAnthropic
 except ImportError:
-    Anthropic = None
+    AsyncAnthropic = None
 
 from app.core.config import settings
-from app.core.exceptions import ExternalServiceError
+from app.core.database import async_session_factory, ApiKey
+from app.core.exceptions import ExternalServiceError, DeadlineExceededError
+from app.services.encryption_service import encryption_service
+from app.services.response_cache import response_cache
+from app.services.resilience import CircuitBreaker, AdaptiveLimiter
+from app.services.gemini_rest import GeminiRestModel
 
 logger = logging.getLogger(__name__)
 
@@ -32,37 +44,295 @@ class AIService:
     
     def __init__(self):
         self.providers = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.limiters: Dict[str, AdaptiveLimiter] = {}
+        self._latencies: Dict[str, deque] = {}
+        self.routing_counters = {"served": {}, "fallbacks": 0, "hedges": 0}
+        self._http_client = self._build_http_client()
+        self._credential_versions: Dict[str, int] = {}
+        self._credentials_task: Optional[asyncio.Task] = None
         self._initialize_providers()
     
+    def _build_http_client(self) -> httpx.AsyncClient:
+        """Connection pool shared by the OpenAI and Anthropic clients"""
+        return httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.AI_HTTP_MAX_KEEPALIVE_CONNECTIONS
+            ),
+            timeout=httpx.Timeout(
+                settings.AI_PROVIDER_TIMEOUT_SECONDS,
+                connect=settings.AI_HTTP_CONNECT_TIMEOUT_SECONDS
+            )
+        )
+    
+    def _settings_keys(self) -> Dict[str, Optional[str]]:
+        """API keys from the environment, used when no api_keys row overrides them"""
+        return {
+            "openai": settings.OPENAI_API_KEY,
+            "gemini": settings.GEMINI_API_KEY,
+            "claude": settings.CLAUDE_API_KEY
+        }
+    
+    def _build_provider(self, provider: str, api_key: str) -> Any:
+        """Create a client for one provider, or None if its SDK is missing"""
+        if provider == "openai" and openai:
+            # No SDK retries: failover and the circuit breaker decide what happens next
+            return AsyncOpenAI(
+                api_key=api_key,
+                base_url=settings.OPENAI_BASE_URL,
+                http_client=self._http_client,
+                max_retries=0
+            )
+        if provider == "gemini":
+            if settings.GEMINI_BASE_URL:
+                return GeminiRestModel(self._http_client, settings.GEMINI_BASE_URL, api_key)
+            if genai:
+                # The SDK keeps its key globally; models created afterwards use the new one
+                genai.configure(api_key=api_key)
+                return genai.GenerativeModel('gemini-pro')
+        if provider == "claude" and AsyncAnthropic:
+            return AsyncAnthropic(
+                api_key=api_key,
+                base_url=settings.CLAUDE_BASE_URL,
+                http_client=self._http_client,
+                max_retries=0
+            )
+        return None
+    
+    def _ensure_guards(self, provider: str):
+        """Create the provider's circuit breaker and concurrency limiter once"""
+        if provider not in self.breakers:
+            self.breakers[provider] = CircuitBreaker(
+                provider,
+                window_size=settings.AI_BREAKER_WINDOW_SIZE,
+                min_calls=settings.AI_BREAKER_MIN_CALLS,
+                failure_rate_threshold=settings.AI_BREAKER_FAILURE_RATE,
+                slow_call_seconds=settings.AI_BREAKER_SLOW_CALL_SECONDS,
+                open_seconds=settings.AI_BREAKER_OPEN_SECONDS
+            )
+        if provider not in self.limiters:
+            self.limiters[provider] = AdaptiveLimiter(
+                initial_limit=settings.AI_LIMITER_INITIAL_LIMIT or settings.AI_PROVIDER_MAX_CONCURRENCY,
+                min_limit=settings.AI_LIMITER_MIN_LIMIT,
+                max_limit=settings.AI_PROVIDER_MAX_CONCURRENCY,
+                latency_target=settings.AI_LIMITER_LATENCY_TARGET_SECONDS,
+                backoff_ratio=settings.AI_LIMITER_BACKOFF_RATIO
+            )
+    
     def _initialize_providers(self):
         """Initialize available AI providers"""
-        
-        # OpenAI
-        if openai and settings.OPENAI_API_KEY:
+        for provider, api_key in self._settings_keys().items():
+            if not api_key:
+                continue
             try:
-                self.providers["openai"] = OpenAI(api_key=settings.OPENAI_API_KEY)
-                logger.info("OpenAI provider initialized")
+                client = self._build_provider(provider, api_key)
+                if client:
+                    self.providers[provider] = client
+                    self._ensure_guards(provider)
+                    logger.info(f"{provider} provider initialized")
             except Exception as e:
-                logger.error(f"Failed to initialize OpenAI: {str(e)}")
+                logger.error(f"Failed to initialize {provider}: {str(e)}")
         
-        # Gemini
-        if genai and settings.GEMINI_API_KEY:
-            try:
-                genai.configure(api_key=settings.GEMINI_API_KEY)
-                self.providers["gemini"] = genai.GenerativeModel('gemini-pro')
-                logger.info("Gemini provider initialized")
-            except Exception as e:
-                logger.error(f"Failed to initialize Gemini: {str(e)}")
+        logger.info(f"Initialized AI providers: {list(self.providers.keys())}")
+    
+    async def refresh_credentials(self):
+        """Apply API keys added or rotated in the api_keys table.
+        
+        Each check reads only provider, version and is_active. A key is
+        fetched and decrypted only when its version changes, and the new
+        providers dict is swapped in with one assignment, so in-flight calls
+        finish on the client they started with. All clients share one
+        connection pool, so nothing has to be drained.
+        """
+        async with async_session_factory() as db:
+            rows = await db.execute(select(ApiKey.provider, ApiKey.version, ApiKey.is_active))
+            versions = {provider: version or 0 for provider, version, is_active in rows.all() if is_active}
+            changed = {
+                provider for provider in set(versions) | set(self._credential_versions)
+                if versions.get(provider) != self._credential_versions.get(provider)
+            }
+            if not changed:
+                return
+            
+            keys_result = await db.execute(
+                select(ApiKey.provider, ApiKey.encrypted_key).where(
+                    and_(ApiKey.provider.in_(changed), ApiKey.is_active == True)
+                )
+            )
+            keys = {
+                provider: encryption_service.decrypt(encrypted_key)
+                for provider, encrypted_key in keys_result.all()
+            }
         
-        # Claude
-        if Anthropic and settings.CLAUDE_API_KEY:
+        providers = dict(self.providers)
+        for provider in changed:
+            # A removed or deactivated row falls back to the environment key
+            api_key = keys.get(provider) or self._settings_keys().get(provider)
+            client = self._build_provider(provider, api_key) if api_key else None
+            if client:
+                self._ensure_guards(provider)
+                providers[provider] = client
+            else:
+                providers.pop(provider, None)
+        
+        self.providers = providers
+        self._credential_versions = versions
+        logger.info(f"Reloaded AI credentials for {sorted(changed)}")
+    
+    async def _credentials_loop(self):
+        while True:
+            await asyncio.sleep(settings.AI_CREDENTIALS_REFRESH_SECONDS)
             try:
-                self.providers["claude"] = Anthropic(api_key=settings.CLAUDE_API_KEY)
-                logger.info("Claude provider initialized")
+                await self.refresh_credentials()
             except Exception as e:
-                logger.error(f"Failed to initialize Claude: {str(e)}")
+                logger.error(f"Error refreshing AI credentials: {str(e)}")
+    
+    async def startup(self):
+        """Load API keys from the database and start watching for rotations"""
+        try:
+            await self.refresh_credentials()
+        except Exception as e:
+            logger.error(f"Error loading AI credentials: {str(e)}")
+        self._credentials_task = asyncio.create_task(self._credentials_loop())
+    
+    async def shutdown(self):
+        """Stop watching credentials and close the shared provider connection pool"""
+        if self._credentials_task:
+            self._credentials_task.cancel()
+        await self._http_client.aclose()
+        if response_cache:
+            await response_cache.close()
+    
+    async def _admit(self, provider: str) -> Optional[int]:
+        """Pass the provider's circuit breaker, then wait (bounded) for a concurrency slot.
         
-        logger.info(f"Initialized AI providers: {list(self.providers.keys())}")
+        Returns the breaker's probe token for _settle.
+        """
+        probe = self.breakers[provider].before_call()
+        try:
+            acquired = await self.limiters[provider].acquire(settings.AI_LIMITER_QUEUE_TIMEOUT_SECONDS)
+        except BaseException:
+            self.breakers[provider].record_cancelled(probe)
+            raise
+        if not acquired:
+            self.breakers[provider].record_cancelled(probe)
+            raise ExternalServiceError(
+                f"AI provider '{provider}' is at its concurrency limit",
+                retry_after=1
+            )
+        return probe
+    
+    def _settle(
+        self,
+        provider: str,
+        probe: Optional[int],
+        error: Optional[BaseException],
+        started: float,
+        latency: float
+    ):
+        """Feed a finished call's outcome to the breaker and limiter"""
+        if isinstance(error, asyncio.CancelledError):
+            self.breakers[provider].record_cancelled(probe)
+            self.limiters[provider].release_cancelled()
+            return
+        
+        # Rejected requests (bad model, invalid input) say nothing about provider health
+        status_code = getattr(error, "status_code", None)
+        if error is not None and status_code and 400 <= status_code < 500 and status_code != 429:
+            error = None
+        
+        success = error is None
+        self.breakers[provider].record(success, latency, probe)
+        self.limiters[provider].release(success, latency, started)
+    
+    async def _call_provider(
+        self,
+        provider: str,
+        call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        """Run a provider call under its breaker, concurrency limit and timeout"""
+        probe = await self._admit(provider)
+        started = time.monotonic()
+        error = None
+        try:
+            return await asyncio.wait_for(call(), settings.AI_PROVIDER_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError as e:
+            error = e
+            raise ExternalServiceError(
+                f"{provider} did not respond within {settings.AI_PROVIDER_TIMEOUT_SECONDS:g}s"
+            )
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._settle(provider, probe, error, started, time.monotonic() - started)
+    
+    async def _stream_provider(
+        self,
+        provider: str,
+        open_stream: Callable[[], Awaitable[Any]]
+    ) -> AsyncIterator[Any]:
+        """Iterate a provider stream under its breaker and concurrency limit.
+        
+        The timeout applies to opening the stream and to each gap between
+        chunks, so a stalled stream fails instead of hanging. Latency fed to
+        the breaker and limiter is the time to the first chunk.
+        """
+        timeout = settings.AI_PROVIDER_TIMEOUT_SECONDS
+        probe = await self._admit(provider)
+        started = time.monotonic()
+        first_chunk_latency = None
+        error = None
+        stream = None
+        try:
+            stream = await asyncio.wait_for(open_stream(), timeout)
+            iterator = stream.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+                except StopAsyncIteration:
+                    break
+                if first_chunk_latency is None:
+                    first_chunk_latency = time.monotonic() - started
+                yield chunk
+        except asyncio.TimeoutError as e:
+            error = e
+            raise ExternalServiceError(f"{provider} stream stalled for more than {timeout:g}s")
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if isinstance(error, GeneratorExit):
+                # Consumer stopped reading (e.g. client disconnected)
+                error = asyncio.CancelledError()
+            if stream is not None:
+                # Hang up on the provider so it stops generating and the connection goes back to the pool
+                try:
+                    await self._close_stream(stream)
+                except Exception as e:
+                    logger.warning(f"Error closing {provider} stream: {str(e)}")
+            latency = first_chunk_latency if first_chunk_latency is not None else time.monotonic() - started
+            self._settle(provider, probe, error, started, latency)
+    
+    @staticmethod
+    async def _close_stream(stream: Any):
+        """Close an SDK stream's HTTP response, or a plain async generator"""
+        if hasattr(stream, "aclose"):
+            await stream.aclose()
+        elif getattr(stream, "response", None) is not None:
+            # openai/anthropic AsyncStream
+            await stream.response.aclose()
+    
+    def provider_health(self) -> Dict[str, Any]:
+        """Circuit breaker and concurrency limit state per provider"""
+        return {
+            provider: {
+                "breaker": self.breakers[provider].status(),
+                "limiter": self.limiters[provider].status()
+            }
+            for provider in self.providers
+        }
     
     def get_available_providers(self) -> List[str]:
         """Get list of available AI providers"""
@@ -75,7 +345,14 @@ class AIService:
         audio_transcript: Optional[str] = None,
         user_profile: Optional[Dict[str, Any]] = None,
         provider: str = "gemini",
-        model: Optional[str] = None
+        model: Optional[str] = None,
+        use_cache: bool = True,
+        plan: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        screen_context_ref: Optional[str] = None,
+        timeout: Optional[float] = None,
+        image: Optional[Dict[str, Any]] = None,
+        screen_description: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         Ask AI with context from screen, audio, and user profile
@@ -87,40 +364,344 @@ class AIService:
             user_profile: User's profile information
             provider: AI provider to use (openai, gemini, claude)
             model: Specific model to use (optional)
+            use_cache: Serve an identical earlier ask from the response cache
+            plan: User's plan type, selecting the provider fallback chain
+            history: Earlier turns of the session as user/assistant messages
+            screen_context_ref: Blob reference of the stored capture; keys the
+                response cache, so a deduplicated capture matches its earlier ask
+            timeout: Seconds left until the request's deadline; in-flight
+                provider calls are cancelled when it expires
+            image: The screen capture sent to the provider, as {"data": bytes,
+                "content_type": str}; asks without a model use the provider's
+                AI_VISION_MODELS entry
+            screen_description: Sent instead of an image for a capture that
+                repeats one the provider already answered about
         
         Returns:
-            Dict containing response, provider, model, and token usage
+            Dict containing response, the provider and model that served it,
+            token usage and whether it was served from cache (cache hits use
+            no tokens)
         """
         
-        if provider not in self.providers:
+        chain = self._provider_chain(provider, plan)
+        if not chain:
             raise ExternalServiceError(f"AI provider '{provider}' not available")
         
         try:
             # Build comprehensive prompt with context
             full_prompt = self._build_context_prompt(
-                prompt, screen_context, audio_transcript, user_profile
+                prompt, screen_context or image, audio_transcript, user_profile, screen_description
             )
             
-            # Get response from provider
-            if provider == "openai":
-                return await self._ask_openai(full_prompt, model)
-            elif provider == "gemini":
-                return await self._ask_gemini(full_prompt, model)
-            elif provider == "claude":
-                return await self._ask_claude(full_prompt, model)
-            else:
-                raise ExternalServiceError(f"Provider '{provider}' not supported")
+            cache_key = None
+            if use_cache and response_cache:
+                # Keyed on the capture itself, however it is sent
+                cache_key = response_cache.make_key(
+                    provider,
+                    model,
+                    self._build_context_prompt(
+                        prompt, screen_context or screen_context_ref or image, audio_transcript, user_profile
+                    ),
+                    screen_context_ref or screen_context,
+                    history
+                )
+                cached = await response_cache.get(cache_key)
+                if cached:
+                    return {**cached, "tokens_used": 0, "cached": True}
+            
+            # Get response from the first healthy provider in the chain
+            try:
+                result = await asyncio.wait_for(
+                    self._ask_with_failover(chain, full_prompt, model, history, image), timeout
+                )
+            except asyncio.TimeoutError:
+                raise DeadlineExceededError(f"AI request did not complete within {timeout:g}s")
+            
+            if cache_key:
+                await response_cache.set(cache_key, result)
+            
+            return {**result, "cached": False}
                 
+        except (ExternalServiceError, DeadlineExceededError):
+            raise
         except Exception as e:
             logger.error(f"Error in AI service: {str(e)}")
             raise ExternalServiceError(f"AI service error: {str(e)}")
     
+    def _provider_chain(self, provider: str, plan: Optional[str]) -> List[str]:
+        """Requested provider first, then the plan's fallbacks that are configured"""
+        fallbacks = settings.AI_PROVIDER_FALLBACK_CHAINS.get(plan, []) if plan else []
+        chain = []
+        for name in [provider, *fallbacks]:
+            if name in self.providers and name not in chain:
+                chain.append(name)
+        return chain
+    
+    def _hedge_delay(self, provider: str) -> Optional[float]:
+        """Recent p95 latency of a provider, once enough samples exist"""
+        samples = self._latencies.get(provider)
+        if not samples or len(samples) < settings.AI_HEDGING_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[int(len(ordered) * 0.95) - 1]
+    
+    async def _ask_provider(
+        self,
+        provider: str,
+        prompt: str,
+        model: Optional[str],
+        history: Optional[List[Dict[str, str]]] = None,
+        image: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Call one provider and record its latency on success"""
+        started = time.monotonic()
+        
+        if provider == "openai":
+            result = await self._ask_openai(prompt, model, history, image)
+        elif provider == "gemini":
+            result = await self._ask_gemini(prompt, model, history, image)
+        elif provider == "claude":
+            result = await self._ask_claude(prompt, model, history, image)
+        else:
+            raise ExternalServiceError(f"Provider '{provider}' not supported")
+        
+        self._latencies.setdefault(provider, deque(maxlen=200)).append(time.monotonic() - started)
+        return result
+    
+    async def _ask_with_failover(
+        self,
+        chain: List[str],
+        prompt: str,
+        model: Optional[str],
+        history: Optional[List[Dict[str, str]]] = None,
+        image: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Try providers in order until one succeeds.
+        
+        A failure moves on to the next provider. With hedging enabled, a
+        provider that has not answered within its recent p95 gets the next
+        provider raced against it; the first success wins and the other
+        call is cancelled. The requested model only applies to the first
+        provider, fallbacks use their defaults.
+        """
+        remaining = list(chain)
+        pending: Dict[asyncio.Task, str] = {}
+        errors = []
+        retry_afters = []
+        
+        def launch():
+            name = remaining.pop(0)
+            task = asyncio.create_task(
+                self._ask_provider(name, prompt, model if name == chain[0] else None, history, image)
+            )
+            pending[task] = name
+        
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if settings.AI_HEDGING_ENABLED and remaining and len(pending) == 1:
+                    timeout = self._hedge_delay(next(iter(pending.values())))
+                
+                done, _ = await asyncio.wait(
+                    pending.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                
+                if not done:
+                    self.routing_counters["hedges"] += 1
+                    launch()
+                    continue
+                
+                for task in done:
+                    name = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        logger.error(f"Provider {name} failed: {str(e)}")
+                        errors.append(f"{name}: {getattr(e, 'detail', None) or str(e)}")
+                        retry_afters.append(getattr(e, "retry_after", None))
+                        continue
+                    
+                    if name != chain[0]:
+                        self.routing_counters["fallbacks"] += 1
+                        logger.info(f"Ask for {chain[0]} served by {name}")
+                    served = self.routing_counters["served"]
+                    served[name] = served.get(name, 0) + 1
+                    return result
+                
+                if not pending and remaining:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+        
+        # If every provider is shedding load, tell the client when to come back
+        retry_after = min(retry_afters) if retry_afters and None not in retry_afters else None
+        raise ExternalServiceError(
+            f"All AI providers failed: {'; '.join(errors)}",
+            retry_after=retry_after
+        )
+    
+    def routing_stats(self) -> Dict[str, Any]:
+        """Which providers served requests, and their recent p95 latency"""
+        return {
+            **self.routing_counters,
+            "p95_seconds": {
+                provider: self._hedge_delay(provider) for provider in self.providers
+            }
+        }
+    
+    async def stream_ai(
+        self,
+        prompt: str,
+        screen_context: Optional[str] = None,
+        audio_transcript: Optional[str] = None,
+        user_profile: Optional[Dict[str, Any]] = None,
+        provider: str = "gemini",
+        model: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        timeout: Optional[float] = None,
+        image: Optional[Dict[str, Any]] = None,
+        screen_description: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Stream an AI response as it is generated
+        
+        Yields a "start" event with the provider and model, a "delta" event
+        per text chunk, and a final "done" event shaped like ask_ai's result.
+        `image` and `screen_description` are sent as in ask_ai.
+        If `timeout` seconds pass before the stream finishes, the provider
+        stream is cancelled and DeadlineExceededError is raised.
+        """
+        
+        if provider not in self.providers:
+            raise ExternalServiceError(f"AI provider '{provider}' not available")
+        
+        full_prompt = self._build_context_prompt(
+            prompt, screen_context or image, audio_transcript, user_profile, screen_description
+        )
+        
+        if provider == "openai":
+            stream = self._stream_openai(full_prompt, model, history, image)
+        elif provider == "gemini":
+            stream = self._stream_gemini(full_prompt, model, history, image)
+        elif provider == "claude":
+            stream = self._stream_claude(full_prompt, model, history, image)
+        else:
+            raise ExternalServiceError(f"Provider '{provider}' not supported")
+        
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        next_event: Optional[asyncio.Future] = None
+        try:
+            while True:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                next_event = asyncio.ensure_future(stream.__anext__())
+                done, _ = await asyncio.wait({next_event}, timeout=remaining)
+                if not done:
+                    raise DeadlineExceededError(f"AI stream did not complete within {timeout:g}s")
+                try:
+                    event = next_event.result()
+                except StopAsyncIteration:
+                    break
+                yield event
+        except (ExternalServiceError, DeadlineExceededError):
+            raise
+        except Exception as e:
+            logger.error(f"Error in AI stream: {str(e)}")
+            raise ExternalServiceError(f"AI service error: {str(e)}")
+        finally:
+            # Stop the provider call as soon as our consumer goes away. A step
+            # still in flight must finish before the stream can be closed, and
+            # a cancelled consumer may be cancelled again while we wait.
+            with anyio.CancelScope(shield=True):
+                if next_event is not None and not next_event.done():
+                    next_event.cancel()
+                    await asyncio.gather(next_event, return_exceptions=True)
+                await stream.aclose()
+    
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        """Rough token count (~4 characters per token) when a provider reports none"""
+        return (len(text) + 3) // 4
+    
+    @staticmethod
+    def _chat_messages(
+        prompt: str,
+        history: Optional[List[Dict[str, str]]],
+        content: Any = None
+    ) -> List[Dict[str, Any]]:
+        """OpenAI/Anthropic message list: earlier turns, then the current prompt (or its content blocks)"""
+        return [*(history or []), {"role": "user", "content": content or prompt}]
+    
+    @staticmethod
+    def _openai_content(prompt: str, image: Optional[Dict[str, Any]]) -> Any:
+        """The prompt, with the capture as an image_url data URL when there is one"""
+        if not image:
+            return prompt
+        encoded = base64.b64encode(image["data"]).decode()
+        return [
+            {"type": "text", "text": prompt},
+            {"type": "image_url", "image_url": {"url": f"data:{image['content_type']};base64,{encoded}"}}
+        ]
+    
+    @staticmethod
+    def _claude_content(prompt: str, image: Optional[Dict[str, Any]]) -> Any:
+        """The prompt, preceded by the capture as a base64 image block when there is one"""
+        if not image:
+            return prompt
+        return [
+            {
+                "type": "image",
+                "source": {
+                    "type": "base64",
+                    "media_type": image["content_type"],
+                    "data": base64.b64encode(image["data"]).decode()
+                }
+            },
+            {"type": "text", "text": prompt}
+        ]
+    
+    @staticmethod
+    def _gemini_contents(
+        prompt: str,
+        history: Optional[List[Dict[str, str]]],
+        image: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        """Gemini contents: the prompt (and capture) alone, or a turn list with 'model' for the assistant"""
+        parts = [prompt, {"mime_type": image["content_type"], "data": image["data"]}] if image else [prompt]
+        if not history:
+            return parts if image else prompt
+        return [
+            *(
+                {"role": "model" if message["role"] == "assistant" else "user", "parts": [message["content"]]}
+                for message in history
+            ),
+            {"role": "user", "parts": parts}
+        ]
+    
+    def _gemini_model(self, model_name: Optional[str]) -> Any:
+        """The configured Gemini model, or another one on the same client/key"""
+        model_instance = self.providers["gemini"]
+        if not model_name:
+            return model_instance
+        if isinstance(model_instance, GeminiRestModel):
+            return model_instance.with_model(model_name)
+        return genai.GenerativeModel(model_name)
+    
+    @staticmethod
+    def _model_for(provider: str, model: Optional[str], image: Optional[Dict[str, Any]]) -> Optional[str]:
+        """The requested model, or the provider's vision model for an ask with an image"""
+        if model or not image:
+            return model
+        return settings.AI_VISION_MODELS.get(provider)
+    
     def _build_context_prompt(
         self,
         prompt: str,
         screen_context: Optional[str] = None,
         audio_transcript: Optional[str] = None,
-        user_profile: Optional[Dict[str, Any]] = None
+        user_profile: Optional[Dict[str, Any]] = None,
+        screen_description: Optional[str] = None
     ) -> str:
         """Build comprehensive prompt with all available context"""
         
@@ -139,6 +720,10 @@ class AIService:
         # Screen context
         if screen_context:
             context_parts.append("Screen Context: [Screen capture provided - analyze visual content]")
+        elif screen_description:
+            context_parts.append(
+                f"Screen Context: Unchanged since the previous capture, about which you said: {screen_description}"
+            )
         
         # Build final prompt
         if context_parts:
@@ -154,18 +739,24 @@ Please provide a helpful response based on the context and question above."""
         
         return full_prompt
     
-    async def _ask_openai(self, prompt: str, model: Optional[str] = None) -> Dict[str, Any]:
+    async def _ask_openai(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        image: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """Ask OpenAI"""
         client = self.providers["openai"]
-        model_name = model or "gpt-3.5-turbo"
+        model_name = self._model_for("openai", model, image) or "gpt-3.5-turbo"
         
         try:
-            response = await client.chat.completions.create(
+            response = await self._call_provider("openai", lambda: client.chat.completions.create(
                 model=model_name,
-                messages=[{"role": "user", "content": prompt}],
+                messages=self._chat_messages(prompt, history, self._openai_content(prompt, image)),
                 max_tokens=1000,
                 temperature=0.7
-            )
+            ))
             
             return {
                 "response": response.choices[0].message.content,
@@ -174,39 +765,59 @@ Please provide a helpful response based on the context and question above."""
                 "tokens_used": response.usage.total_tokens if response.usage else 0
             }
             
+        except ExternalServiceError:
+            raise
         except Exception as e:
             logger.error(f"OpenAI error: {str(e)}")
             raise ExternalServiceError(f"OpenAI error: {str(e)}")
     
-    async def _ask_gemini(self, prompt: str, model: Optional[str] = None) -> Dict[str, Any]:
+    async def _ask_gemini(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        image: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """Ask Gemini"""
-        model_instance = self.providers["gemini"]
+        # Gemini always ran the configured model; only an attached image switches it
+        vision_model = self._model_for("gemini", None, image)
+        model_instance = self._gemini_model(vision_model)
         
         try:
-            response = await model_instance.generate_content_async(prompt)
+            response = await self._call_provider(
+                "gemini", lambda: model_instance.generate_content_async(self._gemini_contents(prompt, history, image))
+            )
             
             return {
                 "response": response.text,
                 "provider": "gemini",
-                "model": "gemini-pro",
+                "model": vision_model or "gemini-pro",
                 "tokens_used": 0  # Gemini doesn't provide token count in free tier
             }
             
+        except ExternalServiceError:
+            raise
         except Exception as e:
             logger.error(f"Gemini error: {str(e)}")
             raise ExternalServiceError(f"Gemini error: {str(e)}")
     
-    async def _ask_claude(self, prompt: str, model: Optional[str] = None) -> Dict[str, Any]:
+    async def _ask_claude(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        image: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """Ask Claude"""
         client = self.providers["claude"]
-        model_name = model or "claude-3-sonnet-20240229"
+        model_name = self._model_for("claude", model, image) or "claude-3-sonnet-20240229"
         
         try:
-            response = await client.messages.create(
+            response = await self._call_provider("claude", lambda: client.messages.create(
                 model=model_name,
                 max_tokens=1000,
-                messages=[{"role": "user", "content": prompt}]
-            )
+                messages=self._chat_messages(prompt, history, self._claude_content(prompt, image))
+            ))
             
             return {
                 "response": response.content[0].text,
@@ -215,9 +826,118 @@ Please provide a helpful response based on the context and question above."""
                 "tokens_used": response.usage.input_tokens + response.usage.output_tokens
             }
             
+        except ExternalServiceError:
+            raise
         except Exception as e:
             logger.error(f"Claude error: {str(e)}")
             raise ExternalServiceError(f"Claude error: {str(e)}")
+    
+    async def _stream_openai(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        image: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream from OpenAI"""
+        client = self.providers["openai"]
+        model_name = self._model_for("openai", model, image) or "gpt-3.5-turbo"
+        yield {"type": "start", "provider": "openai", "model": model_name}
+        
+        parts = []
+        chunks = self._stream_provider("openai", lambda: client.chat.completions.create(
+            model=model_name,
+            messages=self._chat_messages(prompt, history, self._openai_content(prompt, image)),
+            max_tokens=1000,
+            temperature=0.7,
+            stream=True
+        ))
+        # aclosing: if our consumer stops, close the provider stream now, not at garbage collection
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield {"type": "delta", "text": chunk.choices[0].delta.content}
+        
+        response_text = "".join(parts)
+        yield {
+            "type": "done",
+            "response": response_text,
+            "provider": "openai",
+            "model": model_name,
+            # Streamed completions carry no usage block
+            "tokens_used": self.estimate_tokens(prompt) + self.estimate_tokens(response_text)
+        }
+    
+    async def _stream_gemini(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        image: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream from Gemini"""
+        vision_model = self._model_for("gemini", None, image)
+        model_instance = self._gemini_model(vision_model)
+        yield {"type": "start", "provider": "gemini", "model": vision_model or "gemini-pro"}
+        
+        parts = []
+        chunks = self._stream_provider(
+            "gemini", lambda: model_instance.generate_content_async(
+                self._gemini_contents(prompt, history, image), stream=True
+            )
+        )
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                if chunk.text:
+                    parts.append(chunk.text)
+                    yield {"type": "delta", "text": chunk.text}
+        
+        yield {
+            "type": "done",
+            "response": "".join(parts),
+            "provider": "gemini",
+            "model": vision_model or "gemini-pro",
+            "tokens_used": 0  # Gemini doesn't provide token count in free tier
+        }
+    
+    async def _stream_claude(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        image: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream from Claude"""
+        client = self.providers["claude"]
+        model_name = self._model_for("claude", model, image) or "claude-3-sonnet-20240229"
+        yield {"type": "start", "provider": "claude", "model": model_name}
+        
+        parts = []
+        input_tokens = output_tokens = 0
+        events = self._stream_provider("claude", lambda: client.messages.create(
+            model=model_name,
+            max_tokens=1000,
+            messages=self._chat_messages(prompt, history, self._claude_content(prompt, image)),
+            stream=True
+        ))
+        async with aclosing(events):
+            async for event in events:
+                if event.type == "message_start":
+                    input_tokens = event.message.usage.input_tokens
+                elif event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                    parts.append(event.delta.text)
+                    yield {"type": "delta", "text": event.delta.text}
+                elif event.type == "message_delta":
+                    output_tokens = event.usage.output_tokens
+        
+        yield {
+            "type": "done",
+            "response": "".join(parts),
+            "provider": "claude",
+            "model": model_name,
+            "tokens_used": input_tokens + output_tokens
+        }
 
 # Global instance
 ai_service = AIService()
\ No newline at end of file
@@ -0,0 +1,159 @@
+import asyncio
+import base64
+import hashlib
+import os
+import uuid
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Optional
+import logging
+
+import aiofiles
+
+try:
+    import boto3
+    from botocore.exceptions import ClientError
+except ImportError:
+    boto3 = None
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+def sniff_content_type(data: bytes) -> str:
+    """Guess an image content type from its magic bytes"""
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    return "application/octet-stream"
+
+def decode_capture(screen_context: str) -> bytes:
+    """Decode a base64 screen capture, with or without a data: URL prefix"""
+    if screen_context.startswith("data:") and "," in screen_context:
+        screen_context = screen_context.split(",", 1)[1]
+    return base64.b64decode(screen_context)
+
+class BlobStore(ABC):
+    """Content-addressed blob storage with an S3-style put/get/head interface.
+
+    Blobs are keyed by the SHA-256 of their bytes, so storing the same
+    capture twice is a no-op.
+    """
+
+    @staticmethod
+    def key_for(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    async def put(self, data: bytes, content_type: Optional[str] = None) -> str:
+        """Store bytes (if not already present) and return their key"""
+        key = self.key_for(data)
+        if not await self.exists(key):
+            await self._write(key, data, content_type or sniff_content_type(data))
+        return key
+
+    async def put_base64(self, screen_context: str) -> str:
+        """Store a base64 screen capture and return its key"""
+        return await self.put(decode_capture(screen_context))
+
+    async def get(self, key: str) -> bytes:
+        chunks = [chunk async for chunk in self.stream(key)]
+        return b"".join(chunks)
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def stream(self, key: str) -> AsyncIterator[bytes]:
+        """Iterate a blob's bytes in chunks; raises FileNotFoundError if missing"""
+
+    @abstractmethod
+    async def _write(self, key: str, data: bytes, content_type: str):
+        ...
+
+class FilesystemBlobStore(BlobStore):
+    """Blob store on a local directory, fanned out by key prefix"""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    async def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    async def stream(self, key: str) -> AsyncIterator[bytes]:
+        async with aiofiles.open(self._path(key), "rb") as f:
+            while True:
+                chunk = await f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    async def _write(self, key: str, data: bytes, content_type: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so readers never see a partial blob
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        async with aiofiles.open(tmp_path, "wb") as f:
+            await f.write(data)
+        os.replace(tmp_path, path)
+
+class S3BlobStore(BlobStore):
+    """Blob store on an S3-compatible bucket (requires boto3)"""
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, region: Optional[str] = None):
+        self.bucket = bucket
+        self._client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await asyncio.to_thread(self._client.head_object, Bucket=self.bucket, Key=key)
+            return True
+        except ClientError:
+            return False
+
+    async def stream(self, key: str) -> AsyncIterator[bytes]:
+        try:
+            response = await asyncio.to_thread(self._client.get_object, Bucket=self.bucket, Key=key)
+        except ClientError:
+            raise FileNotFoundError(key)
+        body = response["Body"]
+        try:
+            while True:
+                chunk = await asyncio.to_thread(body.read, CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    async def _write(self, key: str, data: bytes, content_type: str):
+        await asyncio.to_thread(
+            self._client.put_object,
+            Bucket=self.bucket,
+            Key=key,
+            Body=data,
+            ContentType=content_type
+        )
+
+def build_blob_store() -> BlobStore:
+    """Create the configured blob store backend"""
+    if settings.BLOB_STORE_BACKEND == "s3":
+        # Falling back to local disk would scatter captures across instances
+        if boto3 is None:
+            raise RuntimeError("BLOB_STORE_BACKEND is 's3' but boto3 is not installed (pip install boto3)")
+        if not settings.S3_BUCKET:
+            raise RuntimeError("BLOB_STORE_BACKEND is 's3' but S3_BUCKET is not set")
+        return S3BlobStore(settings.S3_BUCKET, settings.S3_ENDPOINT_URL, settings.S3_REGION)
+    return FilesystemBlobStore(settings.BLOB_STORE_PATH)
+
+# Global instance
+blob_store = build_blob_store()
@@ -0,0 +1,140 @@
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.core.cache import TTLCache
+from app.core.database import AiMessage
+from app.services.ai_service import AIService
+
+class SessionWindow:
+    """Most recent turns of a session, trimmed to a token ceiling"""
+
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+        self.turns: deque = deque()  # (prompt, response, tokens), oldest first
+        self.total_tokens = 0
+        # Ids of the most recent turns added, including ones trimmed for tokens
+        self.seen: Dict[str, None] = {}
+        self.synced_at: Optional[datetime] = None  # Newest created_at read from the database
+
+    def append(self, prompt: str, response: str, message_id: Optional[str] = None):
+        if message_id is not None:
+            if message_id in self.seen:
+                return
+            self.seen[message_id] = None
+            if len(self.seen) > 2 * settings.AI_CONTEXT_MAX_TURNS:
+                del self.seen[next(iter(self.seen))]
+        tokens = AIService.estimate_tokens(prompt) + AIService.estimate_tokens(response)
+        self.turns.append((prompt, response, tokens))
+        self.total_tokens += tokens
+        while self.total_tokens > self.max_tokens and self.turns:
+            _, _, dropped = self.turns.popleft()
+            self.total_tokens -= dropped
+
+    def messages(self, budget: int) -> List[Dict[str, str]]:
+        """Newest turns that fit the budget, as chronological chat messages"""
+        selected = []
+        used = 0
+        for prompt, response, tokens in reversed(self.turns):
+            if used + tokens > budget:
+                break
+            selected.append((prompt, response))
+            used += tokens
+
+        messages = []
+        for prompt, response in reversed(selected):
+            messages.append({"role": "user", "content": prompt})
+            messages.append({"role": "assistant", "content": response})
+        return messages
+
+class ContextService:
+    """Conversation history for session-aware asks.
+
+    Each session's window is read from ai_messages once, then kept up to
+    date by appending every new turn, so later turns cost no re-counting of
+    earlier tokens. On a hit, the ids of turns written since the window was
+    last synced are checked (a small index-only query); if another worker
+    added any, the window is reloaded.
+    """
+
+    def __init__(self):
+        self._windows = TTLCache(
+            max_size=settings.AI_CONTEXT_CACHE_MAX_SESSIONS,
+            default_ttl=settings.AI_CONTEXT_CACHE_TTL_SECONDS
+        )
+
+    def budget_for(self, provider: str, model: Optional[str] = None) -> int:
+        """History token budget for a model, falling back to the provider default"""
+        budgets = settings.AI_CONTEXT_TOKEN_BUDGETS
+        if model and model in budgets:
+            return budgets[model]
+        return budgets.get(provider, budgets["default"])
+
+    def start_session(self, session_id: str):
+        """Register a brand-new session so its first turns never hit the database"""
+        self._windows.set(session_id, SessionWindow(settings.AI_CONTEXT_MAX_TOKENS))
+
+    async def get_history(
+        self,
+        session_id: str,
+        provider: str,
+        model: Optional[str],
+        db: AsyncSession
+    ) -> List[Dict[str, str]]:
+        """Earlier turns of the session that fit the model's budget"""
+        window = self._windows.get(session_id)
+        if window is None or not await self._is_current(session_id, window, db):
+            window = await self._load_window(session_id, db)
+            self._windows.set(session_id, window)
+        return window.messages(self.budget_for(provider, model))
+
+    def append(self, session_id: str, prompt: str, response: str, message_id: Optional[str] = None):
+        """Add a completed turn to the session's window if it is cached"""
+        window = self._windows.get(session_id)
+        if window is not None:
+            window.append(prompt, response, message_id)
+
+    async def _is_current(self, session_id: str, window: SessionWindow, db: AsyncSession) -> bool:
+        """Whether the window has every turn written since it was last synced.
+
+        Turns are stamped when their transaction starts, not when it commits,
+        so the check looks back AI_CONTEXT_SYNC_LOOKBACK_SECONDS past the
+        newest turn already read.
+        """
+        query = select(AiMessage.id, AiMessage.created_at).where(AiMessage.session_id == session_id)
+        if window.synced_at is not None:
+            lookback = timedelta(seconds=settings.AI_CONTEXT_SYNC_LOOKBACK_SECONDS)
+            query = query.where(AiMessage.created_at >= window.synced_at - lookback)
+        result = await db.execute(
+            query.order_by(AiMessage.created_at.desc()).limit(settings.AI_CONTEXT_MAX_TURNS)
+        )
+        rows = result.all()
+        if any(message_id not in window.seen for message_id, _ in rows):
+            return False
+        if rows:
+            window.synced_at = max(window.synced_at or rows[0].created_at, rows[0].created_at)
+        return True
+
+    async def _load_window(self, session_id: str, db: AsyncSession) -> SessionWindow:
+        result = await db.execute(
+            select(AiMessage.id, AiMessage.prompt, AiMessage.response, AiMessage.created_at)
+            .where(AiMessage.session_id == session_id)
+            .order_by(AiMessage.created_at.desc())
+            .limit(settings.AI_CONTEXT_MAX_TURNS)
+        )
+        rows = result.all()
+        window = SessionWindow(settings.AI_CONTEXT_MAX_TOKENS)
+        for message_id, prompt, response, _ in reversed(rows):
+            window.append(prompt, response, message_id)
+        if rows:
+            window.synced_at = rows[0].created_at
+        return window
+
+    def stats(self):
+        return self._windows.stats()
+
+# Global instance
+context_service = ContextService()
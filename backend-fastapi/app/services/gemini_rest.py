@@ -0,0 +1,89 @@
+import base64
+import json
+from typing import Any, AsyncIterator, Dict, List
+
+import httpx
+
+class GeminiRestError(Exception):
+    """Non-2xx response from the Gemini REST API"""
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+
+class GeminiRestResponse:
+    """Just enough of the SDK's GenerateContentResponse for AIService"""
+
+    def __init__(self, payload: Dict[str, Any]):
+        self.payload = payload
+
+    @property
+    def text(self) -> str:
+        candidates = self.payload.get("candidates") or []
+        if not candidates:
+            return ""
+        parts = candidates[0].get("content", {}).get("parts", [])
+        return "".join(part.get("text", "") for part in parts)
+
+class GeminiRestModel:
+    """GenerativeModel.generate_content_async over plain REST.
+
+    The SDK's async client only speaks gRPC to Google's endpoint, so this is
+    used instead when GEMINI_BASE_URL points somewhere else (e.g. the local
+    stub LLM server). It shares AIService's httpx pool.
+    """
+
+    def __init__(self, http_client: httpx.AsyncClient, base_url: str, api_key: str, model_name: str = "gemini-pro"):
+        self._client = http_client
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model_name = model_name
+
+    def with_model(self, model_name: str) -> "GeminiRestModel":
+        """The same client and key, calling another model"""
+        return GeminiRestModel(self._client, self.base_url, self.api_key, model_name)
+
+    @staticmethod
+    def _part(part: Any) -> Dict[str, Any]:
+        """A text part, or an SDK-style {"mime_type", "data"} blob as inlineData"""
+        if isinstance(part, str):
+            return {"text": part}
+        return {"inlineData": {"mimeType": part["mime_type"], "data": base64.b64encode(part["data"]).decode()}}
+
+    @classmethod
+    def _contents(cls, contents: Any) -> List[Dict[str, Any]]:
+        if isinstance(contents, str):
+            contents = [contents]
+        if not isinstance(contents[0], dict) or "role" not in contents[0]:
+            # A bare list of parts is one user turn, as in the SDK
+            return [{"role": "user", "parts": [cls._part(part) for part in contents]}]
+        return [
+            {"role": turn["role"], "parts": [cls._part(part) for part in turn["parts"]]}
+            for turn in contents
+        ]
+
+    def _url(self, method: str) -> str:
+        return f"{self.base_url}/v1beta/models/{self.model_name}:{method}"
+
+    async def generate_content_async(self, contents: Any, stream: bool = False) -> Any:
+        body = {"contents": self._contents(contents)}
+        if stream:
+            return self._stream(body)
+
+        response = await self._client.post(self._url("generateContent"), params={"key": self.api_key}, json=body)
+        if response.status_code >= 400:
+            raise GeminiRestError(response.status_code, response.text)
+        return GeminiRestResponse(response.json())
+
+    async def _stream(self, body: Dict[str, Any]) -> AsyncIterator[GeminiRestResponse]:
+        async with self._client.stream(
+            "POST",
+            self._url("streamGenerateContent"),
+            params={"alt": "sse", "key": self.api_key},
+            json=body
+        ) as response:
+            if response.status_code >= 400:
+                await response.aread()
+                raise GeminiRestError(response.status_code, response.text)
+            async for line in response.aiter_lines():
+                if line.startswith("data:"):
+                    yield GeminiRestResponse(json.loads(line[5:]))
@@ -0,0 +1,215 @@
+import asyncio
+import io
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Dict, Any, Union
+import logging
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from app.core.config import settings
+from app.core.cache import TTLCache
+from app.services.blob_store import decode_capture, sniff_content_type
+
+logger = logging.getLogger(__name__)
+
+def perceptual_hash(image: "Image.Image", hash_size: int = 8) -> int:
+    """64-bit difference hash: compares adjacent pixels of a tiny grayscale copy"""
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+def _preprocess_capture(
+    data: Union[bytes, str],
+    max_dimension: int,
+    image_format: str,
+    quality: int,
+    previous_phash: Optional[int] = None,
+    max_distance: int = 0
+) -> Dict[str, Any]:
+    """Decode, hash, downscale and re-encode a capture (runs in a worker process).
+
+    data is the image bytes or a base64 capture, which is decoded here so
+    the event loop never does it. If the capture is within max_distance of
+    previous_phash it is reported as a duplicate and not re-encoded.
+    """
+    started = time.process_time()
+    if isinstance(data, str):
+        data = decode_capture(data)
+
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    phash = perceptual_hash(image)
+
+    if previous_phash is not None and hamming_distance(phash, previous_phash) <= max_distance:
+        return {
+            "data": None,
+            "duplicate": True,
+            "phash": phash,
+            "original_bytes": len(data),
+            "cpu_seconds": time.process_time() - started
+        }
+
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+
+    output = io.BytesIO()
+    image.save(output, format=image_format, quality=quality)
+
+    return {
+        "data": output.getvalue(),
+        "duplicate": False,
+        "content_type": f"image/{image_format.lower()}",
+        "width": image.width,
+        "height": image.height,
+        "phash": phash,
+        "original_bytes": len(data),
+        "cpu_seconds": time.process_time() - started
+    }
+
+class ImageService:
+    """Screen capture preprocessing in a bounded process pool.
+
+    Also remembers the last capture of each session, with the provider's
+    description of it, so near-identical screenshots re-sent during
+    listen/meeting sessions can reuse both instead of being sent again.
+    """
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = asyncio.Semaphore(settings.IMAGE_PROCESS_MAX_PENDING)
+        self._session_captures = TTLCache(
+            max_size=settings.IMAGE_DEDUPE_MAX_SESSIONS,
+            default_ttl=settings.IMAGE_DEDUPE_TTL_SECONDS
+        )
+        self.counters = {
+            "captures": 0,
+            "failures": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "cpu_seconds": 0.0,
+            "dedupe_checked": 0,
+            "deduped": 0
+        }
+
+    @property
+    def available(self) -> bool:
+        return Image is not None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=settings.IMAGE_PROCESS_WORKERS)
+        return self._executor
+
+    def profile_for(self, provider: str) -> Dict[str, Any]:
+        """Target resolution, format and quality for a provider"""
+        profiles = settings.IMAGE_PROVIDER_PROFILES
+        return profiles.get(provider, profiles["default"])
+
+    def last_capture(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Hash, blob reference and description of the session's last stored capture"""
+        return self._session_captures.get(session_id)
+
+    def remember_capture(self, session_id: str, phash: int, ref: str, description: Optional[str] = None):
+        """Compare the session's next captures against this one.
+
+        description is the provider's answer to the ask that carried the
+        capture; near-duplicates are sent as that text instead of the image.
+        """
+        if description is not None:
+            description = description[:settings.IMAGE_DEDUPE_DESCRIPTION_MAX_CHARS]
+        self._session_captures.set(session_id, {"phash": phash, "ref": ref, "description": description})
+
+    def describe_capture(self, session_id: str, ref: str, description: str):
+        """Attach the description to a capture remembered before its ask ran (queued jobs)"""
+        previous = self._session_captures.get(session_id)
+        if previous and previous["ref"] == ref and previous["description"] is None:
+            self.remember_capture(session_id, previous["phash"], ref, description)
+
+    async def preprocess(
+        self,
+        screen_context: Union[bytes, str],
+        provider: str,
+        previous_phash: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Prepare a capture (image bytes or base64) for the provider.
+
+        With previous_phash, a capture within IMAGE_DEDUPE_MAX_DISTANCE of
+        it comes back with duplicate=True and no data. Returns None when
+        Pillow is not installed or the image cannot be decoded, in which
+        case callers fall back to the original bytes.
+        """
+        if not self.available:
+            return None
+
+        profile = self.profile_for(provider)
+
+        # Bound queued work so a burst of captures cannot pile up behind the pool
+        async with self._pending:
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self._pool(),
+                    _preprocess_capture,
+                    screen_context,
+                    profile["max_dimension"],
+                    profile["format"],
+                    profile["quality"],
+                    previous_phash,
+                    settings.IMAGE_DEDUPE_MAX_DISTANCE
+                )
+            except Exception as e:
+                logger.error(f"Error preprocessing screen capture: {str(e)}")
+                self.counters["failures"] += 1
+                return None
+
+        self.counters["captures"] += 1
+        self.counters["bytes_in"] += result["original_bytes"]
+        self.counters["cpu_seconds"] += result["cpu_seconds"]
+        if previous_phash is not None:
+            self.counters["dedupe_checked"] += 1
+        if result["duplicate"]:
+            self.counters["deduped"] += 1
+        else:
+            self.counters["bytes_out"] += len(result["data"])
+        return result
+
+    async def for_provider(self, data: bytes, provider: str) -> Dict[str, Any]:
+        """A stored capture as attached to an ask: preprocessed, or as is without Pillow"""
+        capture = await self.preprocess(data, provider)
+        if capture:
+            return {"data": capture["data"], "content_type": capture["content_type"]}
+        return {"data": data, "content_type": sniff_content_type(data)}
+
+    def stats(self) -> Dict[str, Any]:
+        captures = self.counters["captures"]
+        return {
+            **self.counters,
+            "cpu_seconds": round(self.counters["cpu_seconds"], 3),
+            "avg_cpu_ms": round(self.counters["cpu_seconds"] * 1000 / captures, 2) if captures else 0.0,
+            "size_ratio": round(self.counters["bytes_out"] / self.counters["bytes_in"], 4)
+            if self.counters["bytes_in"] else 0.0,
+            "dedupe_ratio": round(self.counters["deduped"] / self.counters["dedupe_checked"], 4)
+            if self.counters["dedupe_checked"] else 0.0,
+            "tracked_sessions": len(self._session_captures)
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+# Global instance
+image_service = ImageService()
@@ -0,0 +1,468 @@
+import asyncio
+import ipaddress
+import json
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
+from urllib.parse import urlsplit
+import logging
+
+import httpx
+from fastapi import HTTPException
+from sqlalchemy import select, update, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import async_session_factory, AskJob, AskJobStatus, AiMessage, PlanType
+from app.services.ai_service import ai_service
+from app.services.blob_store import blob_store
+from app.services.image_service import image_service
+from app.services.context_service import context_service
+from app.services.usage_service import usage_service
+
+logger = logging.getLogger(__name__)
+
+async def validate_callback_url(url: str):
+    """Reject callback URLs that could reach internal services.
+
+    Callbacks must be https and every address the host resolves to must be
+    public, unless the host is in ASK_JOB_CALLBACK_ALLOWED_HOSTS. Raises
+    ValueError. Checked at submit and again before each delivery, since
+    DNS answers can change in between.
+    """
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme != "https":
+        raise ValueError("Callback URL must use https")
+    if not host:
+        raise ValueError("Callback URL has no host")
+
+    allowed = [h.lower() for h in settings.ASK_JOB_CALLBACK_ALLOWED_HOSTS]
+    if any(host == h or host.endswith("." + h) for h in allowed):
+        return
+
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            host, parts.port or 443, type=socket.SOCK_STREAM
+        )
+    except socket.gaierror:
+        raise ValueError(f"Callback host {host} does not resolve")
+    for *_, sockaddr in infos:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            raise ValueError(f"Callback host {host} resolves to a non-public address")
+
+class JobService:
+    """DB-backed ask queue worked by in-process workers.
+
+    Workers claim the highest-priority visible job and lease it: while
+    running, available_at is the lease expiry, so a job whose worker died
+    becomes claimable again (a visibility timeout). Failed attempts are
+    requeued with backoff up to ASK_JOB_MAX_ATTEMPTS. Only the worker still
+    holding the lease can record a result.
+
+    Callbacks go through an outbox: finishing a job stamps callback_next_at,
+    and a separate sender task claims due callbacks the same way, so a slow
+    or failing endpoint never holds up a worker.
+    """
+
+    def __init__(self):
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._callbacks_due = asyncio.Event()
+        self._callback_sender: Optional[asyncio.Task] = None
+        self._deliveries: set = set()
+        self._client: Optional[httpx.AsyncClient] = None
+        self.counters = {
+            "submitted": 0,
+            "succeeded": 0,
+            "failed": 0,
+            "retried": 0,
+            "lease_lost": 0,
+            "callbacks_delivered": 0,
+            "callbacks_failed": 0
+        }
+
+    async def submit(
+        self,
+        user_id: str,
+        plan: str,
+        session_id: str,
+        request: Dict[str, Any],
+        screen_context_ref: Optional[str],
+        callback_url: Optional[str],
+        db: AsyncSession
+    ) -> AskJob:
+        """Queue an ask and wake an idle worker"""
+        job = AskJob(
+            user_id=user_id,
+            session_id=session_id,
+            priority=settings.ASK_JOB_PRIORITIES.get(plan, 0),
+            request=json.dumps(request),
+            screen_context_ref=screen_context_ref,
+            callback_url=callback_url,
+            available_at=datetime.utcnow()
+        )
+        db.add(job)
+        await db.commit()
+        await db.refresh(job)
+        self.counters["submitted"] += 1
+        self._wakeup.set()
+        return job
+
+    async def pending_count(self, user_id: str, db: AsyncSession) -> int:
+        """A user's jobs that are queued or running"""
+        result = await db.execute(
+            select(func.count()).select_from(AskJob).where(and_(
+                AskJob.user_id == user_id,
+                AskJob.status.in_([AskJobStatus.QUEUED, AskJobStatus.RUNNING])
+            ))
+        )
+        return result.scalar_one()
+
+    async def get_job(self, job_id: str, user_id: str, db: AsyncSession) -> Optional[AskJob]:
+        result = await db.execute(
+            select(AskJob).where(and_(AskJob.id == job_id, AskJob.user_id == user_id))
+        )
+        return result.scalar_one_or_none()
+
+    @staticmethod
+    def job_payload(job: AskJob) -> Dict[str, Any]:
+        """Public view of a job, as returned by polling and sent to callbacks"""
+        return {
+            "job_id": job.id,
+            "status": job.status.value,
+            "attempts": job.attempts,
+            "result": json.loads(job.result) if job.result else None,
+            "error": job.error,
+            "created_at": job.created_at.isoformat() if job.created_at else None,
+            "completed_at": job.completed_at.isoformat() if job.completed_at else None
+        }
+
+    def start(self):
+        """Start the worker tasks (called from the app lifespan)"""
+        if self._workers:
+            return
+        self._client = httpx.AsyncClient(timeout=settings.ASK_JOB_CALLBACK_TIMEOUT_SECONDS)
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(settings.ASK_JOB_WORKERS)
+        ]
+        self._callback_sender = asyncio.create_task(self._callback_loop())
+
+    async def stop(self):
+        """Stop the workers; jobs and callbacks in progress are retried after their lease expires"""
+        tasks = [*self._workers, *self._deliveries]
+        if self._callback_sender:
+            tasks.append(self._callback_sender)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._callback_sender = None
+        self._deliveries.clear()
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "workers": len(self._workers), "callbacks_in_flight": len(self._deliveries)}
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._claim()
+            except Exception as e:
+                logger.error(f"Error claiming ask job: {str(e)}")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), settings.ASK_JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._process(job)
+
+    async def _claim(self) -> Optional[AskJob]:
+        """Lease the next visible job, highest priority first"""
+        now = datetime.utcnow()
+        claimable = and_(
+            AskJob.status.in_([AskJobStatus.QUEUED, AskJobStatus.RUNNING]),
+            AskJob.available_at <= now
+        )
+
+        async with async_session_factory() as db:
+            candidate = (
+                select(AskJob.id)
+                .where(claimable)
+                .order_by(AskJob.priority.desc(), AskJob.available_at)
+                .limit(1)
+            )
+            if db.bind.dialect.name == "postgresql":
+                candidate = candidate.with_for_update(skip_locked=True)
+
+            # Re-checking claimable in the UPDATE keeps two workers from taking the same job
+            result = await db.execute(
+                update(AskJob)
+                .where(AskJob.id == candidate.scalar_subquery(), claimable)
+                .values(
+                    status=AskJobStatus.RUNNING,
+                    lease_id=uuid.uuid4().hex,
+                    attempts=AskJob.attempts + 1,
+                    available_at=now + timedelta(seconds=settings.ASK_JOB_VISIBILITY_TIMEOUT_SECONDS)
+                )
+                .returning(AskJob)
+                .execution_options(synchronize_session=False)
+            )
+            job = result.scalar_one_or_none()
+            await db.commit()
+            return job
+
+    async def _process(self, job: AskJob):
+        if job.attempts > settings.ASK_JOB_MAX_ATTEMPTS:
+            # Lease expired on the last attempt (worker died or hung)
+            await self._fail(job, "Job did not complete within its retry limit")
+            return
+
+        request = json.loads(job.request)
+        reservation = None
+        try:
+            async with async_session_factory() as db:
+                # Hold the ask against the user's limit for as long as the attempt runs
+                reservation, limit_info = await usage_service.reserve(
+                    job.user_id, PlanType(request["plan"]), db
+                )
+                if reservation is None:
+                    await self._fail(
+                        job,
+                        f"Monthly ask limit exceeded. Used: {limit_info['used']}, Limit: {limit_info['limit']}"
+                    )
+                    return
+
+                history = await context_service.get_history(
+                    job.session_id, request["provider"], request["model"], db
+                )
+                # A reused capture is sent as its earlier description, not the image
+                screen_description = request.get("screen_description")
+                image = None
+                if job.screen_context_ref and not screen_description:
+                    image = await image_service.for_provider(
+                        await blob_store.get(job.screen_context_ref), request["provider"]
+                    )
+                ai_response = await ai_service.ask_ai(
+                    prompt=request["prompt"],
+                    audio_transcript=request["audio_transcript"],
+                    user_profile=request["user_profile"],
+                    provider=request["provider"],
+                    model=request["model"],
+                    use_cache=request["use_cache"],
+                    plan=request["plan"],
+                    history=history,
+                    screen_context_ref=job.screen_context_ref,
+                    timeout=settings.ASK_JOB_TIMEOUT_SECONDS,
+                    image=image,
+                    screen_description=screen_description
+                )
+
+                ai_message = AiMessage(
+                    session_id=job.session_id,
+                    user_id=job.user_id,
+                    prompt=request["prompt"],
+                    response=ai_response["response"],
+                    screen_context_ref=job.screen_context_ref,
+                    audio_transcript=request["audio_transcript"],
+                    ai_provider=ai_response["provider"],
+                    model_used=ai_response["model"],
+                    tokens_used=ai_response["tokens_used"]
+                )
+                db.add(ai_message)
+                await usage_service.track_usage(
+                    user_id=job.user_id,
+                    action_type="ask",
+                    resource_used="tokens",
+                    quantity=ai_response["tokens_used"],
+                    db=db,
+                    sync=True
+                )
+                await db.flush()
+
+                result = {
+                    "response": ai_response["response"],
+                    "provider": ai_response["provider"],
+                    "model": ai_response["model"],
+                    "tokens_used": ai_response["tokens_used"],
+                    "session_id": job.session_id,
+                    "message_id": str(ai_message.id),
+                    "cached": ai_response["cached"]
+                }
+                # Message, usage and job result commit together, or not at all
+                completed_at = datetime.utcnow()
+                if not await self._settle(db, job, {
+                    "status": AskJobStatus.SUCCEEDED,
+                    "result": json.dumps(result),
+                    "error": None,
+                    "completed_at": completed_at,
+                    "callback_next_at": completed_at if job.callback_url else None
+                }):
+                    await db.rollback()
+                    return
+                await db.commit()
+                await usage_service.commit_reservation(reservation)
+
+            if image:
+                image_service.describe_capture(job.session_id, job.screen_context_ref, ai_response["response"])
+            context_service.append(job.session_id, request["prompt"], ai_response["response"], str(ai_message.id))
+            self.counters["succeeded"] += 1
+            if job.callback_url:
+                self._callbacks_due.set()
+
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e)
+            logger.error(f"Ask job {job.id} attempt {job.attempts} failed: {detail}")
+            # Rejected requests won't succeed on retry; provider and DB errors might
+            retryable = not (isinstance(e, HTTPException) and e.status_code < 500 and e.status_code != 429)
+            if retryable and job.attempts < settings.ASK_JOB_MAX_ATTEMPTS:
+                await self._retry(job, detail)
+            else:
+                await self._fail(job, detail)
+        finally:
+            if reservation:
+                await usage_service.release_reservation(reservation)
+
+    async def _settle(self, db: AsyncSession, job: AskJob, values: Dict[str, Any]) -> bool:
+        """Update the job if we still hold its lease"""
+        result = await db.execute(
+            update(AskJob)
+            .where(and_(AskJob.id == job.id, AskJob.lease_id == job.lease_id))
+            .values(lease_id=None, **values)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            self.counters["lease_lost"] += 1
+            logger.warning(f"Ask job {job.id} lease expired before attempt {job.attempts} finished")
+            return False
+        return True
+
+    async def _retry(self, job: AskJob, error: str):
+        backoff = settings.ASK_JOB_RETRY_BACKOFF_SECONDS * job.attempts
+        async with async_session_factory() as db:
+            if await self._settle(db, job, {
+                "status": AskJobStatus.QUEUED,
+                "error": error,
+                "available_at": datetime.utcnow() + timedelta(seconds=backoff)
+            }):
+                self.counters["retried"] += 1
+            await db.commit()
+
+    async def _fail(self, job: AskJob, error: str):
+        completed_at = datetime.utcnow()
+        async with async_session_factory() as db:
+            settled = await self._settle(db, job, {
+                "status": AskJobStatus.FAILED,
+                "error": error,
+                "completed_at": completed_at,
+                "callback_next_at": completed_at if job.callback_url else None
+            })
+            await db.commit()
+        if settled:
+            self.counters["failed"] += 1
+            if job.callback_url:
+                self._callbacks_due.set()
+
+    async def _callback_loop(self):
+        while True:
+            free = settings.ASK_JOB_CALLBACK_CONCURRENCY - len(self._deliveries)
+            jobs: List[AskJob] = []
+            if free > 0:
+                try:
+                    jobs = await self._claim_callbacks(free)
+                except Exception as e:
+                    logger.error(f"Error claiming ask job callbacks: {str(e)}")
+
+            for job in jobs:
+                task = asyncio.create_task(self._deliver_callback(job))
+                self._deliveries.add(task)
+                task.add_done_callback(self._deliveries.discard)
+            if jobs:
+                continue
+
+            self._callbacks_due.clear()
+            try:
+                await asyncio.wait_for(self._callbacks_due.wait(), settings.ASK_JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim_callbacks(self, limit: int) -> List[AskJob]:
+        """Claim up to `limit` due callbacks; a claim lapses if its sender dies"""
+        now = datetime.utcnow()
+        due = and_(AskJob.callback_next_at.is_not(None), AskJob.callback_next_at <= now)
+
+        async with async_session_factory() as db:
+            candidates = (
+                select(AskJob.id)
+                .where(due)
+                .order_by(AskJob.callback_next_at)
+                .limit(limit)
+            )
+            if db.bind.dialect.name == "postgresql":
+                candidates = candidates.with_for_update(skip_locked=True)
+
+            result = await db.execute(
+                update(AskJob)
+                .where(AskJob.id.in_(candidates.scalar_subquery()), due)
+                .values(
+                    callback_attempts=func.coalesce(AskJob.callback_attempts, 0) + 1,
+                    callback_next_at=now + timedelta(seconds=settings.ASK_JOB_CALLBACK_TIMEOUT_SECONDS * 2)
+                )
+                .returning(AskJob)
+                .execution_options(synchronize_session=False)
+            )
+            jobs = list(result.scalars())
+            await db.commit()
+            return jobs
+
+    async def _deliver_callback(self, job: AskJob):
+        """POST the finished job to its callback URL once; failures are rescheduled with backoff"""
+        delivered, retry = False, True
+        try:
+            await validate_callback_url(job.callback_url)
+            response = await self._client.post(job.callback_url, json=self.job_payload(job))
+            delivered = response.status_code < 400
+            if not delivered:
+                logger.warning(f"Callback for ask job {job.id} returned {response.status_code}")
+        except ValueError as e:
+            logger.warning(f"Callback for ask job {job.id} refused: {str(e)}")
+            retry = False
+        except httpx.HTTPError as e:
+            logger.warning(f"Callback for ask job {job.id} failed: {str(e)}")
+
+        now = datetime.utcnow()
+        if delivered:
+            self.counters["callbacks_delivered"] += 1
+            values = {"callback_delivered_at": now, "callback_next_at": None}
+        elif retry and job.callback_attempts < settings.ASK_JOB_CALLBACK_ATTEMPTS:
+            values = {"callback_next_at": now + timedelta(seconds=2 ** job.callback_attempts)}
+        else:
+            self.counters["callbacks_failed"] += 1
+            values = {"callback_next_at": None}
+
+        try:
+            async with async_session_factory() as db:
+                await db.execute(
+                    update(AskJob)
+                    .where(AskJob.id == job.id)
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+        except Exception as e:
+            # The claim lapses and the callback is sent again
+            logger.error(f"Error recording callback for ask job {job.id}: {str(e)}")
+
+# Global instance
+job_service = JobService()
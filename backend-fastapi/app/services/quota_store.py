@@ -0,0 +1,355 @@
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Any, List, Tuple
+import time
+import logging
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+from app.core.config import settings
+from app.core.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# INCRBY that leaves unknown keys alone, so a counter is never started from zero
+_INCR_EXISTING = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return false
+"""
+
+# Hold `amount` units if counter + live reservations + amount stays within the limit.
+# KEYS: counter, reservation expiries (zset), reservation amounts (hash)
+# ARGV: now, expires_at, reservation_id, amount, limit, ttl
+_RESERVE = """
+local used = redis.call('GET', KEYS[1])
+if not used then
+    return {-1, 0}
+end
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, id in ipairs(expired) do
+    redis.call('HDEL', KEYS[3], id)
+end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+local pending = tonumber(used)
+for _, amount in ipairs(redis.call('HVALS', KEYS[3])) do
+    pending = pending + tonumber(amount)
+end
+if pending + tonumber(ARGV[4]) > tonumber(ARGV[5]) then
+    return {0, pending}
+end
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[3])
+redis.call('HSET', KEYS[3], ARGV[3], ARGV[4])
+redis.call('EXPIRE', KEYS[2], ARGV[6])
+redis.call('EXPIRE', KEYS[3], ARGV[6])
+return {1, pending}
+"""
+
+# Replace a counter with its recount unless it moved since the snapshot or has live holds.
+# KEYS: counter, reservation expiries (zset)
+# ARGV: snapshot value, recounted value, now
+_RECONCILE = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+if redis.call('ZCOUNT', KEYS[2], '(' .. ARGV[3], '+inf') > 0 then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'KEEPTTL')
+return 1
+"""
+
+class QuotaStore(ABC):
+    """Per-user, per-action, per-month usage counters.
+
+    get returns None for a key the store doesn't hold; the caller counts
+    from the database and seeds it. incr only touches keys already seeded.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    async def seed(self, key: str, value: int) -> int:
+        """Set a counter if absent and return the stored value"""
+
+    @abstractmethod
+    async def incr(self, key: str, amount: int = 1) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    async def snapshot(self, keys: List[str]) -> Dict[str, int]:
+        """Values of the given counters that are seeded and hold no live reservation"""
+
+    @abstractmethod
+    async def reconcile(self, values: Dict[str, int], snapshot: Dict[str, int]) -> int:
+        """Overwrite snapshotted counters with recounted values.
+
+        A counter is only replaced if it still equals its snapshot and has
+        no live reservation; one that moved in between keeps its value
+        until the next pass. Returns the number of counters replaced.
+        """
+
+    @abstractmethod
+    async def reserve(
+        self,
+        key: str,
+        reservation_id: str,
+        amount: int,
+        limit: int,
+        ttl: int
+    ) -> Optional[Tuple[bool, int]]:
+        """Atomically hold `amount` units against `limit` for up to `ttl` seconds.
+
+        Returns (granted, units already used or held), or None if the
+        counter isn't seeded yet.
+        """
+
+    @abstractmethod
+    async def release(self, key: str, reservation_id: str):
+        """Drop a reservation (expired ones are dropped automatically)"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        ...
+
+    async def close(self):
+        pass
+
+class MemoryQuotaStore(QuotaStore):
+    """In-process counters for a single node.
+
+    Updates never await between read and write, so they are atomic on the
+    event loop. Evicted or expired counters are simply re-seeded.
+    """
+
+    def __init__(self, max_keys: int, ttl: int):
+        self._counters = TTLCache(max_size=max_keys, default_ttl=ttl)
+        self._reservations: Dict[str, Dict[str, Tuple[int, float]]] = {}  # key -> id -> (amount, expires_at)
+        self.expired_reservations = 0
+
+    async def get(self, key: str) -> Optional[int]:
+        return self._counters.get(key)
+
+    async def seed(self, key: str, value: int) -> int:
+        current = self._counters.get(key)
+        if current is not None:
+            return current
+        self._counters.set(key, value)
+        return value
+
+    async def incr(self, key: str, amount: int = 1) -> Optional[int]:
+        current = self._counters.get(key)
+        if current is None:
+            return None
+        self._counters.set(key, current + amount)
+        return current + amount
+
+    async def snapshot(self, keys: List[str]) -> Dict[str, int]:
+        values = {}
+        for key in keys:
+            value = self._counters.get(key)
+            if value is not None and not self._live_reservations(key):
+                values[key] = value
+        return values
+
+    async def reconcile(self, values: Dict[str, int], snapshot: Dict[str, int]) -> int:
+        replaced = 0
+        for key, expected in snapshot.items():
+            if key not in values or self._counters.get(key) != expected or self._live_reservations(key):
+                continue
+            self._counters.set(key, values[key])
+            replaced += 1
+        # Also sweep reservations leaked by requests that never settled
+        for key in list(self._reservations):
+            self._live_reservations(key)
+        return replaced
+
+    def _live_reservations(self, key: str) -> Dict[str, Tuple[int, float]]:
+        held = self._reservations.get(key, {})
+        now = time.monotonic()
+        for reservation_id, (_, expires_at) in list(held.items()):
+            if expires_at <= now:
+                del held[reservation_id]
+                self.expired_reservations += 1
+        if not held:
+            self._reservations.pop(key, None)
+        return held
+
+    async def reserve(
+        self,
+        key: str,
+        reservation_id: str,
+        amount: int,
+        limit: int,
+        ttl: int
+    ) -> Optional[Tuple[bool, int]]:
+        used = self._counters.get(key)
+        if used is None:
+            return None
+
+        held = self._live_reservations(key)
+        pending = used + sum(held_amount for held_amount, _ in held.values())
+        if pending + amount > limit:
+            return False, pending
+
+        self._reservations.setdefault(key, held)[reservation_id] = (amount, time.monotonic() + ttl)
+        return True, pending
+
+    async def release(self, key: str, reservation_id: str):
+        held = self._reservations.get(key)
+        if held:
+            held.pop(reservation_id, None)
+            if not held:
+                del self._reservations[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            **self._counters.stats(),
+            "reservations_held": sum(len(held) for held in self._reservations.values()),
+            "reservations_expired": self.expired_reservations
+        }
+
+class RedisQuotaStore(QuotaStore):
+    """Redis counters shared by every worker and node.
+
+    Redis errors read as misses, so the limit check falls back to counting
+    in the database.
+    """
+
+    def __init__(self, url: str, ttl: int, prefix: str = "quota:"):
+        self._redis = aioredis.from_url(url)
+        self._incr_existing = self._redis.register_script(_INCR_EXISTING)
+        self._reserve = self._redis.register_script(_RESERVE)
+        self._reconcile = self._redis.register_script(_RECONCILE)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def get(self, key: str) -> Optional[int]:
+        try:
+            raw = await self._redis.get(self.prefix + key)
+        except Exception as e:
+            logger.error(f"Quota counter read failed: {str(e)}")
+            self.errors += 1
+            return None
+
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return int(raw)
+
+    async def seed(self, key: str, value: int) -> int:
+        try:
+            await self._redis.set(self.prefix + key, value, nx=True, ex=self.ttl)
+            raw = await self._redis.get(self.prefix + key)
+        except Exception as e:
+            logger.error(f"Quota counter seed failed: {str(e)}")
+            self.errors += 1
+            return value
+        return int(raw) if raw is not None else value
+
+    async def incr(self, key: str, amount: int = 1) -> Optional[int]:
+        try:
+            result = await self._incr_existing(keys=[self.prefix + key], args=[amount])
+        except Exception as e:
+            logger.error(f"Quota counter increment failed: {str(e)}")
+            self.errors += 1
+            return None
+        return int(result) if result is not None else None
+
+    async def snapshot(self, keys: List[str]) -> Dict[str, int]:
+        now = time.time()
+        try:
+            # MULTI/EXEC, so each counter is read together with its holds
+            async with self._redis.pipeline(transaction=True) as pipe:
+                for key in keys:
+                    pipe.get(self.prefix + key)
+                    pipe.zcount(self._reservation_keys(key)[0], f"({now}", "+inf")
+                results = await pipe.execute()
+        except Exception as e:
+            logger.error(f"Quota counter snapshot failed: {str(e)}")
+            self.errors += 1
+            return {}
+        return {
+            key: int(raw)
+            for key, raw, held in zip(keys, results[::2], results[1::2])
+            if raw is not None and not held
+        }
+
+    async def reconcile(self, values: Dict[str, int], snapshot: Dict[str, int]) -> int:
+        now = time.time()
+        keys = [key for key in snapshot if key in values]
+        try:
+            async with self._redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    await self._reconcile(
+                        keys=[self.prefix + key, self._reservation_keys(key)[0]],
+                        args=[snapshot[key], values[key], now],
+                        client=pipe
+                    )
+                results = await pipe.execute()
+        except Exception as e:
+            logger.error(f"Quota counter reconcile failed: {str(e)}")
+            self.errors += 1
+            return 0
+        return sum(int(result) for result in results)
+
+    def _reservation_keys(self, key: str) -> Tuple[str, str]:
+        return f"{self.prefix}{key}:held-until", f"{self.prefix}{key}:held"
+
+    async def reserve(
+        self,
+        key: str,
+        reservation_id: str,
+        amount: int,
+        limit: int,
+        ttl: int
+    ) -> Optional[Tuple[bool, int]]:
+        now = time.time()
+        try:
+            granted, pending = await self._reserve(
+                keys=[self.prefix + key, *self._reservation_keys(key)],
+                args=[now, now + ttl, reservation_id, amount, limit, ttl]
+            )
+        except Exception as e:
+            logger.error(f"Quota reservation failed: {str(e)}")
+            self.errors += 1
+            return None
+        if granted == -1:
+            return None
+        return bool(granted), int(pending)
+
+    async def release(self, key: str, reservation_id: str):
+        expiries, amounts = self._reservation_keys(key)
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                pipe.zrem(expiries, reservation_id)
+                pipe.hdel(amounts, reservation_id)
+                await pipe.execute()
+        except Exception as e:
+            # The reservation expires on its own
+            logger.error(f"Quota release failed: {str(e)}")
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+    async def close(self):
+        await self._redis.close()
+
+def build_quota_store() -> QuotaStore:
+    """Create the configured quota counter backend"""
+    if settings.QUOTA_COUNTER_BACKEND == "redis":
+        if aioredis and settings.REDIS_URL:
+            return RedisQuotaStore(settings.REDIS_URL, settings.QUOTA_COUNTER_TTL_SECONDS)
+        logger.warning("Redis quota counters unavailable, falling back to in-process counters")
+    return MemoryQuotaStore(settings.QUOTA_COUNTER_MAX_KEYS, settings.QUOTA_COUNTER_TTL_SECONDS)
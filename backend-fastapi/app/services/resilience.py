@@ -0,0 +1,214 @@
+from collections import deque
+from typing import Dict, Any, Optional
+import asyncio
+import math
+import time
+import logging
+
+from app.core.exceptions import ExternalServiceError
+
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker driven by error rate and slow calls"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        window_size: int,
+        min_calls: int,
+        failure_rate_threshold: float,
+        slow_call_seconds: float,
+        open_seconds: float,
+        half_open_max_calls: int = 1
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self._outcomes: deque = deque(maxlen=window_size)
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._half_open_round = 0
+        self.times_opened = 0
+
+    def before_call(self) -> Optional[int]:
+        """Admit a call, or fail fast with Retry-After while open.
+        
+        Returns a probe token for calls admitted as half-open probes (None
+        otherwise); pass it back to record() or record_cancelled().
+        """
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                raise ExternalServiceError(
+                    f"AI provider '{self.name}' is temporarily unavailable",
+                    retry_after=self.retry_after()
+                )
+            self.state = self.HALF_OPEN
+            self._half_open_calls = 0
+            self._half_open_round += 1
+            logger.info(f"Circuit for {self.name} half-open, probing")
+
+        if self.state == self.HALF_OPEN:
+            if self._half_open_calls >= self.half_open_max_calls:
+                raise ExternalServiceError(
+                    f"AI provider '{self.name}' is recovering",
+                    retry_after=1
+                )
+            self._half_open_calls += 1
+            return self._half_open_round
+        return None
+
+    def record(self, success: bool, latency: float, probe: Optional[int] = None):
+        """Record a finished call; slow successes count against the provider"""
+        bad = not success or latency > self.slow_call_seconds
+
+        if self.state == self.OPEN:
+            # Stragglers admitted before the breaker opened
+            return
+
+        if self.state == self.HALF_OPEN:
+            if not self._is_current_probe(probe):
+                # Admitted while closed, or a probe from an earlier round
+                return
+            self._half_open_calls -= 1
+            if bad:
+                self._open()
+            else:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+                logger.info(f"Circuit for {self.name} closed")
+            return
+
+        self._outcomes.append(bad)
+        if len(self._outcomes) >= self.min_calls and self.failure_rate() >= self.failure_rate_threshold:
+            self._open()
+
+    def record_cancelled(self, probe: Optional[int] = None):
+        """Release a half-open probe slot for a call that was cancelled"""
+        if self.state == self.HALF_OPEN and self._is_current_probe(probe):
+            self._half_open_calls -= 1
+
+    def _is_current_probe(self, probe: Optional[int]) -> bool:
+        return probe is not None and probe == self._half_open_round
+
+    def failure_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return sum(self._outcomes) / len(self._outcomes)
+
+    def retry_after(self) -> int:
+        """Whole seconds until the breaker will admit a probe"""
+        remaining = self.open_seconds - (time.monotonic() - self._opened_at)
+        return max(1, math.ceil(remaining))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "failure_rate": round(self.failure_rate(), 4),
+            "calls_in_window": len(self._outcomes),
+            "times_opened": self.times_opened,
+            "retry_after": self.retry_after() if self.state == self.OPEN else None
+        }
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.times_opened += 1
+        logger.warning(f"Circuit for {self.name} opened")
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit: grows additively while calls are fast and
+    succeed, shrinks multiplicatively on failures or slow calls.
+
+    Calls beyond the current limit wait in FIFO order for a slot, up to
+    the caller's timeout, and are then rejected, so bursts are smoothed
+    but a degraded provider cannot pile up waiters indefinitely. The limit
+    shrinks at most once per round of in-flight calls: bad outcomes of
+    calls started before the last decrease don't shrink it again.
+    """
+
+    def __init__(
+        self,
+        initial_limit: float,
+        min_limit: float,
+        max_limit: float,
+        latency_target: float,
+        backoff_ratio: float
+    ):
+        self.limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff_ratio = backoff_ratio
+        self.in_flight = 0
+        self.rejected = 0
+        self.queued = 0
+        self._waiters: deque = deque()
+        self._last_decrease = float("-inf")
+
+    async def acquire(self, timeout: float) -> bool:
+        """Take a slot, waiting up to `timeout` seconds for one to free up"""
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return True
+
+        self.queued += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # A woken waiter has already been handed its slot
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # Handed a slot just as we were cancelled; pass it on
+                self.release_cancelled()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self, success: bool, latency: float, started: float):
+        """Free a slot and adjust the limit from the call's outcome"""
+        self.in_flight -= 1
+        if not success or latency > self.latency_target:
+            if started >= self._last_decrease:
+                self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                self._last_decrease = time.monotonic()
+        else:
+            # Roughly +1 per limit's worth of good calls
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        self._wake()
+
+    def release_cancelled(self):
+        """Free a slot without adjusting the limit"""
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(True)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "queued": self.queued,
+            "rejected": self.rejected
+        }
@@ -0,0 +1,130 @@
+import hashlib
+import json
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Any, List
+import logging
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+from app.core.config import settings
+from app.core.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache(ABC):
+    """Exact-match cache of AI responses keyed by a content hash"""
+
+    @staticmethod
+    def make_key(
+        provider: str,
+        model: Optional[str],
+        full_prompt: str,
+        screen_context: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> str:
+        """Hash everything that determines the provider's answer"""
+        screen_hash = hashlib.sha256(screen_context.encode()).hexdigest() if screen_context else None
+        material = json.dumps([provider, model or "", full_prompt, screen_hash, history or []])
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: Dict[str, Any]):
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        ...
+
+    async def close(self):
+        pass
+
+class MemoryResponseCache(ResponseCache):
+    """In-process LRU/TTL response cache with a memory budget"""
+
+    def __init__(self, max_entries: int, ttl: int, max_bytes: int):
+        self._cache = TTLCache(
+            max_size=max_entries,
+            default_ttl=ttl,
+            max_bytes=max_bytes,
+            size_of=lambda value: len(value["response"].encode())
+        )
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self._cache.get(key)
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        self._cache.set(key, value)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", **self._cache.stats()}
+
+class RedisResponseCache(ResponseCache):
+    """Redis-backed response cache shared by all workers.
+
+    Expiry uses Redis TTLs; LRU eviction and the memory budget are left to
+    the server's maxmemory policy. Redis errors are treated as misses.
+    """
+
+    def __init__(self, url: str, ttl: int, prefix: str = "ai-response:"):
+        self._redis = aioredis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            raw = await self._redis.get(self.prefix + key)
+        except Exception as e:
+            logger.error(f"Response cache read failed: {str(e)}")
+            self.errors += 1
+            return None
+
+        if raw is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(raw)
+
+    async def set(self, key: str, value: Dict[str, Any]):
+        try:
+            await self._redis.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+        except Exception as e:
+            logger.error(f"Response cache write failed: {str(e)}")
+            self.errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", "hits": self.hits, "misses": self.misses, "errors": self.errors}
+
+    async def close(self):
+        await self._redis.close()
+
+def build_response_cache() -> Optional[ResponseCache]:
+    """Create the configured response cache backend (None when disabled)"""
+    backend = settings.AI_RESPONSE_CACHE_BACKEND
+
+    if backend == "redis":
+        if aioredis and settings.REDIS_URL:
+            return RedisResponseCache(settings.REDIS_URL, settings.AI_RESPONSE_CACHE_TTL_SECONDS)
+        logger.warning("Redis response cache unavailable, falling back to in-process cache")
+        backend = "memory"
+
+    if backend == "memory":
+        return MemoryResponseCache(
+            max_entries=settings.AI_RESPONSE_CACHE_MAX_ENTRIES,
+            ttl=settings.AI_RESPONSE_CACHE_TTL_SECONDS,
+            max_bytes=settings.AI_RESPONSE_CACHE_MAX_BYTES
+        )
+
+    return None
+
+# Global instance
+response_cache = build_response_cache()
@@ -1,59 +1,271 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_
-from datetime import datetime
-from typing import Dict, Any, Tuple
+from sqlalchemy import select, func, and_, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime, timezone
+from typing import Dict, Any, Tuple, Optional, List
+import asyncio
+import logging
 import uuid
 
-from app.core.database import User, Plan, UsageTracking, PlanType
+from app.core.config import settings
+from app.core.cache import TTLCache
+from app.core.database import async_session_factory, User, Plan, UsageTracking, UsageMonthly, PlanType
+from app.services.quota_store import build_quota_store
+from app.services.usage_writer import UsageWriter
+
+logger = logging.getLogger(__name__)
+
+# Actions whose monthly counts are limited by plans
+COUNTED_ACTIONS = ("ask", "session_start")
+
+def _upsert_insert(db: AsyncSession):
+    """The dialect's INSERT construct, which supports ON CONFLICT"""
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise RuntimeError(f"Usage upserts not supported on {dialect}")
+
+def rollup_upsert(db: AsyncSession, rows: List[Dict[str, Any]], replace: bool = False):
+    """INSERT ... ON CONFLICT DO UPDATE for usage_monthly rows.
+    
+    Each row carries the key columns plus count and quantity_sum, which are
+    added to the stored totals, or overwrite them with replace=True.
+    """
+    stmt = _upsert_insert(db)(UsageMonthly).values(rows)
+    if replace:
+        totals = {"count": stmt.excluded.count, "quantity_sum": stmt.excluded.quantity_sum}
+    else:
+        totals = {
+            "count": UsageMonthly.count + stmt.excluded.count,
+            "quantity_sum": UsageMonthly.quantity_sum + stmt.excluded.quantity_sum
+        }
+    return stmt.on_conflict_do_update(
+        index_elements=[UsageMonthly.user_id, UsageMonthly.year, UsageMonthly.month, UsageMonthly.action_type],
+        set_={**totals, "updated_at": func.now()}
+    )
+
+class QuotaReservation:
+    """Units of a monthly limit held for asks that are still in flight"""
+    
+    def __init__(self, key: Optional[str], reservation_id: Optional[str], quantity: int):
+        self.key = key  # None for unlimited plans and when the counter store is unavailable
+        self.reservation_id = reservation_id
+        self.quantity = quantity
+        self.settled = False
 
 class UsageService:
-    """Service for tracking and managing user usage"""
+    """Service for tracking and managing user usage.
     
-    async def can_user_ask(self, user_id: uuid.UUID, db: AsyncSession) -> Tuple[bool, Dict[str, Any]]:
-        """Check if user can make an ask request based on their plan limits"""
-        
-        # Get user's current plan
-        user_result = await db.execute(
-            select(User).where(User.id == user_id)
-        )
-        user = user_result.scalar_one()
+    Every tracked event also bumps its usage_monthly rollup row in the same
+    transaction, so monthly totals are a single-row read. Counts of limited
+    actions are additionally kept in a quota counter store, seeded from the
+    rollup on first use and re-read periodically.
+    
+    Events are written behind a buffer in bulk unless the caller asks for
+    a synchronous write (asks and session starts, whose rows must commit
+    with the caller's transaction). Asks reserve their unit before the
+    provider call, so concurrent requests can't all pass the same check.
+    """
+    
+    def __init__(self):
+        self.counters = build_quota_store()
+        self._plan_limits = TTLCache(max_size=16, default_ttl=settings.PLAN_LIMITS_CACHE_TTL_SECONDS)
+        self._reconcile_task: Optional[asyncio.Task] = None
+        self.writer = UsageWriter(self._write_rows)
+    
+    @staticmethod
+    def counter_key(user_id: str, action_type: str, year: int, month: int) -> str:
+        return f"{user_id}:{action_type}:{year}-{month:02d}"
+    
+    async def get_plan_limits(self, plan_type: PlanType, db: AsyncSession) -> Dict[str, int]:
+        """Monthly ask and session limits of a plan (-1 for unlimited), cached"""
+        limits = self._plan_limits.get(plan_type.value)
+        if limits is None:
+            plan_result = await db.execute(
+                select(Plan).where(Plan.plan_type == plan_type)
+            )
+            plan = plan_result.scalar_one_or_none()
+            if plan:
+                limits = {"asks": plan.ask_limit_monthly, "sessions": plan.session_limit_monthly}
+            else:
+                # Default free plan limits
+                limits = {"asks": 10, "sessions": 5}
+            self._plan_limits.set(plan_type.value, limits)
+        return limits
+    
+    def invalidate_plan_limits(self):
+        """Forget cached plan limits after a plan is created or changed"""
+        self._plan_limits.clear()
+    
+    async def get_usage_count(self, user_id: str, action_type: str, db: AsyncSession) -> int:
+        """This month's count of an action, from the counter store when possible"""
+        now = datetime.now()
+        key = self.counter_key(user_id, action_type, now.year, now.month)
         
-        # Get plan details
-        plan_result = await db.execute(
-            select(Plan).where(Plan.plan_type == user.current_plan)
+        count = await self.counters.get(key)
+        if count is None:
+            count = await self._count_usage(user_id, action_type, now.year, now.month, db)
+            count = await self.counters.seed(key, count)
+        return count
+    
+    async def _count_usage(self, user_id: str, action_type: str, year: int, month: int, db: AsyncSession) -> int:
+        usage_result = await db.execute(
+            select(UsageMonthly.count)
+            .where(
+                and_(
+                    UsageMonthly.user_id == user_id,
+                    UsageMonthly.action_type == action_type,
+                    UsageMonthly.month == month,
+                    UsageMonthly.year == year
+                )
+            )
         )
-        plan = plan_result.scalar_one_or_none()
+        return usage_result.scalar() or 0
+    
+    async def can_user_ask(
+        self,
+        user: User,
+        db: AsyncSession,
+        quantity: int = 1
+    ) -> Tuple[bool, Dict[str, Any]]:
+        """Check if user can make `quantity` ask requests based on their plan limits"""
         
-        if not plan:
-            # If no plan found, default to free limits
-            ask_limit = 10  # Free plan default
-        else:
-            ask_limit = plan.ask_limit_monthly
+        ask_limit = (await self.get_plan_limits(user.current_plan, db))["asks"]
         
         # If unlimited (-1), allow
         if ask_limit == -1:
             return True, {"used": 0, "limit": -1}
         
-        # Count usage for current month
-        current_month = datetime.now().month
-        current_year = datetime.now().year
+        usage_count = await self.get_usage_count(user.id, "ask", db)
         
-        usage_result = await db.execute(
-            select(func.count(UsageTracking.id))
-            .where(
-                and_(
-                    UsageTracking.user_id == user_id,
-                    UsageTracking.action_type == "ask",
-                    UsageTracking.month == current_month,
-                    UsageTracking.year == current_year
-                )
-            )
+        can_ask = usage_count + quantity <= ask_limit
+        
+        return can_ask, {"used": usage_count, "limit": ask_limit}
+    
+    async def reserve(
+        self,
+        user_id: str,
+        plan_type: PlanType,
+        db: AsyncSession,
+        quantity: int = 1,
+        action_type: str = "ask"
+    ) -> Tuple[Optional[QuotaReservation], Dict[str, Any]]:
+        """Atomically hold `quantity` units of this month's limit.
+        
+        Succeeds only if used + already held + quantity stays within the
+        limit; returns None (with the usage info) otherwise. Every granted
+        reservation must be committed or released; one that is neither
+        (a crashed worker) lapses after QUOTA_RESERVATION_TTL_SECONDS.
+        """
+        limits = await self.get_plan_limits(plan_type, db)
+        limit = limits["asks" if action_type == "ask" else "sessions"]
+        if limit == -1:
+            return QuotaReservation(None, None, quantity), {"used": 0, "limit": -1}
+        
+        now = datetime.now()
+        key = self.counter_key(user_id, action_type, now.year, now.month)
+        reservation_id = uuid.uuid4().hex
+        
+        outcome = await self.counters.reserve(
+            key, reservation_id, quantity, limit, settings.QUOTA_RESERVATION_TTL_SECONDS
         )
-        usage_count = usage_result.scalar() or 0
+        if outcome is None:
+            # Counter not seeded yet (or evicted): count once, then try again
+            await self.get_usage_count(user_id, action_type, db)
+            outcome = await self.counters.reserve(
+                key, reservation_id, quantity, limit, settings.QUOTA_RESERVATION_TTL_SECONDS
+            )
         
-        can_ask = usage_count < ask_limit
+        if outcome is None:
+            # Counter store unavailable; fall back to a plain check
+            used = await self.get_usage_count(user_id, action_type, db)
+            if used + quantity > limit:
+                return None, {"used": used, "limit": limit}
+            return QuotaReservation(None, None, quantity), {"used": used, "limit": limit}
         
-        return can_ask, {"used": usage_count, "limit": ask_limit}
+        granted, used = outcome
+        if not granted:
+            return None, {"used": used, "limit": limit}
+        return QuotaReservation(key, reservation_id, quantity), {"used": used, "limit": limit}
+    
+    async def commit_reservation(self, reservation: QuotaReservation):
+        """Settle a reservation whose asks were tracked and committed.
+        
+        track_usage already counted the successful asks, so the hold is
+        simply dropped; held units with no tracked ask (failed batch items)
+        are freed along with it.
+        """
+        await self._settle(reservation)
+    
+    async def release_reservation(self, reservation: QuotaReservation):
+        """Give back a reservation whose ask failed or was cancelled"""
+        await self._settle(reservation)
+    
+    async def _settle(self, reservation: QuotaReservation):
+        if reservation.settled:
+            return
+        reservation.settled = True
+        if reservation.key:
+            await self.counters.release(reservation.key, reservation.reservation_id)
+    
+    async def _month_counts(self, year: int, month: int) -> Dict[str, int]:
+        """Committed counts of limited actions for a month, by counter key"""
+        async with async_session_factory() as db:
+            result = await db.execute(
+                select(UsageMonthly.user_id, UsageMonthly.action_type, UsageMonthly.count)
+                .where(
+                    and_(
+                        UsageMonthly.action_type.in_(COUNTED_ACTIONS),
+                        UsageMonthly.month == month,
+                        UsageMonthly.year == year
+                    )
+                )
+            )
+            return {
+                self.counter_key(user_id, action_type, year, month): count
+                for user_id, action_type, count in result.all()
+            }
+    
+    async def reconcile_counters(self) -> int:
+        """Re-read this month's committed totals and correct any drifted counters.
+        
+        Counters are incremented before their rows commit, so a plain
+        overwrite would drop asks in flight. Each counter is snapshotted
+        before the recount and only replaced if it hasn't moved since and
+        holds no live reservation; busy counters wait for the next pass.
+        Returns the number of counters replaced.
+        """
+        now = datetime.now()
+        keys = list(await self._month_counts(now.year, now.month))
+        snapshot = await self.counters.snapshot(keys)
+        # Rows counted before the snapshot must be committed before the recount
+        await self.writer.flush()
+        counts = await self._month_counts(now.year, now.month)
+        return await self.counters.reconcile(counts, snapshot)
+    
+    async def _reconcile_loop(self):
+        while True:
+            await asyncio.sleep(settings.QUOTA_RECONCILE_SECONDS)
+            try:
+                await self.reconcile_counters()
+            except Exception as e:
+                logger.error(f"Error reconciling quota counters: {str(e)}")
+    
+    def start(self):
+        """Start the usage writer and periodic counter reconciliation (called from the app lifespan)"""
+        self.writer.start()
+        if self._reconcile_task is None:
+            self._reconcile_task = asyncio.create_task(self._reconcile_loop())
+    
+    async def stop(self):
+        """Flush buffered usage rows and stop background work"""
+        if self._reconcile_task:
+            self._reconcile_task.cancel()
+            self._reconcile_task = None
+        await self.writer.stop()
+        await self.counters.close()
     
     async def track_usage(
         self,
@@ -61,23 +273,132 @@ class UsageService:
         action_type: str,
         resource_used: str = None,
         quantity: int = 1,
-        db: AsyncSession = None
+        db: AsyncSession = None,
+        sync: bool = False
     ):
-        """Track user usage"""
+        """Track user usage.
+        
+        With sync=True the row and its rollup update join the caller's
+        transaction (the caller commits). Otherwise the row is buffered and
+        bulk-inserted by the usage writer, and `db` is not touched.
+        """
         
         current_date = datetime.now()
         
-        usage_record = UsageTracking(
-            user_id=user_id,
-            action_type=action_type,
-            resource_used=resource_used,
-            quantity=quantity,
-            month=current_date.month,
-            year=current_date.year
+        if sync or not self.writer.running:
+            usage_record = UsageTracking(
+                user_id=user_id,
+                action_type=action_type,
+                resource_used=resource_used,
+                quantity=quantity,
+                month=current_date.month,
+                year=current_date.year
+            )
+            
+            db.add(usage_record)
+            await db.execute(rollup_upsert(db, self._rollup_rows([{
+                "user_id": user_id,
+                "action_type": action_type,
+                "quantity": quantity,
+                "month": current_date.month,
+                "year": current_date.year
+            }])))
+            # Note: Don't commit here, let the caller handle it
+        else:
+            await self.writer.add({
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "action_type": action_type,
+                "resource_used": resource_used,
+                "quantity": quantity,
+                "month": current_date.month,
+                "year": current_date.year,
+                "created_at": datetime.now(timezone.utc)
+            })
+        
+        if action_type in COUNTED_ACTIONS:
+            # Counts ahead of the commit; a rolled-back row is corrected on reconcile
+            await self.counters.incr(
+                self.counter_key(user_id, action_type, current_date.year, current_date.month)
+            )
+    
+    async def track_usage_batch(
+        self,
+        user_id: str,
+        events: List[Dict[str, Any]],
+        db: AsyncSession
+    ) -> int:
+        """Record client-reported events in one statement, skipping repeats.
+        
+        Each event has client_event_id, action_type, resource_used, quantity
+        and created_at. Events whose (user_id, client_event_id) is already
+        stored are ignored, so a client can safely resend a batch. Only
+        the inserted rows update the rollup and quota counters. Returns the
+        number inserted; the caller commits.
+        """
+        rows = []
+        for event in events:
+            # Month buckets follow the server's local calendar, like track_usage
+            local_time = event["created_at"].astimezone()
+            rows.append({
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "month": local_time.month,
+                "year": local_time.year,
+                **event
+            })
+        
+        stmt = _upsert_insert(db)(UsageTracking).values(rows)
+        stmt = stmt.on_conflict_do_nothing(
+            index_elements=[UsageTracking.user_id, UsageTracking.client_event_id]
+        ).returning(
+            UsageTracking.user_id,
+            UsageTracking.action_type,
+            UsageTracking.quantity,
+            UsageTracking.month,
+            UsageTracking.year
         )
+        inserted = [dict(row) for row in (await db.execute(stmt)).mappings()]
+        if not inserted:
+            return 0
+        
+        totals = self._rollup_rows(inserted)
+        await db.execute(rollup_upsert(db, totals))
         
-        db.add(usage_record)
-        # Note: Don't commit here, let the caller handle it
+        for total in totals:
+            if total["action_type"] in COUNTED_ACTIONS:
+                await self.counters.incr(
+                    self.counter_key(user_id, total["action_type"], total["year"], total["month"]),
+                    total["count"]
+                )
+        return len(inserted)
+    
+    @staticmethod
+    def _rollup_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Sum usage rows into usage_monthly increments"""
+        totals: Dict[tuple, Dict[str, Any]] = {}
+        for row in rows:
+            key = (row["user_id"], row["year"], row["month"], row["action_type"])
+            total = totals.get(key)
+            if total is None:
+                total = totals[key] = {
+                    "user_id": row["user_id"],
+                    "year": row["year"],
+                    "month": row["month"],
+                    "action_type": row["action_type"],
+                    "count": 0,
+                    "quantity_sum": 0
+                }
+            total["count"] += 1
+            total["quantity_sum"] += row["quantity"] or 0
+        return list(totals.values())
+    
+    async def _write_rows(self, rows: List[Dict[str, Any]]):
+        """Insert buffered usage rows with one multi-row INSERT, plus their rollup, in one transaction"""
+        async with async_session_factory() as db:
+            await db.execute(insert(UsageTracking).values(rows))
+            await db.execute(rollup_upsert(db, self._rollup_rows(rows)))
+            await db.commit()
     
     async def get_user_usage(self, user_id: uuid.UUID, db: AsyncSession) -> Dict[str, Any]:
         """Get user's current usage statistics"""
@@ -97,33 +418,21 @@ class UsageService:
         current_month = datetime.now().month
         current_year = datetime.now().year
         
-        # Count asks used this month
-        asks_result = await db.execute(
-            select(func.count(UsageTracking.id))
-            .where(
-                and_(
-                    UsageTracking.user_id == user_id,
-                    UsageTracking.action_type == "ask",
-                    UsageTracking.month == current_month,
-                    UsageTracking.year == current_year
-                )
-            )
-        )
-        asks_used = asks_result.scalar() or 0
-        
-        # Count sessions used this month
-        sessions_result = await db.execute(
-            select(func.count(UsageTracking.id))
+        # This month's totals, one rollup row per action
+        usage_result = await db.execute(
+            select(UsageMonthly.action_type, UsageMonthly.count)
             .where(
                 and_(
-                    UsageTracking.user_id == user_id,
-                    UsageTracking.action_type == "session_start",
-                    UsageTracking.month == current_month,
-                    UsageTracking.year == current_year
+                    UsageMonthly.user_id == user_id,
+                    UsageMonthly.action_type.in_(COUNTED_ACTIONS),
+                    UsageMonthly.month == current_month,
+                    UsageMonthly.year == current_year
                 )
             )
         )
-        sessions_used = sessions_result.scalar() or 0
+        used = dict(usage_result.all())
+        asks_used = used.get("ask", 0)
+        sessions_used = used.get("session_start", 0)
         
         # Get limits from plan
         if plan:
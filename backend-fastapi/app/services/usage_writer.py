@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy.exc import InterfaceError, OperationalError
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class UsageWriter:
+    """Write-behind buffer for usage rows.
+
+    Rows are handed to `write` in batches of up to USAGE_FLUSH_ROWS, every
+    USAGE_FLUSH_INTERVAL_MS or as soon as a full batch is waiting. Once
+    USAGE_BUFFER_MAX_ROWS rows are buffered, add() waits for a flush
+    (backpressure) rather than growing without bound. A failed batch is
+    retried row by row: rows the database rejects are logged and dropped,
+    and if the database itself is unreachable the rows stay buffered for
+    the next flush.
+    """
+
+    def __init__(self, write: Callable[[List[Dict[str, Any]]], Awaitable[None]]):
+        self._write = write
+        self._rows: List[Dict[str, Any]] = []
+        self._has_space = asyncio.Event()
+        self._has_space.set()
+        self._batch_ready = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.counters = {
+            "buffered": 0,
+            "written": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "dropped": 0,
+            "backpressure_waits": 0
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def add(self, row: Dict[str, Any]):
+        """Buffer a row, waiting for a flush if the buffer is full"""
+        if len(self._rows) >= settings.USAGE_BUFFER_MAX_ROWS:
+            self.counters["backpressure_waits"] += 1
+        while len(self._rows) >= settings.USAGE_BUFFER_MAX_ROWS:
+            self._has_space.clear()
+            self._batch_ready.set()
+            await self._has_space.wait()
+
+        self._rows.append(row)
+        self.counters["buffered"] += 1
+        if len(self._rows) >= settings.USAGE_FLUSH_ROWS:
+            self._batch_ready.set()
+
+    async def flush(self):
+        """Write everything buffered so far"""
+        async with self._flush_lock:
+            while self._rows:
+                batch = self._rows[:settings.USAGE_FLUSH_ROWS]
+                self.counters["flushes"] += 1
+                try:
+                    await self._write(batch)
+                    handled = len(batch)
+                    self.counters["written"] += handled
+                except Exception as e:
+                    self.counters["flush_errors"] += 1
+                    logger.error(f"Error writing {len(batch)} usage rows, retrying one by one: {str(e)}")
+                    handled = await self._write_each(batch)
+
+                # Rows added during the write were appended after this batch
+                del self._rows[:handled]
+                self._has_space.set()
+                if handled < len(batch):
+                    # Database unavailable; keep the rest for the next flush
+                    return
+
+    async def _write_each(self, batch: List[Dict[str, Any]]) -> int:
+        """Write rows singly, dropping ones the database rejects.
+
+        Returns how many rows were written or dropped. Stops at the first
+        connection-level failure, leaving that row and the rest buffered.
+        """
+        for index, row in enumerate(batch):
+            try:
+                await self._write([row])
+                self.counters["written"] += 1
+            except (OperationalError, InterfaceError, OSError) as e:
+                logger.error(f"Usage writes failing, keeping {len(batch) - index} rows buffered: {str(e)}")
+                return index
+            except Exception as e:
+                self.counters["dropped"] += 1
+                logger.error(f"Dropping usage row the database rejected: {row!r}: {str(e)}")
+        return len(batch)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the flush loop and write out what is left"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._rows:
+            logger.error(f"Dropping {len(self._rows)} usage rows that could not be written at shutdown")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "pending": len(self._rows)}
+
+    async def _flush_loop(self):
+        interval = settings.USAGE_FLUSH_INTERVAL_MS / 1000
+        while True:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            await self.flush()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import math
+import statistics
+import sys
+import os
+import socket
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+# Add the app directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from app.core.config import settings
+from app.auth.neon_auth import NeonAuthService
+
+def stub_stack_auth(latency_ms: float) -> FastAPI:
+    """Answers session verification like Stack Auth, after a fixed delay"""
+    app = FastAPI()
+
+    @app.post("/api/v1/auth/sessions/verify")
+    async def verify():
+        await asyncio.sleep(latency_ms / 1000)
+        return {"user": {"id": "benchmark-user", "email": "benchmark@example.com"}}
+
+    return app
+
+def start_stub(port: int, latency_ms: float) -> uvicorn.Server:
+    """Run the stub in a background thread; port 0 picks a free one"""
+    if port == 0:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(
+        stub_stack_auth(latency_ms), host="127.0.0.1", port=port, log_level="warning"
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            sys.exit(f"Stub Stack Auth server could not start on port {port}")
+        time.sleep(0.01)
+    settings.STACK_AUTH_BASE_URL = f"http://127.0.0.1:{port}"
+    return server
+
+async def verify_per_call(service: NeonAuthService, token: str):
+    """A new client, and so a new connection, per verification (before pooling)"""
+    async with httpx.AsyncClient(
+        base_url=service.base_url,
+        headers={"Authorization": f"Bearer {service.secret_key}"},
+        timeout=settings.AUTH_VERIFY_TIMEOUT_SECONDS
+    ) as client:
+        response = await client.post(
+            "/api/v1/auth/sessions/verify",
+            json={"session_token": token, "project_id": service.project_id}
+        )
+        response.raise_for_status()
+
+async def verify_pooled(service: NeonAuthService, token: str):
+    """The shared keep-alive client; bypasses the token cache so every call goes out"""
+    user, _ = await service._verify_token_remote(token)
+    if user is None:
+        raise RuntimeError("Verification failed")
+
+async def run(verify, service: NeonAuthService, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await verify(service, f"benchmark-token-{i}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return time.perf_counter() - started, latencies
+
+async def main(requests: int, concurrency: int):
+    service = NeonAuthService()
+    await service.startup()
+    print(f"🔐 {requests} verifications against {service.base_url}, concurrency {concurrency}\n")
+    print(f"{'mode':<10}{'seconds':>10}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    try:
+        for mode, verify in (("per-call", verify_per_call), ("pooled", verify_pooled)):
+            elapsed, latencies = await run(verify, service, requests, concurrency)
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1000
+            p99 = latencies[max(0, math.ceil(len(latencies) * 0.99) - 1)] * 1000
+            print(f"{mode:<10}{elapsed:>10.2f}{requests / elapsed:>10.0f}{p50:>10.1f}{p99:>10.1f}")
+    finally:
+        await service.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stack Auth verification throughput, client per call vs the shared pool")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--url", default=None, help="verify against this Stack Auth base URL instead of a local stub")
+    parser.add_argument("--port", type=int, default=0, help="local stub port (default: any free port)")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="local stub response delay")
+    args = parser.parse_args()
+
+    stub = None
+    if args.url:
+        settings.STACK_AUTH_BASE_URL = args.url
+    else:
+        stub = start_stub(args.port, args.latency_ms)
+    try:
+        asyncio.run(main(args.requests, args.concurrency))
+    finally:
+        if stub:
+            stub.should_exit = True
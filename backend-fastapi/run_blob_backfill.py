@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+
+import asyncio
+import sys
+import os
+
+# Add the app directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from app.core.migrations import backfill_screen_captures
+
+if __name__ == "__main__":
+    print("📦 Moving screen captures into the blob store...")
+    migrated = asyncio.run(backfill_screen_captures())
+    print(f"✅ Backfill completed! {migrated} messages processed")
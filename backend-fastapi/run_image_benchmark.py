@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""Screen capture preprocessing per provider profile, then the capture bytes
+that reach a provider over a simulated session, measured by the stub LLM.
+
+Sample session run, 30 asks to claude with a real screen change every 10
+(the rest only move a caret), against the local stub:
+
+    session     images   bytes to provider   vs ask
+    ask             30             6221043   1.0000
+    listen           3              622218   0.1000
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import sys
+import os
+import socket
+import threading
+import time
+import uuid
+
+# Add the app directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+import httpx
+import uvicorn
+from PIL import Image, ImageDraw
+
+from app.core.config import settings
+from app.core.database import Session, SessionType
+from app.devtools.stub_llm import StubConfig, create_app
+from app.services.image_service import _preprocess_capture, image_service
+
+RUNS = 10
+
+def synthetic_capture(width: int = 2560, height: int = 1440, page: int = 0, cursor: int = 0) -> bytes:
+    """Full-resolution PNG that looks roughly like a desktop screenshot.
+
+    page changes the layout (a different screen); cursor only moves a small
+    caret, which is what most re-sent listen/meeting captures look like.
+    """
+    image = Image.new("RGB", (width, height), (246, 246, 248))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, width, 48), fill=(40, 44, 52))
+    sidebar = 320 + (page % 4) * 400
+    draw.rectangle((0, 48, sidebar, height), fill=(30 + page * 50 % 200, 60, 90))
+    for row in range(80, height - 40, 28):
+        for col in range(sidebar + 40, width - 200, 180):
+            shade = (row * 7 + col * (page + 1)) % 120
+            draw.rectangle((col, row, col + 140, row + 12), fill=(shade, shade, shade + 40))
+    draw.rectangle((600 + cursor * 14, 400, 602 + cursor * 14, 420), fill=(0, 0, 0))
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+def start_stub() -> str:
+    """Stub LLM on a free port in a background thread; returns its base URL"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(
+        create_app(StubConfig(latency_ms=1, latency_sigma=0, response_tokens=20, seed=1)),
+        host="127.0.0.1", port=port, log_level="warning"
+    ))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    base_url = f"http://127.0.0.1:{port}"
+    settings.OPENAI_API_KEY = settings.CLAUDE_API_KEY = settings.GEMINI_API_KEY = "stub"
+    settings.OPENAI_BASE_URL = f"{base_url}/v1"
+    settings.CLAUDE_BASE_URL = settings.GEMINI_BASE_URL = base_url
+    return base_url
+
+def profiles(data: bytes):
+    print(f"🖼️  Capture: {len(data)} bytes, {RUNS} runs per profile\n")
+    print(f"{'profile':<10}{'bytes out':>12}{'ratio':>9}{'cpu ms':>10}{'size':>14}")
+    for name, profile in settings.IMAGE_PROVIDER_PROFILES.items():
+        results = [
+            _preprocess_capture(data, profile["max_dimension"], profile["format"], profile["quality"])
+            for _ in range(RUNS)
+        ]
+        cpu_ms = sum(r["cpu_seconds"] for r in results) * 1000 / RUNS
+        result = results[-1]
+        print(
+            f"{name:<10}{len(result['data']):>12}{len(result['data']) / len(data):>9.3f}"
+            f"{cpu_ms:>10.1f}{result['width']:>8}x{result['height']}"
+        )
+
+async def session(captures, provider: str):
+    """Bytes of capture that reach the provider, per session type, over one run of asks"""
+    # Imported here: the ask routes need the database settings from the environment
+    from app.api.routes.ask import _prepare_capture
+    from app.services.ai_service import AIService
+
+    base_url = start_stub()
+    service = AIService()
+    raw = sum(len(capture) for capture in captures)
+    print(f"\n📨 {len(captures)} asks with captures to {provider}, {raw} raw capture bytes\n")
+    print(f"{'session':<10}{'images':>8}{'bytes to provider':>20}{'vs ask':>9}")
+    baseline = None
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        for session_type in (SessionType.ASK, SessionType.LISTEN):
+            before = (await client.get("/__stub/stats")).json()
+            chat = Session(id=str(uuid.uuid4()), session_type=session_type)
+            for index, data in enumerate(captures):
+                capture = await _prepare_capture(base64.b64encode(data).decode(), provider, chat)
+                response = await service.ask_ai(
+                    prompt=f"What is on screen now? ({index})",
+                    provider=provider,
+                    use_cache=False,
+                    screen_context_ref=capture.ref,
+                    image=capture.image,
+                    screen_description=capture.description
+                )
+                capture.remember(response["response"])
+            after = (await client.get("/__stub/stats")).json()
+            sent = after["image_bytes"] - before["image_bytes"]
+            baseline = baseline or sent
+            print(
+                f"{session_type.value:<10}{after['images'] - before['images']:>8}"
+                f"{sent:>20}{sent / baseline:>9.4f}"
+            )
+    image_service.shutdown()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Screen capture preprocessing and the bytes it sends to providers")
+    parser.add_argument("capture", nargs="?", help="image file to profile (default: a synthetic screenshot)")
+    parser.add_argument("--asks", type=int, default=30, help="asks in the simulated session")
+    parser.add_argument("--change-every", type=int, default=10, help="asks between real screen changes")
+    parser.add_argument("--provider", default="claude")
+    args = parser.parse_args()
+
+    if args.capture:
+        with open(args.capture, "rb") as f:
+            data = f.read()
+    else:
+        data = synthetic_capture()
+    profiles(data)
+
+    captures = [
+        synthetic_capture(page=index // args.change_every, cursor=index % args.change_every)
+        for index in range(args.asks)
+    ]
+    asyncio.run(session(captures, args.provider))
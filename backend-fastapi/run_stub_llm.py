@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+import argparse
+import sys
+import os
+
+import uvicorn
+
+# Add the app directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from app.devtools.stub_llm import StubConfig, create_app
+
+if __name__ == "__main__":
+    defaults = StubConfig()
+    parser = argparse.ArgumentParser(description="Local OpenAI/Anthropic/Gemini stand-in for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms, help="median time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=defaults.latency_sigma, help="log-normal spread, 0 = fixed")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second)
+    parser.add_argument("--response-tokens", type=int, default=defaults.response_tokens, help="mean response length")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate)
+    parser.add_argument("--error-statuses", type=int, nargs="+", default=defaults.error_statuses)
+    parser.add_argument("--stall-rate", type=float, default=defaults.stall_rate)
+    parser.add_argument("--stall-seconds", type=float, default=defaults.stall_seconds)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = StubConfig(**{
+        key: value for key, value in vars(args).items() if key not in ("host", "port")
+    })
+    base_url = f"http://{args.host}:{args.port}"
+    print(f"🧪 Stub LLM server on {base_url}")
+    print(f"   OPENAI_BASE_URL={base_url}/v1 CLAUDE_BASE_URL={base_url} GEMINI_BASE_URL={base_url}")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+
+import asyncio
+import sys
+import os
+
+# Add the app directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from app.core.migrations import backfill_usage_rollup
+
+if __name__ == "__main__":
+    print("📊 Rebuilding monthly usage rollup from usage_tracking...")
+    written = asyncio.run(backfill_usage_rollup())
+    print(f"✅ Backfill completed! {written} rollup rows written")
@@ -0,0 +1,158 @@
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+# Settings are read at import time; point them at a throwaway SQLite database
+_db_dir = tempfile.mkdtemp(prefix="glass-tests-")
+# SQLite has a single writer; concurrent tests wait for the lock instead of failing
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_db_dir}/test.db?timeout=30")
+os.environ.setdefault("NEXT_PUBLIC_STACK_PROJECT_ID", "test-project")
+os.environ.setdefault("NEXT_PUBLIC_STACK_PUBLISHABLE_CLIENT_KEY", "test-client-key")
+os.environ.setdefault("STACK_SECRET_SERVER_KEY", "test-server-key")
+os.environ.setdefault("STRIPE_TEST_SECRET_KEY", "sk_test_placeholder")
+os.environ.setdefault("ENVIRONMENT", "test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import pytest
+import pytest_asyncio
+import uvicorn
+
+from app.core.database import engine, Base
+from app.devtools.stub_llm import StubConfig, create_app
+
+@pytest_asyncio.fixture
+async def db_tables():
+    """Fresh tables for one test"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    yield
+    await engine.dispose()
+
+@pytest.fixture(params=["memory", "redis"])
+def quota_backend(request, monkeypatch):
+    """Run a test against both quota counter stores; Redis is faked in process"""
+    from app.core.config import settings
+    from app.services import quota_store
+
+    if request.param == "redis":
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa", reason="fakeredis needs lupa for Lua scripts")
+        server = fakeredis.FakeServer()
+        monkeypatch.setattr(settings, "REDIS_URL", "redis://fake")
+        monkeypatch.setattr(quota_store.aioredis, "from_url", lambda url: fakeredis.FakeAsyncRedis(server=server))
+    monkeypatch.setattr(settings, "QUOTA_COUNTER_BACKEND", request.param)
+    return request.param
+
+class StubServer:
+    """run_stub_llm.py's server on a free port in a background thread"""
+
+    def __init__(self, config: StubConfig):
+        # Read per request, so tests can change fault injection mid-run
+        self.config = config
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            self.port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.server = uvicorn.Server(uvicorn.Config(
+            create_app(config), host="127.0.0.1", port=self.port, log_level="warning"
+        ))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> "StubServer":
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Stub LLM server did not start")
+            time.sleep(0.01)
+        return self
+
+    def stats(self) -> dict:
+        return httpx.get(f"{self.url}/__stub/stats").json()
+
+    def __exit__(self, *exc_info):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+@pytest.fixture
+def stub_llm():
+    """Start a stub LLM server: stub_llm(**StubConfig fields) -> StubServer"""
+    servers = []
+
+    def start(**config) -> StubServer:
+        server = StubServer(StubConfig(seed=1, **config)).__enter__()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.__exit__(None, None, None)
+
+@pytest.fixture
+def ai_service_for(monkeypatch):
+    """Build an AIService whose providers all point at a stub server"""
+    from app.core.config import settings
+    from app.services.ai_service import AIService
+
+    services = []
+
+    def build(server: StubServer, **overrides) -> AIService:
+        monkeypatch.setattr(settings, "OPENAI_API_KEY", "stub")
+        monkeypatch.setattr(settings, "CLAUDE_API_KEY", "stub")
+        monkeypatch.setattr(settings, "GEMINI_API_KEY", "stub")
+        monkeypatch.setattr(settings, "OPENAI_BASE_URL", f"{server.url}/v1")
+        monkeypatch.setattr(settings, "CLAUDE_BASE_URL", server.url)
+        monkeypatch.setattr(settings, "GEMINI_BASE_URL", server.url)
+        for name, value in overrides.items():
+            monkeypatch.setattr(settings, name, value)
+        service = AIService()
+        services.append(service)
+        return service
+
+    return build
+
+@pytest.fixture
+def tokens(monkeypatch):
+    """Accept any token "<neon id>:<email>" without calling Stack Auth"""
+    from app.auth import dependencies
+
+    async def verify(token: str):
+        neon_user_id, email = token.split(":")
+        return {"id": neon_user_id, "email": email, "display_name": neon_user_id}
+
+    monkeypatch.setattr(dependencies, "_verify_token", verify)
+    dependencies.user_cache.clear()
+    yield
+    dependencies.user_cache.clear()
+
+def auth_headers(name: str) -> dict:
+    """Bearer header for a user accepted by the tokens fixture"""
+    return {"Authorization": f"Bearer neon-{name}:{name}@example.com"}
+
+@pytest_asyncio.fixture
+async def api_client(db_tables, tokens):
+    """HTTP client for app.main.app, middleware included (no lifespan)"""
+    from app.main import app
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://127.0.0.1") as client:
+        yield client
+
+@pytest.fixture
+def app_ai_service(monkeypatch, ai_service_for):
+    """Serve the app's asks and jobs from an AIService pointed at a stub server"""
+    from app.api.routes import ask
+    from app.services import job_service
+
+    def install(server: StubServer, **overrides):
+        service = ai_service_for(server, **overrides)
+        monkeypatch.setattr(ask, "ai_service", service)
+        monkeypatch.setattr(job_service, "ai_service", service)
+        return service
+
+    return install
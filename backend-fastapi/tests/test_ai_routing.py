@@ -0,0 +1,77 @@
+import asyncio
+import time
+from collections import deque
+
+from sqlalchemy import select
+
+from conftest import auth_headers
+from app.core.database import async_session_factory, AiMessage
+
+def _per_provider(stub_llm, openai: dict, claude: dict, gemini: dict):
+    """One stub server per provider, so each can be slowed or broken on its own"""
+    return {
+        name: stub_llm(latency_ms=1, latency_sigma=0, response_tokens=5, **config)
+        for name, config in (("openai", openai), ("claude", claude), ("gemini", gemini))
+    }
+
+def _pointed_at(servers, **overrides) -> dict:
+    return {
+        "OPENAI_BASE_URL": f"{servers['openai'].url}/v1",
+        "CLAUDE_BASE_URL": servers["claude"].url,
+        "GEMINI_BASE_URL": servers["gemini"].url,
+        **overrides
+    }
+
+async def test_failover_follows_the_plan_chain(stub_llm, ai_service_for):
+    broken = {"error_rate": 1.0, "error_statuses": [500]}
+    servers = _per_provider(stub_llm, openai=broken, claude={}, gemini={})
+    service = ai_service_for(servers["openai"], **_pointed_at(servers))
+
+    # pro falls back openai -> claude -> gemini
+    result = await service.ask_ai("hello", provider="openai", plan="pro", use_cache=False)
+
+    assert result["provider"] == "claude"
+    assert [servers[name].stats()["requests"] for name in ("openai", "claude", "gemini")] == [1, 1, 0]
+    assert service.routing_counters["fallbacks"] == 1
+
+async def test_a_provider_slower_than_its_p95_is_hedged(stub_llm, ai_service_for):
+    servers = _per_provider(stub_llm, openai={}, claude={}, gemini={})
+    service = ai_service_for(
+        servers["openai"], **_pointed_at(servers, AI_HEDGING_ENABLED=True, AI_HEDGING_MIN_SAMPLES=5)
+    )
+    for i in range(5):
+        await service.ask_ai(f"warm up {i}", provider="openai", plan="pro", use_cache=False)
+
+    # openai now stalls well past its recent p95; claude answers at once
+    servers["openai"].config.latency_ms = 3000
+    started = time.monotonic()
+    result = await service.ask_ai("hello", provider="openai", plan="pro", use_cache=False)
+
+    assert result["provider"] == "claude"
+    assert time.monotonic() - started < 2
+    assert service.routing_counters["hedges"] == 1
+    assert servers["gemini"].stats()["requests"] == 0
+
+    # The losing openai call is cancelled, not left running to its end
+    await asyncio.sleep(0.1)
+    assert service.limiters["openai"].in_flight == 0
+
+async def test_the_message_records_the_provider_that_answered(api_client, stub_llm, app_ai_service):
+    stalled = {"stall_rate": 1.0, "stall_seconds": 3}
+    servers = _per_provider(stub_llm, openai=stalled, claude={}, gemini={})
+    service = app_ai_service(servers["openai"], **_pointed_at(servers, AI_HEDGING_ENABLED=True, AI_HEDGING_MIN_SAMPLES=1))
+    # One fast openai answer earlier makes its p95 a few milliseconds
+    service._latencies["openai"] = deque([0.01], maxlen=200)
+
+    response = await api_client.post("/api/ask/", headers=auth_headers("hedged"), json={
+        "prompt": "hello", "provider": "openai", "use_cache": False
+    })
+
+    assert response.status_code == 200
+    body = response.json()
+    # The free plan falls back to gemini first
+    assert body["provider"] == "gemini"
+    async with async_session_factory() as db:
+        message = (await db.execute(select(AiMessage).where(AiMessage.id == body["message_id"]))).scalar_one()
+    assert message.ai_provider == "gemini"
+    assert message.model_used == body["model"]
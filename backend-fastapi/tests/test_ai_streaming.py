@@ -0,0 +1,27 @@
+import asyncio
+import gc
+
+import pytest
+
+def _active_connections(service) -> int:
+    pool = service._http_client._transport._pool
+    return sum(1 for connection in pool.connections if not (connection.is_idle() or connection.is_closed()))
+
+@pytest.mark.parametrize("provider", ["openai", "claude", "gemini"])
+async def test_closing_a_stream_hangs_up_on_the_provider(provider, stub_llm, ai_service_for):
+    server = stub_llm(latency_ms=10, latency_sigma=0, tokens_per_second=5, response_tokens=200)
+    service = ai_service_for(server)
+
+    events = service.stream_ai("hello", provider=provider)
+    received = [await events.__anext__() for _ in range(3)]
+    assert [event["type"] for event in received] == ["start", "delta", "delta"]
+    assert _active_connections(service) == 1
+
+    await events.aclose()
+    await asyncio.sleep(0.2)
+    gc.collect()
+
+    assert _active_connections(service) == 0
+    limiter = service.limiters[provider]
+    assert limiter.in_flight == 0
+    await service.shutdown()
@@ -0,0 +1,107 @@
+import pytest
+from sqlalchemy import select
+
+from conftest import auth_headers
+from app.core.config import settings
+from app.core.database import async_session_factory, UsageTracking
+from app.services.quota_store import build_quota_store
+from app.services.usage_service import usage_service
+
+@pytest.fixture(autouse=True)
+async def fresh_counters(monkeypatch):
+    counters = build_quota_store()
+    monkeypatch.setattr(usage_service, "counters", counters)
+    yield
+    await counters.close()
+
+async def _asks_used(api_client, headers) -> int:
+    return (await api_client.get("/api/plan/usage", headers=headers)).json()["asks_used"]
+
+def _stub_without_fallbacks(stub_llm, app_ai_service):
+    # No fallback chain, so an item asking for an unknown provider fails on its own
+    app_ai_service(stub_llm(latency_ms=1, latency_sigma=0, response_tokens=5), AI_PROVIDER_FALLBACK_CHAINS={})
+
+def _item(prompt: str, **fields) -> dict:
+    return {"prompt": prompt, "provider": "openai", "use_cache": False, **fields}
+
+async def test_items_succeed_and_fail_on_their_own(api_client, stub_llm, app_ai_service):
+    _stub_without_fallbacks(stub_llm, app_ai_service)
+
+    response = await api_client.post("/api/ask/batch", headers=auth_headers("mixed"), json={"items": [
+        _item("first"),
+        _item("bad capture", screen_context="not base64!"),
+        _item("no such provider", provider="mistral"),
+        _item("second")
+    ]})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["succeeded"], body["failed"]) == (2, 2)
+    results = body["results"]
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert [result["success"] for result in results] == [True, False, False, True]
+    assert [result["status_code"] for result in results] == [None, 400, 503, None]
+    # Items without a session_id share one new session
+    assert results[0]["result"]["session_id"] == results[3]["result"]["session_id"]
+
+async def test_failed_items_give_their_quota_back(api_client, stub_llm, app_ai_service):
+    _stub_without_fallbacks(stub_llm, app_ai_service)
+    headers = auth_headers("partial")
+
+    response = await api_client.post("/api/ask/batch", headers=headers, json={"items": [
+        _item("one"), _item("two"), _item("broken", provider="mistral")
+    ]})
+    assert response.json()["succeeded"] == 2
+    assert await _asks_used(api_client, headers) == 2
+
+    # The free plan allows 10 asks: a batch is reserved whole, or refused whole
+    refused = await api_client.post("/api/ask/batch", headers=headers, json={
+        "items": [_item(f"more {i}") for i in range(9)]
+    })
+    assert refused.status_code == 429
+    assert await _asks_used(api_client, headers) == 2
+
+    accepted = await api_client.post("/api/ask/batch", headers=headers, json={
+        "items": [_item(f"more {i}") for i in range(8)]
+    })
+    assert accepted.json()["succeeded"] == 8
+    assert await _asks_used(api_client, headers) == 10
+
+async def test_oversized_batches_are_rejected(api_client, stub_llm, app_ai_service, monkeypatch):
+    app_ai_service(stub_llm(latency_ms=1, latency_sigma=0))
+    monkeypatch.setattr(settings, "ASK_BATCH_MAX_ITEMS", 2)
+
+    response = await api_client.post("/api/ask/batch", headers=auth_headers("greedy"), json={
+        "items": [_item("a"), _item("b"), _item("c")]
+    })
+
+    assert response.status_code == 400
+
+async def test_the_deadline_cancels_every_unfinished_item(api_client, stub_llm, app_ai_service, monkeypatch):
+    app_ai_service(stub_llm(latency_ms=2000, latency_sigma=0, response_tokens=5))
+    headers = {**auth_headers("hurried"), "X-Request-Timeout": "0.3"}
+    # A running writer that won't flush by itself during the test
+    monkeypatch.setattr(settings, "USAGE_FLUSH_INTERVAL_MS", 60_000)
+    usage_service.writer.start()
+
+    try:
+        response = await api_client.post("/api/ask/batch", headers=headers, json={
+            "items": [_item("slow one"), _item("slow two")]
+        })
+    finally:
+        pending = usage_service.writer.stats()["pending"]
+        await usage_service.writer.stop()
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["failed"] == 2
+    assert [result["status_code"] for result in body["results"]] == [504, 504]
+    assert await _asks_used(api_client, headers) == 0
+
+    # Recorded in the batch transaction, not left in the write-behind buffer
+    assert pending == 0
+    async with async_session_factory() as db:
+        cancelled = (await db.execute(
+            select(UsageTracking).where(UsageTracking.action_type == "ask_cancelled")
+        )).scalars().all()
+    assert [row.resource_used for row in cancelled] == ["deadline", "deadline"]
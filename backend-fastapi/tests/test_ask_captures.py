@@ -0,0 +1,143 @@
+import base64
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from sqlalchemy import update
+
+from conftest import auth_headers
+from app.api.routes import ask
+from app.core.database import async_session_factory, Session, SessionType
+from app.services.blob_store import FilesystemBlobStore
+from app.services.image_service import image_service
+
+def _png(width: int = 3000, height: int = 2000, marker: int = 0) -> bytes:
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    # A few changed pixels: a different file, but the same screen to the perceptual hash
+    for x in range(marker):
+        image.putpixel((x, 0), (255, 0, 0))
+    output = io.BytesIO()
+    image.save(output, format="PNG")
+    return output.getvalue()
+
+@pytest.fixture
+def blobs(monkeypatch, tmp_path):
+    store = FilesystemBlobStore(str(tmp_path))
+    monkeypatch.setattr(ask, "blob_store", store)
+    yield tmp_path
+    image_service.shutdown()
+
+def _stored(root) -> list:
+    return [name for _, _, names in os.walk(root) for name in names]
+
+@pytest.mark.parametrize("provider", ["openai", "claude", "gemini"])
+async def test_the_preprocessed_capture_reaches_the_provider(provider, api_client, stub_llm, app_ai_service, blobs):
+    server = stub_llm(latency_ms=1, latency_sigma=0, response_tokens=5)
+    app_ai_service(server)
+    original = _png()
+    headers = auth_headers("viewer")
+
+    response = await api_client.post("/api/ask/", headers=headers, json={
+        "prompt": "what is on my screen?",
+        "provider": provider,
+        "screen_context": "data:image/png;base64," + base64.b64encode(original).decode(),
+        "use_cache": False
+    })
+    assert response.status_code == 200
+
+    expected = await image_service.preprocess(original, provider)
+    stats = server.stats()
+    assert stats["images"] == 1
+    assert stats["image_bytes"] == len(expected["data"])
+
+    # The blob store keeps the capture as the client sent it
+    screen = await api_client.get(f"/api/ask/messages/{response.json()['message_id']}/screen", headers=headers)
+    assert screen.content == original
+    assert screen.headers["content-type"] == "image/png"
+
+async def test_streamed_asks_attach_the_capture(api_client, stub_llm, app_ai_service, blobs):
+    server = stub_llm(latency_ms=1, latency_sigma=0, tokens_per_second=0, response_tokens=5)
+    app_ai_service(server)
+
+    response = await api_client.post("/api/ask/stream", headers=auth_headers("streamer"), json={
+        "prompt": "and now?",
+        "provider": "claude",
+        "screen_context": base64.b64encode(_png()).decode()
+    })
+
+    assert "event: done" in response.text
+    assert server.stats()["images"] == 1
+    assert len(_stored(blobs)) == 1
+
+async def test_failed_asks_store_nothing(api_client, stub_llm, app_ai_service, blobs):
+    app_ai_service(stub_llm(latency_ms=1, latency_sigma=0, error_rate=1.0, error_statuses=[500]))
+
+    response = await api_client.post("/api/ask/", headers=auth_headers("unlucky"), json={
+        "prompt": "what is on my screen?",
+        "provider": "openai",
+        "screen_context": base64.b64encode(_png()).decode(),
+        "use_cache": False
+    })
+
+    assert response.status_code == 503
+    assert _stored(blobs) == []
+
+async def test_invalid_base64_is_rejected(api_client, stub_llm, app_ai_service, blobs):
+    app_ai_service(stub_llm(latency_ms=1, latency_sigma=0))
+
+    response = await api_client.post("/api/ask/", headers=auth_headers("sloppy"), json={
+        "prompt": "hi", "provider": "openai", "screen_context": "not base64!"
+    })
+
+    assert response.status_code == 400
+
+async def test_near_duplicate_captures_reuse_the_earlier_description(api_client, stub_llm, app_ai_service, blobs):
+    server = stub_llm(latency_ms=1, latency_sigma=0, response_tokens=5)
+    service = app_ai_service(server)
+    sent = []
+    ask_ai = service.ask_ai
+
+    async def recording_ask_ai(**kwargs):
+        sent.append(kwargs)
+        return await ask_ai(**kwargs)
+
+    service.ask_ai = recording_ask_ai
+    headers = auth_headers("listener")
+
+    first = await api_client.post("/api/ask/", headers=headers, json={"prompt": "start", "use_cache": False})
+    session_id = first.json()["session_id"]
+    async with async_session_factory() as db:
+        await db.execute(update(Session).where(Session.id == session_id).values(session_type=SessionType.LISTEN))
+        await db.commit()
+
+    responses = []
+    for marker in (0, 3):
+        response = await api_client.post("/api/ask/", headers=headers, json={
+            "prompt": f"what changed? ({marker})",
+            "provider": "openai",
+            "session_id": session_id,
+            "screen_context": base64.b64encode(_png(marker=marker)).decode(),
+            "use_cache": False
+        })
+        assert response.status_code == 200
+        responses.append(response.json())
+
+    # Only the first capture reaches the provider; the second is sent as its answer
+    assert server.stats()["images"] == 1
+    assert sent[2]["image"] is None
+    assert sent[2]["screen_description"] == responses[0]["response"]
+    assert sent[2]["screen_context_ref"] == sent[1]["screen_context_ref"]
+
+    assert len(_stored(blobs)) == 1
+    screen = await api_client.get(f"/api/ask/messages/{responses[1]['message_id']}/screen", headers=headers)
+    assert screen.content == _png(marker=0)
+
+def test_the_description_is_sent_in_place_of_the_capture():
+    from app.services.ai_service import AIService
+
+    prompt = AIService()._build_context_prompt("and now?", screen_description="A login form")
+
+    assert "A login form" in prompt
+    assert "Screen capture provided" not in prompt
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import time
+
+from sqlalchemy import select
+
+from app.core.database import async_session_factory, AiMessage, UsageTracking
+from conftest import auth_headers
+
+async def _post_then_disconnect(app, path: str, payload: dict, headers: dict, after: float) -> list:
+    """Drive the ASGI app like a server whose client hangs up `after` seconds in"""
+    body = json.dumps(payload).encode()
+    body_sent = False
+    gone_at = time.monotonic() + after
+    messages = []
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # Like uvicorn: block until the client goes, then answer without awaiting
+        if time.monotonic() < gone_at:
+            await asyncio.sleep(gone_at - time.monotonic())
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"host", b"127.0.0.1"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *((name.lower().encode(), value.encode()) for name, value in headers.items())
+        ],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 80)
+    }
+    await app(scope, receive, send)
+    return messages
+
+async def test_disconnect_mid_ask_cancels_through_the_full_app(api_client, stub_llm, app_ai_service):
+    from app.main import app
+
+    app_ai_service(stub_llm(latency_ms=3000, latency_sigma=0))
+
+    started = time.monotonic()
+    messages = await _post_then_disconnect(
+        app, "/api/ask/", {"prompt": "hello", "provider": "openai", "use_cache": False},
+        auth_headers("leaver"), after=0.5
+    )
+    elapsed = time.monotonic() - started
+
+    assert messages[0]["status"] == 499
+    assert elapsed < 2
+
+    async with async_session_factory() as db:
+        assert (await db.execute(select(AiMessage))).first() is None
+        rows = (await db.execute(select(UsageTracking.action_type, UsageTracking.resource_used))).all()
+    assert ("ask_cancelled", "disconnect") in rows
+    assert not any(action == "ask" for action, _ in rows)
+
+async def test_security_headers_are_still_added(api_client):
+    response = await api_client.get("/health")
+
+    assert response.headers["X-Frame-Options"] == "DENY"
+    assert response.headers["X-Content-Type-Options"] == "nosniff"
+
+async def test_stream_dropped_before_its_body_starts_releases_the_hold(api_client, stub_llm, app_ai_service, monkeypatch):
+    from app.main import app
+    from app.services.quota_store import build_quota_store
+    from app.services.usage_service import usage_service
+
+    monkeypatch.setattr(usage_service, "counters", build_quota_store())
+    app_ai_service(stub_llm(latency_ms=1, latency_sigma=0, response_tokens=5))
+    headers = auth_headers("impatient")
+    ask = {"prompt": "hello", "provider": "openai"}
+
+    # The free plan allows 10 asks; each of these clients is gone before the body is sent
+    for _ in range(10):
+        messages = await _post_then_disconnect(app, "/api/ask/stream", ask, headers, after=0)
+        assert not any(message.get("body") for message in messages)
+
+    response = await api_client.post("/api/ask/", headers=headers, json=ask)
+    assert response.status_code == 200
+
+async def test_stream_response_never_sent_releases_the_hold(api_client, stub_llm, app_ai_service, monkeypatch):
+    from starlette.requests import Request
+
+    from app.api.routes.ask import ask_ai_stream
+    from app.core.database import User
+    from app.models.requests import AskRequest
+    from app.services.quota_store import build_quota_store
+    from app.services.usage_service import usage_service
+
+    monkeypatch.setattr(usage_service, "counters", build_quota_store())
+    app_ai_service(stub_llm(latency_ms=1, latency_sigma=0, response_tokens=5))
+    headers = auth_headers("vanished")
+    me = (await api_client.get("/api/auth/me", headers=headers)).json()
+    scope = {"type": "http", "method": "POST", "path": "/api/ask/stream", "headers": [], "query_string": b""}
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        # Writing to a real socket yields to the loop, where the disconnect wins
+        await asyncio.sleep(0)
+
+    # The free plan allows 10 asks; each response is abandoned before its body starts
+    for _ in range(10):
+        async with async_session_factory() as db:
+            user = (await db.execute(select(User).where(User.id == me["id"]))).scalar_one()
+            response = await ask_ai_stream(AskRequest(prompt="hello", provider="openai"), Request(scope), user, db)
+        await response(scope, receive, send)
+
+    assert (await api_client.post("/api/ask/", headers=headers, json={"prompt": "hello", "provider": "openai"})).status_code == 200
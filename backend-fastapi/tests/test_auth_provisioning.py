@@ -0,0 +1,46 @@
+import asyncio
+import uuid
+
+import pytest
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import select, func
+
+from app.auth import dependencies
+from app.core.database import async_session_factory, User
+from app.core.exceptions import ConflictError
+
+async def _login(token: str) -> User:
+    async with async_session_factory() as db:
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+        return await dependencies.get_current_user(credentials, db)
+
+async def _user_count() -> int:
+    async with async_session_factory() as db:
+        return (await db.execute(select(func.count(User.id)))).scalar()
+
+async def test_parallel_first_logins_create_one_user_each(db_tables, tokens):
+    neon_ids = [f"neon-{uuid.uuid4()}" for _ in range(10)]
+    logins = [_login(f"{neon_id}:{neon_id}@example.com") for neon_id in neon_ids for _ in range(10)]
+
+    users = await asyncio.gather(*logins)
+
+    assert len(users) == 100
+    assert {user.neon_user_id for user in users} == set(neon_ids)
+    assert len({user.id for user in users}) == 10
+    assert await _user_count() == 10
+
+async def test_parallel_provisioning_outside_single_flight(db_tables):
+    user_data = {"id": f"neon-{uuid.uuid4()}", "email": "race@example.com"}
+
+    # SQLite serializes writers and gives up on lock upgrades under heavy
+    # contention, so keep this race smaller than the single-flight one
+    users = await asyncio.gather(*(dependencies._fetch_user(user_data, create=True) for _ in range(20)))
+
+    assert len({user.id for user in users}) == 1
+    assert await _user_count() == 1
+
+async def test_email_taken_by_another_account_is_a_conflict(db_tables, tokens):
+    await _login("neon-first:shared@example.com")
+
+    with pytest.raises(ConflictError):
+        await _login("neon-second:shared@example.com")
@@ -0,0 +1,86 @@
+import asyncio
+import uuid
+
+import httpx
+import pytest
+from fastapi.security import HTTPAuthorizationCredentials
+
+from app.auth import dependencies
+from app.auth.neon_auth import neon_auth_service
+from app.core.database import async_session_factory
+from app.core.singleflight import SingleFlight
+
+@pytest.fixture
+def stack_auth(monkeypatch):
+    """Point the shared Stack Auth client at a slow in-process verifier"""
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"user": {"id": "neon-flight", "email": "flight@example.com"}})
+
+    client = httpx.AsyncClient(base_url="https://stack.test", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(neon_auth_service, "_client", client)
+    neon_auth_service.token_cache.clear()
+    dependencies.user_cache.clear()
+    yield calls
+    neon_auth_service.token_cache.clear()
+    dependencies.user_cache.clear()
+
+async def _login(token: str):
+    async with async_session_factory() as db:
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+        return await dependencies.get_current_user(credentials, db)
+
+async def test_concurrent_cold_requests_share_one_verification_and_lookup(db_tables, stack_auth):
+    lookups = dependencies.user_flight.calls
+
+    users = await asyncio.gather(*(_login("token-1") for _ in range(200)))
+
+    assert len(stack_auth) == 1
+    assert dependencies.user_flight.calls - lookups == 1
+    assert {user.id for user in users} == {users[0].id}
+
+    # Warm: answered from the token and user caches
+    await asyncio.gather(*(_login("token-1") for _ in range(50)))
+    assert len(stack_auth) == 1
+    assert dependencies.user_flight.calls - lookups == 1
+
+async def test_cancelled_caller_does_not_cancel_the_shared_call():
+    flight = SingleFlight()
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(0.05)
+        return uuid.uuid4()
+
+    first = asyncio.create_task(flight.do("key", slow))
+    await started.wait()
+    second = asyncio.create_task(flight.do("key", slow))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second
+    assert flight.calls == 1
+    assert flight.coalesced == 1
+    assert flight.stats()["in_flight"] == 0
+
+async def test_errors_reach_every_caller_and_are_not_cached():
+    flight = SingleFlight()
+    attempts = 0
+
+    async def failing():
+        nonlocal attempts
+        attempts += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    results = await asyncio.gather(*(flight.do("key", failing) for _ in range(20)), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert attempts == 1
+
+    with pytest.raises(RuntimeError):
+        await flight.do("key", failing)
+    assert attempts == 2
@@ -0,0 +1,64 @@
+import base64
+import uuid
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from app.api.routes.ask import get_message_screen_capture
+from app.core import migrations
+from app.core.config import settings
+from app.core.database import async_session_factory, AiMessage, Session, SessionType, User
+from app.services import blob_store as blob_store_module
+from app.services.blob_store import FilesystemBlobStore, build_blob_store
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 32
+
+async def _messages(user_id: str, captures: list) -> list:
+    async with async_session_factory() as db:
+        user = User(id=user_id, neon_user_id=f"neon-{user_id}", email=f"{user_id}@example.com")
+        session = Session(user_id=user_id, session_type=SessionType.ASK)
+        db.add_all([user, session])
+        await db.flush()
+        messages = [
+            AiMessage(
+                session_id=session.id, user_id=user_id, prompt="p", response="r",
+                ai_provider="openai", model_used="gpt", screen_context=capture, screen_context_ref=ref
+            )
+            for capture, ref in captures
+        ]
+        db.add_all(messages)
+        await db.commit()
+        return [message.id for message in messages]
+
+async def test_undecodable_captures_are_skipped_and_not_found(db_tables, tmp_path, monkeypatch):
+    monkeypatch.setattr(migrations, "blob_store", FilesystemBlobStore(str(tmp_path)))
+    user_id = str(uuid.uuid4())
+    good, bad = await _messages(user_id, [
+        (base64.b64encode(PNG).decode(), None),
+        ("abc", None)
+    ])
+
+    assert await migrations.backfill_screen_captures(batch_size=1) == 1
+
+    async with async_session_factory() as db:
+        rows = {
+            row.id: row for row in
+            (await db.execute(select(AiMessage).where(AiMessage.user_id == user_id))).scalars()
+        }
+        assert rows[good].screen_context is None and rows[good].screen_context_ref
+        assert rows[bad].screen_context == "abc"
+        assert rows[bad].screen_context_ref is None
+
+        user = await db.get(User, user_id)
+        with pytest.raises(HTTPException) as error:
+            await get_message_screen_capture(bad, current_user=user, db=db)
+        assert error.value.status_code == 404
+
+def test_s3_backend_without_boto3_fails_at_startup(monkeypatch):
+    monkeypatch.setattr(settings, "BLOB_STORE_BACKEND", "s3")
+    monkeypatch.setattr(settings, "S3_BUCKET", "captures")
+    monkeypatch.setattr(blob_store_module, "boto3", None)
+
+    with pytest.raises(RuntimeError, match="boto3"):
+        build_blob_store()
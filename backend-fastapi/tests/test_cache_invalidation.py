@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import pytest
+
+from app.auth import dependencies
+from app.auth.neon_auth import NeonAuthService
+from app.core import invalidation
+from app.core.config import settings
+from app.core.invalidation import InvalidationBus, invalidation_bus
+
+@pytest.fixture
+def shared_redis(monkeypatch):
+    """Point every bus at one in-process fake Redis"""
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(settings, "REDIS_URL", "redis://fake")
+    monkeypatch.setattr(invalidation.aioredis, "from_url", lambda url: fakeredis.FakeAsyncRedis(server=server))
+
+async def _started(*buses: InvalidationBus):
+    for bus in buses:
+        bus.start()
+    for _ in range(100):
+        if all(bus.shared for bus in buses):
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("bus never subscribed")
+
+async def _eventually(condition):
+    for _ in range(100):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition never held")
+
+async def test_user_invalidation_reaches_another_worker(shared_redis):
+    other_worker = InvalidationBus()
+    await _started(invalidation_bus, other_worker)
+    try:
+        dependencies.user_cache.set("neon-alice", object())
+        dependencies.user_cache.set("neon-bob", object())
+
+        other_worker.publish("user", "neon-alice")
+
+        await _eventually(lambda: dependencies.user_cache.get("neon-alice") is None)
+        assert dependencies.user_cache.get("neon-bob") is not None
+    finally:
+        await other_worker.stop()
+        await invalidation_bus.stop()
+        dependencies.user_cache.clear()
+
+async def test_token_invalidations_reach_another_worker(shared_redis):
+    service = NeonAuthService()
+    await service.startup()
+    other_worker = InvalidationBus()
+    await _started(invalidation_bus, other_worker)
+    try:
+        for token, neon_user_id in (("t1", "neon-alice"), ("t2", "neon-alice"), ("t3", "neon-bob")):
+            key = service.token_key(token)
+            service.token_cache.set(key, {"id": neon_user_id})
+            service._user_tokens.setdefault(neon_user_id, set()).add(key)
+
+        other_worker.publish("auth-user", "neon-alice")
+        other_worker.publish("auth-token", service.token_key("t3"))
+
+        await _eventually(lambda: len(service.token_cache) == 0)
+    finally:
+        await other_worker.stop()
+        await invalidation_bus.stop()
+        await service.shutdown()
+
+async def test_a_worker_ignores_its_own_invalidations(shared_redis):
+    bus = InvalidationBus()
+    dropped = []
+    bus.subscribe("user", dropped.append, lambda: None)
+    listener = InvalidationBus()
+    seen = []
+    listener.subscribe("user", seen.append, lambda: None)
+    await _started(bus, listener)
+    try:
+        bus.publish("user", "neon-alice")
+        await _eventually(lambda: seen == ["neon-alice"])
+        assert dropped == []
+    finally:
+        await bus.stop()
+        await listener.stop()
+
+async def test_subscribing_clears_entries_that_may_have_missed_invalidations(shared_redis):
+    bus = InvalidationBus()
+    resets = []
+    bus.subscribe("user", lambda key: None, lambda: resets.append(True))
+    await _started(bus)
+    await bus.stop()
+    assert resets == [True]
+
+async def test_without_redis_cached_users_expire_within_the_unshared_ttl(db_tables, tokens, monkeypatch):
+    monkeypatch.setattr(settings, "USER_CACHE_TTL_SECONDS", 600)
+    assert not invalidation_bus.shared
+
+    async with dependencies.async_session_factory() as db:
+        await dependencies._load_user({"id": "neon-carol", "email": "carol@example.com"}, db, create=True)
+
+    _, expires_at, _ = dependencies.user_cache._entries["neon-carol"]
+    assert expires_at - time.monotonic() <= settings.AUTH_CACHE_UNSHARED_TTL_SECONDS
+
+async def test_without_redis_cached_tokens_expire_within_the_unshared_ttl():
+    assert not invalidation_bus.shared
+    assert NeonAuthService()._token_ttl("opaque-token") == settings.AUTH_CACHE_UNSHARED_TTL_SECONDS
@@ -0,0 +1,56 @@
+import uuid
+
+from app.core.database import async_session_factory, AiMessage, Session, SessionType, User
+from app.services.context_service import ContextService
+
+async def _session() -> Session:
+    user_id = str(uuid.uuid4())
+    async with async_session_factory() as db:
+        db.add(User(id=user_id, neon_user_id=f"neon-{user_id}", email=f"{user_id}@example.com"))
+        session = Session(user_id=user_id, session_type=SessionType.ASK)
+        db.add(session)
+        await db.commit()
+        return session
+
+async def _turn(worker: ContextService, session: Session, prompt: str) -> str:
+    """Save a turn the way the ask routes do, then append it to the worker's window"""
+    async with async_session_factory() as db:
+        message = AiMessage(
+            session_id=session.id, user_id=session.user_id, prompt=prompt, response=f"re: {prompt}",
+            ai_provider="openai", model_used="gpt"
+        )
+        db.add(message)
+        await db.commit()
+        worker.append(session.id, prompt, message.response, str(message.id))
+        return message.id
+
+async def _history(worker: ContextService, session: Session):
+    async with async_session_factory() as db:
+        history = await worker.get_history(session.id, "openai", None, db)
+    return [message["content"] for message in history if message["role"] == "user"]
+
+async def test_cached_window_picks_up_turns_from_another_worker(db_tables, monkeypatch):
+    session = await _session()
+    first, second = ContextService(), ContextService()
+    loads = []
+    original = ContextService._load_window
+
+    async def counting_load(self, session_id, db):
+        loads.append(self)
+        return await original(self, session_id, db)
+
+    monkeypatch.setattr(ContextService, "_load_window", counting_load)
+
+    await _turn(first, session, "one")
+    assert await _history(first, session) == ["one"]
+    assert await _history(second, session) == ["one"]
+
+    # Turns a worker wrote itself are already in its window
+    await _turn(first, session, "two")
+    assert await _history(first, session) == ["one", "two"]
+    assert loads.count(first) == 1
+
+    # The other worker's cached window is behind and reloads once
+    assert await _history(second, session) == ["one", "two"]
+    assert await _history(second, session) == ["one", "two"]
+    assert loads.count(second) == 2
@@ -0,0 +1,45 @@
+from sqlalchemy import update
+
+from conftest import auth_headers
+from app.api.routes import admin
+from app.auth import dependencies
+from app.core.database import async_session_factory, ApiKey, User, UserRole
+
+async def _superadmin(api_client, name: str) -> dict:
+    headers = auth_headers(name)
+    me = (await api_client.get("/api/auth/me", headers=headers)).json()
+    async with async_session_factory() as db:
+        await db.execute(update(User).where(User.id == me["id"]).values(role=UserRole.SUPERADMIN))
+        await db.commit()
+    dependencies.user_cache.clear()
+    return headers
+
+async def _key_used(service, server) -> str:
+    await service.ask_ai("hello", provider="openai", use_cache=False)
+    return server.stats()["api_keys"]["openai"]
+
+async def test_rotated_keys_apply_without_a_restart(api_client, stub_llm, app_ai_service, ai_service_for, monkeypatch):
+    server = stub_llm(latency_ms=1, latency_sigma=0, response_tokens=5)
+    service = app_ai_service(server)
+    monkeypatch.setattr(admin, "ai_service", service)
+    headers = await _superadmin(api_client, "keymaster")
+    assert await _key_used(service, server) == "stub"
+
+    for key in ("sk-rotated-1", "sk-rotated-2"):
+        response = await api_client.post("/api/admin/api-keys", headers=headers, json={"provider": "openai", "api_key": key})
+        assert response.status_code == 200
+        # The worker that handled the request swaps its client at once
+        assert await _key_used(service, server) == key
+
+    # Another worker picks the new version up on its next check
+    other_worker = ai_service_for(server)
+    assert await _key_used(other_worker, server) == "stub"
+    await other_worker.refresh_credentials()
+    assert await _key_used(other_worker, server) == "sk-rotated-2"
+
+    # Deactivating the row falls back to the environment key
+    async with async_session_factory() as db:
+        await db.execute(update(ApiKey).where(ApiKey.provider == "openai").values(is_active=False))
+        await db.commit()
+    await service.refresh_credentials()
+    assert await _key_used(service, server) == "stub"
@@ -0,0 +1,29 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from app.services.image_service import ImageService
+
+def _capture() -> str:
+    output = io.BytesIO()
+    Image.new("RGB", (4000, 2000), (200, 40, 40)).save(output, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(output.getvalue()).decode()
+
+@pytest.fixture
+def service():
+    service = ImageService()
+    yield service
+    service.shutdown()
+
+async def test_base64_capture_is_decoded_and_downscaled_in_the_pool(service):
+    result = await service.preprocess(_capture(), "claude")
+
+    assert result["content_type"] == "image/jpeg"
+    assert max(result["width"], result["height"]) == 1568
+    assert service.counters["captures"] == 1
+
+async def test_undecodable_capture_falls_back_to_the_caller(service):
+    assert await service.preprocess("abc", "claude") is None
+    assert service.counters["failures"] == 1
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import uuid
+from datetime import datetime
+
+import httpx
+import pytest
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import async_session_factory, AskJob, AskJobStatus, Session, SessionType, User
+from app.services.job_service import JobService, validate_callback_url
+
+@pytest.mark.parametrize("url", [
+    "http://example.com/hook",
+    "https://127.0.0.1/hook",
+    "https://localhost/hook",
+    "https://169.254.169.254/latest/meta-data",
+    "https://10.0.0.5/hook",
+    "https://[::1]/hook",
+    "https://[::ffff:192.168.0.1]/hook"
+])
+async def test_callback_urls_to_internal_addresses_are_refused(url):
+    with pytest.raises(ValueError):
+        await validate_callback_url(url)
+
+async def test_allowlisted_hosts_skip_the_address_check(monkeypatch):
+    monkeypatch.setattr(settings, "ASK_JOB_CALLBACK_ALLOWED_HOSTS", ["internal.test"])
+    await validate_callback_url("https://hooks.internal.test/done")
+    with pytest.raises(ValueError):
+        await validate_callback_url("http://hooks.internal.test/done")
+
+async def _finished_job(callback_url: str) -> str:
+    user_id = str(uuid.uuid4())
+    async with async_session_factory() as db:
+        db.add(User(id=user_id, neon_user_id=f"neon-{user_id}", email=f"{user_id}@example.com"))
+        session = Session(user_id=user_id, session_type=SessionType.ASK)
+        db.add(session)
+        await db.flush()
+        now = datetime.utcnow()
+        job = AskJob(
+            user_id=user_id,
+            session_id=session.id,
+            request=json.dumps({}),
+            callback_url=callback_url,
+            status=AskJobStatus.SUCCEEDED,
+            result=json.dumps({"response": "ok"}),
+            available_at=now,
+            completed_at=now,
+            callback_next_at=now
+        )
+        db.add(job)
+        await db.commit()
+        return job.id
+
+async def _job(job_id: str) -> AskJob:
+    async with async_session_factory() as db:
+        return (await db.execute(select(AskJob).where(AskJob.id == job_id))).scalar_one()
+
+async def test_slow_callback_does_not_hold_up_other_deliveries(db_tables, monkeypatch):
+    monkeypatch.setattr(settings, "ASK_JOB_CALLBACK_ALLOWED_HOSTS", ["example.test"])
+    monkeypatch.setattr(settings, "ASK_JOB_POLL_SECONDS", 0.05)
+    release_slow = asyncio.Event()
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "slow.example.test":
+            await release_slow.wait()
+        if request.url.host == "down.example.test":
+            return httpx.Response(503)
+        return httpx.Response(204)
+
+    slow = await _finished_job("https://slow.example.test/hook")
+    fast = await _finished_job("https://fast.example.test/hook")
+    down = await _finished_job("https://down.example.test/hook")
+
+    service = JobService()
+    service._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    service._callback_sender = asyncio.create_task(service._callback_loop())
+    try:
+        for _ in range(100):
+            if (await _job(fast)).callback_delivered_at:
+                break
+            await asyncio.sleep(0.02)
+
+        assert (await _job(fast)).callback_delivered_at is not None
+        assert (await _job(slow)).callback_delivered_at is None
+
+        failed = await _job(down)
+        assert failed.callback_delivered_at is None
+        assert failed.callback_attempts == 1
+        assert failed.callback_next_at > datetime.utcnow()
+
+        release_slow.set()
+        for _ in range(100):
+            if (await _job(slow)).callback_delivered_at:
+                break
+            await asyncio.sleep(0.02)
+        assert (await _job(slow)).callback_delivered_at is not None
+    finally:
+        release_slow.set()
+        await service.stop()
@@ -0,0 +1,34 @@
+from sqlalchemy import update
+
+from conftest import auth_headers
+from app.core.config import settings
+from app.core.database import async_session_factory, AskJob, AskJobStatus
+
+ASK = {"prompt": "later, please", "provider": "openai"}
+
+async def test_pending_jobs_are_capped_per_plan(api_client):
+    headers = auth_headers("queuer")
+
+    jobs = [await api_client.post("/api/ask/jobs", headers=headers, json=ASK) for _ in range(5)]
+    assert [job.status_code for job in jobs] == [202] * 5
+
+    refused = await api_client.post("/api/ask/jobs", headers=headers, json=ASK)
+    assert refused.status_code == 429
+    assert "pending" in refused.json()["message"]
+
+    # A finished job frees its place
+    async with async_session_factory() as db:
+        await db.execute(
+            update(AskJob).where(AskJob.id == jobs[0].json()["job_id"]).values(status=AskJobStatus.FAILED)
+        )
+        await db.commit()
+    assert (await api_client.post("/api/ask/jobs", headers=headers, json=ASK)).status_code == 202
+
+async def test_pending_jobs_count_against_the_monthly_limit(api_client, monkeypatch):
+    monkeypatch.setattr(settings, "ASK_JOB_MAX_PENDING", {**settings.ASK_JOB_MAX_PENDING, "free": 1000})
+    headers = auth_headers("hoarder")
+
+    # The free plan allows 10 asks a month
+    statuses = [(await api_client.post("/api/ask/jobs", headers=headers, json=ASK)).status_code for _ in range(11)]
+
+    assert statuses == [202] * 10 + [429]
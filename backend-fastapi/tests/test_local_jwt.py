@@ -0,0 +1,98 @@
+import time
+
+import httpx
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from jose import jwk, jwt
+
+from app.auth.neon_auth import NeonAuthService
+from app.core.config import settings
+
+def _ec_key(kid: str):
+    private = ec.generate_private_key(ec.SECP256R1())
+    pem = private.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public = jwk.construct(pem, "ES256").public_key().to_dict()
+    return pem, {**public, "kid": kid, "use": "sig"}
+
+def _rsa_pem() -> bytes:
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return private.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+
+def _token(pem: bytes, kid: str, algorithm: str = "ES256", **claims) -> str:
+    body = {"sub": "neon-local", "aud": settings.NEXT_PUBLIC_STACK_PROJECT_ID, "exp": time.time() + 300}
+    body.update(claims)
+    body = {name: value for name, value in body.items() if value is not None}
+    return jwt.encode(body, pem, algorithm=algorithm, headers={"kid": kid})
+
+class StackAuthStub:
+    """JWKS endpoint serving `keys`, and a remote verify endpoint that refuses everything"""
+
+    def __init__(self):
+        self.keys = []
+        self.jwks_fetches = 0
+        self.remote_verifies = 0
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("jwks.json"):
+            self.jwks_fetches += 1
+            return httpx.Response(200, json={"keys": self.keys})
+        self.remote_verifies += 1
+        return httpx.Response(401)
+
+@pytest.fixture
+async def local_auth(monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_VERIFICATION_MODE", "local")
+    stub = StackAuthStub()
+    service = NeonAuthService()
+    service._client = httpx.AsyncClient(base_url="https://stack.test", transport=httpx.MockTransport(stub.handler))
+    service.jwks.min_refresh_interval = 0
+    pem, key = _ec_key("key-1")
+    stub.keys = [key]
+    yield service, stub, pem
+    await service.shutdown()
+
+async def test_valid_token_is_verified_locally(local_auth):
+    service, stub, pem = local_auth
+
+    user = await service.verify_token(_token(pem, "key-1"))
+
+    assert user["id"] == "neon-local"
+    assert stub.remote_verifies == 0
+
+@pytest.mark.parametrize("claims", [
+    {"exp": time.time() - 60},
+    {"aud": "another-project"},
+    {"aud": None},
+    {"exp": None}
+], ids=["expired", "wrong-aud", "missing-aud", "missing-exp"])
+async def test_bad_claims_are_rejected_without_asking_stack_auth(local_auth, claims):
+    service, stub, pem = local_auth
+
+    assert await service.verify_token(_token(pem, "key-1", **claims)) is None
+    assert stub.remote_verifies == 0
+
+async def test_unknown_kid_refreshes_the_key_set(local_auth):
+    service, stub, pem = local_auth
+    assert await service.verify_token(_token(pem, "key-1", sub="first")) is not None
+    fetches = stub.jwks_fetches
+
+    rotated_pem, rotated_key = _ec_key("key-2")
+    stub.keys.append(rotated_key)
+    user = await service.verify_token(_token(rotated_pem, "key-2"))
+
+    assert user["id"] == "neon-local"
+    assert stub.jwks_fetches == fetches + 1
+
+async def test_header_alg_that_does_not_match_the_key_is_a_rejection(local_auth):
+    service, stub, _ = local_auth
+
+    # RS256 header on a token whose kid names the EC key
+    token = _token(_rsa_pem(), "key-1", algorithm="RS256")
+
+    assert await service.verify_token(token) is None
+    assert stub.remote_verifies == 0
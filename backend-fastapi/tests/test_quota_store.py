@@ -0,0 +1,156 @@
+import asyncio
+import random
+import uuid
+from datetime import datetime
+
+from app.core.database import async_session_factory, PlanType, User
+from app.services.usage_service import UsageService
+
+async def _make_user() -> str:
+    user_id = str(uuid.uuid4())
+    async with async_session_factory() as db:
+        db.add(User(id=user_id, neon_user_id=f"neon-{user_id}", email=f"{user_id}@example.com"))
+        await db.commit()
+    return user_id
+
+def _ask_key(service: UsageService, user_id: str) -> str:
+    now = datetime.now()
+    return service.counter_key(user_id, "ask", now.year, now.month)
+
+async def _ask(service: UsageService, user_id: str, before_commit=None) -> bool:
+    """What an ask does with its quota: reserve, count the row, commit, settle"""
+    async with async_session_factory() as db:
+        reservation, _ = await service.reserve(user_id, PlanType.FREE, db)
+        if reservation is None:
+            return False
+        if before_commit:
+            await before_commit()
+        await service.track_usage(user_id, "ask", resource_used="tokens", quantity=1, db=db, sync=True)
+        await db.commit()
+        await service.commit_reservation(reservation)
+        return True
+
+async def test_reconcile_keeps_an_ask_that_commits_during_the_recount(db_tables, quota_backend):
+    service = UsageService()
+    user_id = await _make_user()
+    for _ in range(3):
+        assert await _ask(service, user_id)
+
+    recount = service._month_counts
+    raced = False
+
+    async def recount_then_ask(year, month):
+        nonlocal raced
+        counts = await recount(year, month)
+        if not raced:
+            # A whole ask lands between the recount and the write
+            raced = True
+            assert await _ask(service, user_id)
+        return counts
+
+    service._month_counts = recount_then_ask
+    await service.reconcile_counters()
+    await service.reconcile_counters()
+
+    assert await service.counters.get(_ask_key(service, user_id)) == 4
+    await service.stop()
+
+async def test_reconcile_skips_counters_with_live_holds(db_tables, quota_backend):
+    service = UsageService()
+    user_id = await _make_user()
+    assert await _ask(service, user_id)
+
+    held = asyncio.Event()
+    finish = asyncio.Event()
+
+    async def wait_in_flight():
+        held.set()
+        await finish.wait()
+
+    in_flight = asyncio.create_task(_ask(service, user_id, before_commit=wait_in_flight))
+    await held.wait()
+    key = _ask_key(service, user_id)
+    # Drifted below the database, e.g. a lost increment
+    await service.counters.incr(key, -1)
+
+    assert await service.reconcile_counters() == 0
+    finish.set()
+    assert await in_flight
+    assert await service.reconcile_counters() == 1
+    assert await service.counters.get(key) == 2
+    await service.stop()
+
+async def test_reservations_racing_reconcile_never_exceed_the_limit(db_tables, quota_backend):
+    service = UsageService()
+    user_id = await _make_user()
+    done = False
+
+    async def slow():
+        await asyncio.sleep(random.uniform(0, 0.02))
+
+    async def reconcile_continuously():
+        while not done:
+            await service.reconcile_counters()
+            await asyncio.sleep(0)
+
+    reconciler = asyncio.create_task(reconcile_continuously())
+    try:
+        granted = []
+        for _ in range(3):
+            granted += await asyncio.gather(*(_ask(service, user_id, before_commit=slow) for _ in range(8)))
+    finally:
+        done = True
+        await reconciler
+
+    # The free plan allows 10 asks a month
+    assert sum(granted) == 10
+    await service.reconcile_counters()
+    assert await service.counters.get(_ask_key(service, user_id)) == 10
+    await service.stop()
+
+async def test_parallel_free_plan_asks_stop_exactly_at_the_limit(api_client, stub_llm, app_ai_service, quota_backend, monkeypatch):
+    from conftest import auth_headers
+    from app.services.quota_store import build_quota_store
+    from app.services.usage_service import usage_service
+
+    monkeypatch.setattr(usage_service, "counters", build_quota_store())
+    app_ai_service(stub_llm(latency_ms=50, latency_sigma=0, response_tokens=5))
+    headers = auth_headers("free")
+    assert (await api_client.get("/api/auth/me", headers=headers)).status_code == 200
+
+    ask = {"prompt": "hello", "provider": "openai", "use_cache": False}
+    responses = await asyncio.gather(*(
+        api_client.post("/api/ask/", json=ask, headers=headers) for _ in range(20)
+    ))
+
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [200] * 10 + [429] * 10
+    await usage_service.counters.close()
+
+async def test_released_and_expired_holds_give_their_unit_back(db_tables, quota_backend, monkeypatch):
+    from app.core.config import settings
+
+    service = UsageService()
+    user_id = await _make_user()
+    async with async_session_factory() as db:
+        for _ in range(9):
+            assert await _ask(service, user_id)
+
+        held, _ = await service.reserve(user_id, PlanType.FREE, db)
+        assert held is not None
+        assert (await service.reserve(user_id, PlanType.FREE, db))[0] is None
+
+        await service.release_reservation(held)
+        released = await service.reserve(user_id, PlanType.FREE, db)
+        assert released[0] is not None
+        # Settled holds leave the count where it was
+        assert released[1]["used"] == 9
+
+        # A hold nobody settles (a crashed worker) lapses after its TTL
+        monkeypatch.setattr(settings, "QUOTA_RESERVATION_TTL_SECONDS", 1)
+        await service.release_reservation(released[0])
+        assert (await service.reserve(user_id, PlanType.FREE, db))[0] is not None
+        assert (await service.reserve(user_id, PlanType.FREE, db))[0] is None
+        await asyncio.sleep(1.1)
+        assert (await service.reserve(user_id, PlanType.FREE, db))[0] is not None
+    await service.stop()
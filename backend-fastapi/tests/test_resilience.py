@@ -0,0 +1,178 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.core.exceptions import ExternalServiceError
+from app.services.resilience import AdaptiveLimiter, CircuitBreaker
+
+def _breaker(**overrides) -> CircuitBreaker:
+    options = dict(
+        window_size=4,
+        min_calls=2,
+        failure_rate_threshold=0.5,
+        slow_call_seconds=10.0,
+        open_seconds=0.0,
+        half_open_max_calls=1
+    )
+    options.update(overrides)
+    return CircuitBreaker("test", **options)
+
+def _limiter(**overrides) -> AdaptiveLimiter:
+    options = dict(initial_limit=2, min_limit=1, max_limit=2, latency_target=1.0, backoff_ratio=0.5)
+    options.update(overrides)
+    return AdaptiveLimiter(**options)
+
+def test_breaker_ignores_calls_admitted_while_closed():
+    breaker = _breaker()
+    straggler = breaker.before_call()
+    assert straggler is None
+
+    breaker.record(False, 0.1)
+    breaker.record(False, 0.1)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    probe = breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # The call admitted while closed finishes during the probe
+    breaker.record(True, 0.1, straggler)
+    breaker.record_cancelled(straggler)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker._half_open_calls == 1
+    with pytest.raises(ExternalServiceError):
+        breaker.before_call()
+
+    breaker.record(True, 0.1, probe)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_breaker_ignores_probes_from_an_earlier_round():
+    breaker = _breaker()
+    breaker.record(False, 0.1)
+    breaker.record(False, 0.1)
+    old_probe = breaker.before_call()
+    breaker.record(False, 0.1, old_probe)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    breaker.before_call()
+    breaker.record_cancelled(old_probe)
+    assert breaker._half_open_calls == 1
+
+async def test_limiter_queues_calls_beyond_the_limit():
+    limiter = _limiter()
+    assert await limiter.acquire(1.0)
+    assert await limiter.acquire(1.0)
+
+    waiting = asyncio.create_task(limiter.acquire(1.0))
+    await asyncio.sleep(0)
+    assert not waiting.done()
+
+    limiter.release(True, 0.1, time.monotonic())
+    assert await waiting
+    assert limiter.in_flight == 2
+    assert limiter.rejected == 0
+
+async def test_limiter_rejects_after_the_queue_timeout():
+    limiter = _limiter(initial_limit=1, max_limit=1)
+    assert await limiter.acquire(1.0)
+    assert not await limiter.acquire(0.01)
+    assert limiter.rejected == 1
+    assert limiter.status()["waiting"] == 0
+
+async def test_cancelled_waiter_does_not_leak_a_slot():
+    limiter = _limiter(initial_limit=1, max_limit=1)
+    assert await limiter.acquire(1.0)
+    waiting = asyncio.create_task(limiter.acquire(1.0))
+    await asyncio.sleep(0)
+    waiting.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiting
+
+    limiter.release_cancelled()
+    assert limiter.in_flight == 0
+    assert await limiter.acquire(0.01)
+
+def test_burst_of_failures_shrinks_the_limit_once():
+    limiter = _limiter(initial_limit=20, max_limit=20)
+    started = time.monotonic()
+    limiter.in_flight = 10
+    for _ in range(10):
+        limiter.release(False, 5.0, started)
+    assert limiter.limit == 10
+
+    # A call started after the decrease can shrink it again
+    limiter.in_flight = 1
+    limiter.release(False, 5.0, time.monotonic())
+    assert limiter.limit == 5
+
+@pytest.mark.parametrize("provider", ["openai", "claude"])
+async def test_sdk_errors_are_not_retried_by_the_client(provider, stub_llm, ai_service_for):
+    server = stub_llm(latency_ms=10, latency_sigma=0, error_rate=1.0, error_statuses=[429])
+    service = ai_service_for(server)
+
+    started = time.monotonic()
+    with pytest.raises(ExternalServiceError):
+        await service.ask_ai("hello", provider=provider, use_cache=False)
+
+    assert server.stats()["requests"] == 1
+    assert time.monotonic() - started < 1
+    await service.shutdown()
+
+async def test_open_breaker_answers_503_with_retry_after(api_client, stub_llm, app_ai_service):
+    from conftest import auth_headers
+
+    server = stub_llm(latency_ms=10, latency_sigma=0, error_rate=1.0, error_statuses=[500])
+    app_ai_service(server, AI_BREAKER_WINDOW_SIZE=2, AI_BREAKER_MIN_CALLS=2, AI_BREAKER_OPEN_SECONDS=30)
+    ask = {"prompt": "hello", "provider": "openai", "use_cache": False}
+
+    for _ in range(2):
+        response = await api_client.post("/api/ask/", json=ask, headers=auth_headers("breaker"))
+        assert response.status_code == 503
+
+    # Every provider behind the stub has now tripped, so the next ask fails fast
+    reached = server.stats()["requests"]
+    response = await api_client.post("/api/ask/", json=ask, headers=auth_headers("breaker"))
+    assert response.status_code == 503
+    assert 0 < int(response.headers["Retry-After"]) <= 30
+    assert server.stats()["requests"] == reached
+
+async def test_half_open_probe_closes_the_breaker_once_the_provider_recovers(stub_llm, ai_service_for):
+    server = stub_llm(latency_ms=10, latency_sigma=0, error_rate=1.0, error_statuses=[503])
+    service = ai_service_for(server, AI_BREAKER_WINDOW_SIZE=2, AI_BREAKER_MIN_CALLS=2, AI_BREAKER_OPEN_SECONDS=0.2)
+    breaker = service.breakers["openai"]
+
+    for _ in range(2):
+        with pytest.raises(ExternalServiceError):
+            await service.ask_ai("hello", provider="openai", use_cache=False)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    server.config.error_rate = 0.0
+    await asyncio.sleep(0.25)
+    result = await service.ask_ai("hello", provider="openai", use_cache=False)
+
+    assert result["provider"] == "openai"
+    assert breaker.state == CircuitBreaker.CLOSED
+    await service.shutdown()
+
+async def test_429_storm_shrinks_the_concurrency_limit(stub_llm, ai_service_for):
+    server = stub_llm(latency_ms=50, latency_sigma=0, error_rate=1.0, error_statuses=[429])
+    service = ai_service_for(server, AI_PROVIDER_MAX_CONCURRENCY=20, AI_BREAKER_MIN_CALLS=1000)
+    limiter = service.limiters["openai"]
+
+    async def wave():
+        await asyncio.gather(*(
+            service.ask_ai(f"q{i}", provider="openai", use_cache=False) for i in range(20)
+        ), return_exceptions=True)
+
+    await wave()
+    # Concurrent failures from one window shrink the limit once
+    assert limiter.limit == pytest.approx(20 * settings.AI_LIMITER_BACKOFF_RATIO)
+    await wave()
+    assert limiter.limit < 20 * settings.AI_LIMITER_BACKOFF_RATIO
+
+    server.config.error_rate = 0.0
+    shrunk = limiter.limit
+    await wave()
+    assert limiter.limit > shrunk
+    await service.shutdown()
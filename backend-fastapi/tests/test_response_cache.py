@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+
+from conftest import auth_headers
+from app.core.database import async_session_factory, AiMessage
+from app.services import ai_service as ai_service_module
+from app.services import response_cache as response_cache_module
+from app.services.response_cache import MemoryResponseCache, RedisResponseCache, ResponseCache
+
+ANSWER = {"response": "42", "provider": "openai", "model": "gpt-3.5-turbo", "tokens_used": 7}
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    cache = MemoryResponseCache(max_entries=100, ttl=60, max_bytes=1024 * 1024)
+    monkeypatch.setattr(ai_service_module, "response_cache", cache)
+    return cache
+
+@pytest.mark.parametrize("changed", [
+    {"provider": "claude"},
+    {"model": "gpt-4"},
+    {"full_prompt": "another question"},
+    {"screen_context": "blob-2"},
+    {"history": [{"role": "user", "content": "earlier"}]}
+])
+def test_every_input_of_the_answer_is_part_of_the_key(changed):
+    base = {"provider": "openai", "model": None, "full_prompt": "question", "screen_context": "blob-1", "history": []}
+
+    assert ResponseCache.make_key(**base) == ResponseCache.make_key(**dict(base))
+    assert ResponseCache.make_key(**base) != ResponseCache.make_key(**{**base, **changed})
+
+async def test_memory_entries_expire_and_respect_the_budget():
+    cache = MemoryResponseCache(max_entries=10, ttl=1, max_bytes=10)
+
+    await cache.set("small", ANSWER)
+    await cache.set("large", {**ANSWER, "response": "x" * 11})
+    assert await cache.get("small") == ANSWER
+    assert await cache.get("large") is None
+
+    await asyncio.sleep(1.1)
+    assert await cache.get("small") is None
+
+async def test_redis_backend_round_trips_with_a_ttl(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    redis = fakeredis.FakeAsyncRedis()
+    monkeypatch.setattr(response_cache_module.aioredis, "from_url", lambda url: redis)
+    cache = RedisResponseCache("redis://fake", ttl=30)
+
+    assert await cache.get("key") is None
+    await cache.set("key", ANSWER)
+
+    assert await cache.get("key") == ANSWER
+    assert 0 < await redis.ttl("ai-response:key") <= 30
+    assert cache.stats() == {"backend": "redis", "hits": 1, "misses": 1, "errors": 0}
+
+    # An unreachable Redis is a miss, not a failed ask
+    async def unavailable(*args, **kwargs):
+        raise ConnectionError("down")
+
+    monkeypatch.setattr(redis, "get", unavailable)
+    assert await cache.get("key") is None
+    assert cache.stats()["errors"] == 1
+    await cache.close()
+
+async def test_repeated_asks_are_served_from_the_cache(stub_llm, ai_service_for, fresh_cache):
+    server = stub_llm(latency_ms=1, latency_sigma=0, response_tokens=5)
+    service = ai_service_for(server)
+
+    first = await service.ask_ai("hello", provider="openai")
+    second = await service.ask_ai("hello", provider="openai")
+
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert second["response"] == first["response"]
+    assert second["tokens_used"] == 0
+    assert server.stats()["requests"] == 1
+
+    # A different conversation, a different capture, or opting out all go to the provider
+    await service.ask_ai("hello", provider="openai", history=[{"role": "user", "content": "hi"}])
+    await service.ask_ai("hello", provider="openai", screen_context_ref="blob-1")
+    opted_out = await service.ask_ai("hello", provider="openai", use_cache=False)
+    assert opted_out["cached"] is False
+    assert server.stats()["requests"] == 4
+
+async def test_cache_hits_are_still_saved_as_messages(api_client, stub_llm, app_ai_service, fresh_cache):
+    server = stub_llm(latency_ms=1, latency_sigma=0, response_tokens=5)
+    app_ai_service(server)
+    headers = auth_headers("repeater")
+
+    first = (await api_client.post("/api/ask/", headers=headers, json={"prompt": "hi", "provider": "openai"})).json()
+    second = (await api_client.post("/api/ask/", headers=headers, json={"prompt": "hi", "provider": "openai"})).json()
+
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert server.stats()["requests"] == 1
+    async with async_session_factory() as db:
+        messages = (await db.execute(
+            select(AiMessage).where(AiMessage.id.in_([first["message_id"], second["message_id"]]))
+        )).scalars().all()
+    assert sorted(message.tokens_used for message in messages) == [0, first["tokens_used"]]
@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.devtools.stub_llm import StubConfig, create_app
+
+ENDPOINTS = {
+    "openai": ("/v1/chat/completions", {"model": "gpt-3.5-turbo", "messages": [{"role": "user", "content": "hi"}]}),
+    "claude": ("/v1/messages", {"model": "claude-3-sonnet-20240229", "max_tokens": 10, "messages": [{"role": "user", "content": "hi"}]}),
+    "gemini": ("/v1beta/models/gemini-pro:generateContent", {"contents": [{"parts": [{"text": "hi"}]}]})
+}
+
+def _client(**config) -> httpx.AsyncClient:
+    app = create_app(StubConfig(**{"latency_ms": 1, "latency_sigma": 0, "tokens_per_second": 0, **config}))
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://stub")
+
+async def test_error_rate_fails_about_that_fraction_of_requests():
+    async with _client(error_rate=0.3, seed=7) as client:
+        path, payload = ENDPOINTS["openai"]
+        responses = await asyncio.gather(*(client.post(path, json=payload) for _ in range(200)))
+        stats = (await client.get("/__stub/stats")).json()
+
+    failed = sum(response.status_code != 200 for response in responses)
+    assert stats["requests"] == 200
+    assert stats["errors"] == failed
+    assert 40 <= failed <= 80
+
+async def test_error_rate_is_reproducible_with_a_seed():
+    async def statuses():
+        async with _client(error_rate=0.5, seed=11) as client:
+            path, payload = ENDPOINTS["openai"]
+            return [(await client.post(path, json=payload)).status_code for _ in range(20)]
+
+    assert await statuses() == await statuses()
+
+@pytest.mark.parametrize("provider", sorted(ENDPOINTS))
+async def test_error_statuses_pick_the_failure_code(provider):
+    path, payload = ENDPOINTS[provider]
+    async with _client(error_rate=1.0, error_statuses=[503]) as client:
+        response = await client.post(path, json=payload)
+        assert response.status_code == 503
+        assert "Retry-After" not in response.headers
+
+    async with _client(error_rate=1.0, error_statuses=[429]) as client:
+        response = await client.post(path, json=payload)
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+
+async def test_stall_holds_the_response_for_stall_seconds():
+    path, payload = ENDPOINTS["openai"]
+    async with _client(stall_rate=1.0, stall_seconds=0.5, response_tokens=5) as client:
+        started = time.monotonic()
+        response = await client.post(path, json=payload)
+        elapsed = time.monotonic() - started
+        stats = (await client.get("/__stub/stats")).json()
+
+    assert response.status_code == 200
+    assert elapsed >= 0.5
+    assert stats["stalls"] == 1
+
+async def test_stalled_stream_trips_a_client_read_timeout(stub_llm):
+    server = stub_llm(latency_ms=1, latency_sigma=0, stall_rate=1.0, stall_seconds=5, response_tokens=20)
+    path, payload = ENDPOINTS["openai"]
+
+    async with httpx.AsyncClient(base_url=server.url, timeout=httpx.Timeout(5, read=0.3)) as client:
+        started = time.monotonic()
+        with pytest.raises(httpx.ReadTimeout):
+            async with client.stream("POST", path, json={**payload, "stream": True}) as response:
+                async for _ in response.aiter_bytes():
+                    pass
+    assert time.monotonic() - started < 2
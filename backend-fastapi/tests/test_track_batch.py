@@ -0,0 +1,52 @@
+from sqlalchemy import select
+
+from conftest import auth_headers
+from app.core.database import async_session_factory, UsageTracking
+
+def _event(client_event_id: str, **fields) -> dict:
+    return {"client_event_id": client_event_id, "action_type": "screenshot", "resource_used": "capture", **fields}
+
+async def _rows(action_type: str = "screenshot") -> list:
+    async with async_session_factory() as db:
+        return (await db.execute(
+            select(UsageTracking).where(UsageTracking.action_type == action_type)
+        )).scalars().all()
+
+async def test_a_resubmitted_batch_is_not_recorded_twice(api_client):
+    headers = auth_headers("retrier")
+    batch = {"items": [_event("a"), _event("b"), _event("c")]}
+
+    first = await api_client.post("/api/track/batch", headers=headers, json=batch)
+    again = await api_client.post("/api/track/batch", headers=headers, json=batch)
+
+    assert first.json()["data"] == {"received": 3, "inserted": 3, "duplicates": 0}
+    assert again.json()["data"] == {"received": 3, "inserted": 0, "duplicates": 3}
+    assert sorted(row.client_event_id for row in await _rows()) == ["a", "b", "c"]
+
+async def test_a_repeated_id_within_a_batch_keeps_the_first_event(api_client):
+    response = await api_client.post("/api/track/batch", headers=auth_headers("doubler"), json={"items": [
+        _event("same", quantity=1), _event("other"), _event("same", quantity=5)
+    ]})
+
+    assert response.json()["data"] == {"received": 3, "inserted": 2, "duplicates": 1}
+    same = [row for row in await _rows() if row.client_event_id == "same"]
+    assert [row.quantity for row in same] == [1]
+
+async def test_event_ids_are_scoped_to_the_user(api_client):
+    batch = {"items": [_event("shared")]}
+
+    for name in ("first-user", "second-user"):
+        response = await api_client.post("/api/track/batch", headers=auth_headers(name), json=batch)
+        assert response.json()["data"]["inserted"] == 1
+
+async def test_events_without_an_id_are_always_inserted(api_client):
+    headers = auth_headers("plain")
+    event = {"action_type": "screenshot", "resource_used": "capture"}
+
+    for _ in range(3):
+        assert (await api_client.post("/api/track/", headers=headers, json=event)).status_code == 200
+    batched = await api_client.post("/api/track/batch", headers=headers, json={"items": [_event("a")]})
+
+    assert batched.json()["data"]["inserted"] == 1
+    rows = await _rows()
+    assert sorted(row.client_event_id or "" for row in rows) == ["", "", "", "a"]
@@ -0,0 +1,22 @@
+import uuid
+from datetime import datetime
+
+from app.core.database import async_session_factory, User, UsageTracking
+from app.core.migrations import ensure_usage_rollup
+from app.services.usage_service import UsageService
+
+async def test_empty_rollup_is_backfilled_at_startup(db_tables):
+    user_id = str(uuid.uuid4())
+    now = datetime.utcnow()
+    async with async_session_factory() as db:
+        db.add(User(id=user_id, neon_user_id=f"neon-{user_id}", email=f"{user_id}@example.com"))
+        for _ in range(3):
+            db.add(UsageTracking(user_id=user_id, action_type="ask", quantity=10, month=now.month, year=now.year))
+        await db.commit()
+
+    assert await ensure_usage_rollup() == 1
+    # Already populated; later startups leave it alone
+    assert await ensure_usage_rollup() == 0
+
+    async with async_session_factory() as db:
+        assert await UsageService()._count_usage(user_id, "ask", now.year, now.month, db) == 3
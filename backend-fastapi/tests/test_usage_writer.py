@@ -0,0 +1,42 @@
+import uuid
+
+from sqlalchemy import select, func
+
+from app.core.database import async_session_factory, User, UsageTracking
+from app.services.usage_service import UsageService
+
+async def _make_user() -> str:
+    user_id = str(uuid.uuid4())
+    async with async_session_factory() as db:
+        db.add(User(id=user_id, neon_user_id=f"neon-{user_id}", email=f"{user_id}@example.com"))
+        await db.commit()
+    return user_id
+
+async def _count_rows(user_id: str) -> int:
+    async with async_session_factory() as db:
+        result = await db.execute(
+            select(func.count(UsageTracking.id)).where(UsageTracking.user_id == user_id)
+        )
+        return result.scalar()
+
+async def test_rejected_row_does_not_block_later_flushes(db_tables):
+    service = UsageService()
+    user_id = await _make_user()
+    service.writer.start()
+
+    async with async_session_factory() as db:
+        await service.track_usage(user_id, "click", quantity=1, db=db)
+        # Too large for an INTEGER column; the database rejects this row
+        await service.track_usage(user_id, "click", quantity=10 ** 20, db=db)
+        await service.track_usage(user_id, "click", quantity=1, db=db)
+    await service.writer.flush()
+
+    async with async_session_factory() as db:
+        await service.track_usage(user_id, "click", quantity=1, db=db)
+    await service.stop()
+
+    stats = service.writer.stats()
+    assert stats["dropped"] == 1
+    assert stats["pending"] == 0
+    assert stats["written"] == 3
+    assert await _count_rows(user_id) == 3